@@ -0,0 +1,81 @@
+import os
+import json
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+from metrics import metrics
+
+
+class CachedProApi:
+    """
+    给 tushare pro_api 套一层磁盘缓存 (SQLite 文件，重启后依然有效)
+    - 只缓存 ttls 里列出的慢变参考数据接口，其余接口原样透传
+    - 每个接口单独的过期时间 (秒)
+    - 条目数超过 max_entries 时按最近访问时间淘汰 (LRU)
+    - 空结果和异常不缓存，避免把一次失败固化下来
+    """
+
+    def __init__(self, pro, path='/app/data/api_cache.db', ttls=None, max_entries=500):
+        self.pro = pro
+        self.path = path
+        self.ttls = ttls or {}
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS api_cache ("
+                "key TEXT PRIMARY KEY, endpoint TEXT, created REAL, accessed REAL, payload BLOB)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def _key(endpoint, args, kwargs):
+        raw = json.dumps([endpoint, list(args), sorted(kwargs.items())], default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def __getattr__(self, name):
+        attr = getattr(self.pro, name)
+        if name not in self.ttls:
+            return attr
+
+        def cached(*args, **kwargs):
+            return self._call(name, attr, args, kwargs)
+        return cached
+
+    def _call(self, endpoint, func, args, kwargs):
+        key = self._key(endpoint, args, kwargs)
+        now = time.time()
+        with self.lock, self._connect() as conn:
+            row = conn.execute("SELECT created, payload FROM api_cache WHERE key=?", (key,)).fetchone()
+            if row and now - row[0] < self.ttls[endpoint]:
+                conn.execute("UPDATE api_cache SET accessed=? WHERE key=?", (now, key))
+                metrics.count('quant_api_cache_hits_total', endpoint=endpoint)
+                return pickle.loads(row[1])
+
+        result = func(*args, **kwargs)
+        if result is None or getattr(result, 'empty', False):
+            return result
+
+        with self.lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO api_cache (key, endpoint, created, accessed, payload) VALUES (?, ?, ?, ?, ?)",
+                (key, endpoint, now, now, pickle.dumps(result)),
+            )
+            conn.execute(
+                "DELETE FROM api_cache WHERE key IN ("
+                "SELECT key FROM api_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        return result
+
+    def clear(self, endpoint=None):
+        with self.lock, self._connect() as conn:
+            if endpoint:
+                conn.execute("DELETE FROM api_cache WHERE endpoint=?", (endpoint,))
+            else:
+                conn.execute("DELETE FROM api_cache")
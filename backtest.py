@@ -0,0 +1,205 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from config import Config
+from screens import compute_signals, strategy_params
+from sectors import sector_returns, sector_momentum
+
+
+class Backtester:
+    """
+    突破模型 (箱体突破 + 放量 + RS + 资金流) 的向量化历史回测
+    在 日期×股票 矩阵上一次算出区间内每一天的入选信号，不逐日回放 run_daily_scan。
+
+    交易规则:
+        T 日收盘出信号 -> T+1 开盘买入
+        -> 持有 hold_days 个交易日后按收盘价卖出
+        -> 期间收盘触及止损 / 止盈则提前按当日收盘卖出
+    """
+
+    def __init__(self, data_manager):
+        self.dm = data_manager
+
+    def load(self, start_date, end_date, lookback=None):
+        """
+        读取回测区间的矩阵，并向前多取 lookback 根K线作为箱体/均量的预热期
+        返回 (panels, 基准收盘价序列, 每只股票的行业)
+        """
+        lookback = lookback or Config.BOX_DAYS + Config.VOL_MA_DAYS
+        warmup = (pd.to_datetime(start_date) - timedelta(days=lookback * 2)).strftime('%Y%m%d')
+        panels = self.dm.load_panels_between(warmup, end_date)
+        dates = panels['close'].index
+        codes = panels['close'].columns
+        panels = {f: p.reindex(index=dates, columns=codes) for f, p in panels.items()}
+        benchmark = self.dm.get_benchmark_close(warmup, end_date).reindex(dates)
+
+        # 与实盘扫描相同的申万一级行业映射；本地还没有时退回 stock_basic 的行业字段
+        industries = None
+        labels = self.dm.industries.labels('index_code')
+        df_basic = self.dm.get_stock_basics()
+        if not labels.empty:
+            industries = labels.reindex(codes)
+        elif not df_basic.empty and 'industry' in df_basic.columns:
+            industries = df_basic.set_index('ts_code')['industry'].reindex(codes)
+        return panels, benchmark, industries
+
+    def run(self, start_date, end_date, hold_days=5, stop_loss=None, take_profit=None, params=None):
+        panels, benchmark, industries = self.load(start_date, end_date)
+        return evaluate(panels, benchmark, industries, start_date, end_date,
+                        params, hold_days, stop_loss, take_profit)
+
+
+def evaluate(panels, benchmark_close, industries, start_date, end_date, params=None,
+             hold_days=5, stop_loss=None, take_profit=None, sector_mask=None):
+    """
+    一组参数下的完整回测: 信号矩阵 -> 行业过滤 -> 交易模拟
+    sector_mask: 预先算好的规则3 掩码 (见 sector_mask)，参数扫描时多组参数共用；缺省按 industries 现算
+    """
+    p = params or strategy_params()
+    close = panels['close']
+    if close.empty:
+        return {'trades': 0}, pd.DataFrame()
+
+    benchmark_ret = benchmark_close.pct_change(p['VOL_MA_DAYS'] - 1)
+    sig = compute_signals(close, panels['high'], panels['vol'], panels['net_mf_amount'], benchmark_ret, p)['signal']
+    if sector_mask is None and industries is not None:
+        sector_mask = industry_mask(panels, industries, p)
+    if sector_mask is not None:
+        sig &= sector_mask
+    sig.loc[(close.index < start_date) | (close.index > end_date)] = False
+
+    return simulate(sig.to_numpy(), panels['open'].to_numpy(), close.to_numpy(),
+                    close.index, close.columns, hold_days, stop_loss, take_profit)
+
+
+def sector_mask_key(p):
+    """规则3 掩码只取决于这几个参数，参数扫描时按它去重"""
+    return p['SECTOR_TOP_PCT'], p['SECTOR_WEIGHT'], p['SECTOR_MOMENTUM_DAYS']
+
+
+def industry_mask(panels, industries, p):
+    """按参数 p 的行业口径算 日期×股票 的规则3 掩码"""
+    amount = panels.get('amount') if p['SECTOR_WEIGHT'] == 'amount' else None
+    return industry_top_mask(panels['pct_chg'], industries, p['SECTOR_TOP_PCT'],
+                             amount=amount, days=p['SECTOR_MOMENTUM_DAYS'])
+
+
+def industry_top_mask(pct_chg, industries, top_pct, min_codes=50, amount=None, days=1):
+    """
+    规则3: 每天按行业强度 (与实盘同一套 sectors.sector_returns 计算) 排名，只保留前 top_pct 的行业里的股票
+    与实盘一致，入选行业的股票不足 min_codes 只时当天不做行业过滤
+    """
+    labels = pd.Series(industries).reindex(pct_chg.columns)
+    sector_ret = sector_momentum(sector_returns(pct_chg, labels, amount), days)
+    top_n = int(sector_ret.shape[1] * top_pct)
+    rank = sector_ret.rank(axis=1, ascending=False, method='first')
+    top = (rank <= top_n).reindex(columns=labels.to_numpy(), fill_value=False)
+    top = pd.DataFrame(top.to_numpy(), index=pct_chg.index, columns=pct_chg.columns)
+    too_few = top.sum(axis=1) < min_codes
+    top.loc[too_few] = True
+    return top
+
+
+def simulate(signal, open_, close, dates, codes, hold_days=5, stop_loss=None, take_profit=None):
+    """
+    把信号矩阵转成逐笔交易和组合净值 (全部为数组运算)
+    返回 (report dict, trades DataFrame)
+    """
+    n_dates = len(dates)
+    t, i = np.nonzero(signal)
+    # 需要有完整的持有期，且次日有开盘价 (停牌则放弃)
+    keep = t + hold_days < n_dates
+    t, i = t[keep], i[keep]
+    entry = open_[t + 1, i]
+    keep = ~np.isnan(entry) & (entry > 0)
+    t, i, entry = t[keep], i[keep], entry[keep]
+
+    if len(t) == 0:
+        return {'trades': 0}, pd.DataFrame()
+
+    # 每笔交易持有期内的收盘价路径 [交易数, hold_days]，停牌日沿用上一收盘
+    offsets = np.arange(1, hold_days + 1)
+    path = close[t[:, None] + offsets, i[:, None]]
+    path = pd.DataFrame(path).ffill(axis=1).to_numpy()
+    path = np.where(np.isnan(path), entry[:, None], path)
+    path_ret = path / entry[:, None] - 1
+
+    # 第一次触及止损/止盈的那天离场，否则持有到期
+    hit = np.zeros_like(path_ret, dtype=bool)
+    if stop_loss is not None:
+        hit |= path_ret <= -abs(stop_loss)
+    if take_profit is not None:
+        hit |= path_ret >= take_profit
+    hit[:, -1] = True
+    exit_k = hit.argmax(axis=1)
+    ret = path_ret[np.arange(len(t)), exit_k]
+
+    trades = pd.DataFrame({
+        'signal_date': np.asarray(dates)[t],
+        'entry_date': np.asarray(dates)[t + 1],
+        'exit_date': np.asarray(dates)[t + 1 + exit_k],
+        'ts_code': np.asarray(codes)[i],
+        'entry': entry,
+        'exit': path[np.arange(len(t)), exit_k],
+        'ret': ret,
+    })
+
+    # 组合净值: 每天对持仓中的交易等权，当日收益 = 各持仓当日涨幅的均值
+    prev = np.hstack([entry[:, None], path[:, :-1]])
+    daily_ret = path / prev - 1
+    alive = np.arange(hold_days)[None, :] <= exit_k[:, None]
+    day_idx = (t + 1)[:, None] + np.arange(hold_days)[None, :]
+    ret_sum = np.zeros(n_dates)
+    pos_cnt = np.zeros(n_dates)
+    np.add.at(ret_sum, day_idx[alive], daily_ret[alive])
+    np.add.at(pos_cnt, day_idx[alive], 1)
+    port_ret = np.divide(ret_sum, pos_cnt, out=np.zeros(n_dates), where=pos_cnt > 0)
+    first = t.min() + 1
+    equity = np.cumprod(1 + port_ret[first:])
+    drawdown = 1 - equity / np.maximum.accumulate(equity)
+
+    report = {
+        'trades': len(trades),
+        'hit_rate': float((ret > 0).mean()),
+        'avg_return': float(ret.mean()),
+        'median_return': float(np.median(ret)),
+        'best': float(ret.max()),
+        'worst': float(ret.min()),
+        'total_return': float(equity[-1] - 1),
+        'max_drawdown': float(drawdown.max()),
+        'signal_days': int(len(np.unique(t))),
+    }
+    return report, trades
+
+
+def format_report(report, start_date, end_date, hold_days):
+    if not report.get('trades'):
+        return f"📉 回测 {start_date} -> {end_date}: 区间内没有触发信号"
+    return (
+        f"📈 **突破模型回测** ({start_date} -> {end_date})\n"
+        f"持有 {hold_days} 天 | 次日开盘买入\n"
+        f"------------------\n"
+        f"交易笔数: `{report['trades']}` (信号日 {report['signal_days']} 天)\n"
+        f"胜率: `{report['hit_rate']:.1%}`\n"
+        f"平均收益: `{report['avg_return']:.2%}` (中位数 {report['median_return']:.2%})\n"
+        f"最好/最差: `{report['best']:.2%}` / `{report['worst']:.2%}`\n"
+        f"组合累计收益: `{report['total_return']:.2%}`\n"
+        f"最大回撤: `{report['max_drawdown']:.2%}`"
+    )
+
+
+if __name__ == "__main__":
+    # 用法: python backtest.py 20240101 20241231 [持有天数] [止损] [止盈]
+    from data_manager import DataManager
+
+    start, end = sys.argv[1], sys.argv[2]
+    hold = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    sl = float(sys.argv[4]) if len(sys.argv) > 4 else None
+    tp = float(sys.argv[5]) if len(sys.argv) > 5 else None
+
+    t0 = time.time()
+    report, trades = Backtester(DataManager()).run(start, end, hold, sl, tp)
+    print(format_report(report, start, end, hold))
+    print(f"⏱️ 耗时 {time.time() - t0:.2f}s")
@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+from db_manager import DBManager
+from data_manager import DataManager
+from downloader import Downloader
+from strategy import StrategyAnalyzer
+from monitor import BreakoutMonitor
+from fake_tushare import SyntheticMarket, FakeProApi
+
+RESULTS_FILE = 'bench_results.jsonl'
+
+
+def git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def timed(fn, repeat=1):
+    """运行 repeat 次，返回 (最后一次的返回值, 各次耗时秒数)"""
+    times, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return result, times
+
+
+def run_benchmarks(n_codes=5000, n_days=500, seed=0, latency=0.0, error_rate=0.0,
+                   calls_per_min=1_000_000, repeat=3, workdir=None):
+    """
+    在临时目录里用合成行情 + 离线 Tushare 替身跑一遍端到端计时
+    返回 {阶段: {'min', 'median', 'runs'}} 以及行数/调用次数等上下文
+    """
+    owns_dir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='quant-bench-')
+    timings = {}
+
+    def record(name, times):
+        timings[name] = {'min': min(times), 'median': statistics.median(times), 'runs': len(times)}
+        print(f"⏱️ {name:<28} min {min(times):8.3f}s  median {statistics.median(times):8.3f}s")
+
+    try:
+        print(f"🧪 生成合成行情: {n_codes} 只 × {n_days} 天...")
+        market, t = timed(lambda: SyntheticMarket(n_codes, n_days, seed=seed))
+        record('generate_market', t)
+
+        # 随机失败只注入到走重试的行情接口，参考数据接口失败会直接中断扫描
+        errors = {'daily': error_rate, 'moneyflow': error_rate}
+        pro = FakeProApi(market, latency=latency, error_rate=errors, seed=seed)
+        db = DBManager(os.path.join(workdir, 'quant.db'))
+        dm = DataManager(pro=pro, db=db)
+        # 基准测量的是本地代码，默认不受积分配额限速 (可用 --calls-per-min 模拟)
+        dm.downloader = Downloader(dm.pro, calls_per_min=calls_per_min, base_delay=0.01, max_delay=0.1)
+        strategy = StrategyAnalyzer(dm)
+
+        # 1. 数据同步: 空库全量 + 已是最新时的空跑
+        lookback = int(n_days * 1.4)
+        (success, fail, _), t = timed(lambda: dm.sync_data(lookback_days=lookback))
+        record('sync_data.cold', t)
+        _, t = timed(lambda: dm.sync_data(lookback_days=lookback), repeat)
+        record('sync_data.noop', t)
+
+        # 2. 数据库读取
+        latest = db.check_latest_date('daily_price')
+        window_start = market.dates[max(0, len(market.dates) - 75)]
+        _, t = timed(lambda: db.get_data('daily_price'), repeat)
+        record('get_data.daily_full', t)
+        _, t = timed(lambda: db.get_data('daily_price', start_date=window_start), repeat)
+        record('get_data.daily_window', t)
+        _, t = timed(lambda: db.get_data('money_flow', start_date=window_start), repeat)
+        record('get_data.flow_window', t)
+        _, t = timed(lambda: db.get_data('daily_price', codes=market.codes[:50]), repeat)
+        record('get_data.daily_50_codes', t)
+        flow, t = timed(lambda: db.get_data('money_flow', start_date=window_start), 1)
+        flow_compact, t = timed(lambda: db.get_data('money_flow', start_date=window_start,
+                                                    columns=['net_mf_amount'], compact=True), repeat)
+        record('get_data.flow_window_compact', t)
+
+        # 3. 选股扫描: 不走缓存的完整计算 + 命中缓存
+        results, t = timed(lambda: strategy.run_daily_scan(use_cache=False), repeat)
+        record('run_daily_scan', t)
+        _, t = timed(lambda: strategy.run_daily_scan(), repeat)
+        record('run_daily_scan.cached', t)
+        _, t = timed(lambda: strategy.run_screens(use_cache=False), repeat)
+        record('run_screens.all', t)
+
+        # 4. 盘中监控: 最后一天的收盘价当作 tick，全市场逐只对照触发价位 (重复 20 轮)
+        last = market.daily[market.daily['trade_date'] == latest]
+        ticks = list(zip(last['ts_code'], last['close'], last['vol'])) * 20
+        monitor = BreakoutMonitor.load(db)
+        _, t = timed(lambda: [monitor.on_tick(*tick) for tick in ticks], repeat)
+        record('monitor.ticks', t)
+
+        return {
+            'timings': timings,
+            'context': {
+                'rows_daily': market.rows,
+                'synced_days': success,
+                'failed_days': fail,
+                'latest_date': latest,
+                'picks': len(results),
+                'monitor_ticks': len(ticks),
+                'api_calls': dict(pro.calls),
+                'db_bytes': os.path.getsize(db.db_path),
+                'flow_window_mb': round(flow.memory_usage(deep=True).sum() / 2**20, 1),
+                'flow_window_compact_mb': round(flow_compact.memory_usage(deep=True).sum() / 2**20, 1),
+            },
+        }
+    finally:
+        if owns_dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(current, previous):
+    """与上一次同规模的结果逐项对比 (看 median)"""
+    print(f"\n📊 对比 {previous.get('revision')} ({previous['time']}) -> {current.get('revision')}")
+    for name, cur in current['timings'].items():
+        old = previous['timings'].get(name)
+        if not old:
+            print(f"   {name:<28} {cur['median']:8.3f}s  (新增)")
+            continue
+        change = (cur['median'] - old['median']) / old['median'] if old['median'] else 0.0
+        flag = '🔴' if change > 0.1 else ('🟢' if change < -0.1 else '⚪️')
+        print(f"{flag} {name:<28} {old['median']:8.3f}s -> {cur['median']:8.3f}s  ({change:+.1%})")
+
+
+if __name__ == "__main__":
+    # 用法: python bench.py [--codes 5000] [--days 500] [--latency 0.05] [--error-rate 0.02]
+    parser = argparse.ArgumentParser(description='离线性能基准 (合成行情 + Tushare 替身)')
+    parser.add_argument('--codes', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help='每次接口调用的模拟延迟 (秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='行情接口 (daily/moneyflow) 随机失败的概率')
+    parser.add_argument('--calls-per-min', type=int, default=1_000_000, help='下载限速 (默认不限)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=RESULTS_FILE, help='结果追加写入的 JSONL 文件')
+    args = parser.parse_args()
+
+    params = {'codes': args.codes, 'days': args.days, 'seed': args.seed, 'latency': args.latency,
+              'error_rate': args.error_rate, 'calls_per_min': args.calls_per_min}
+    report = run_benchmarks(args.codes, args.days, args.seed, args.latency, args.error_rate,
+                            args.calls_per_min, args.repeat)
+    record = {
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'params': params,
+        **report,
+    }
+
+    previous = [r for r in load_results(args.output) if r.get('params') == params]
+    if previous:
+        compare(record, previous[-1])
+    with open(args.output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    print(f"\n💾 结果已追加到 {args.output}")
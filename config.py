@@ -14,6 +14,85 @@ class Config:
     FLOW_DAYS = 3           # 资金连买天数 (规则4)
     SECTOR_TOP_PCT = 0.2    # 板块前 20% (规则3)
     RS_BENCHMARK = '000300.SH' # RS对比基准 (沪深300)
+    INDEX_CODES = [RS_BENCHMARK, '000001.SH', '399001.SZ', '399006.SZ', '000905.SH']  # 同步到本地的指数
+    RS_HORIZONS = (20, 60, 120)      # 相对强度的观察周期 (K线数)
+    RS_WEIGHTS = (0.5, 0.3, 0.2)     # 各周期百分位的权重 (近期为主)
+    RS_MIN_RANK = 0                  # 入选股票的 RS 全市场百分位下限 (0 = 不过滤，只按 RS 排序)
+    SECTOR_WEIGHT = 'equal'   # 行业涨幅加权方式: equal 等权 (与原 sw_daily 口径一致) / amount 成交额加权 (可选) (规则3)
+    SECTOR_MOMENTUM_DAYS = 1  # 行业强度按最近几日累计涨幅排名 (1 = 当日涨幅)
+    INDUSTRY_REFRESH_DAYS = 30  # 股票 -> 申万一级行业映射的刷新周期 (天)
+
+    # 其他选股模型 (见 screens.py，/scan pullback、/scan dryup)
+    PULLBACK_DAYS = 10        # 回踩箱体: 突破后多少根K线内有效
+    PULLBACK_TOLERANCE = 0.03 # 回踩箱体: 收盘价距原箱体上沿的幅度
+    DRYUP_DAYS = 5            # 缩量企稳: 观察天数
+    DRYUP_RATIO = 0.5         # 缩量企稳: 近期均量 / 此前均量 的上限
+    DRYUP_MAX_MOVE = 3.0      # 缩量企稳: 观察期内单日涨跌幅上限 (%)
+    DAILY_SCREENS = ['breakout', 'pullback', 'dryup']  # 每日报告包含的模型
+
+    # 数据下载
+    TUSHARE_CALLS_PER_MIN = int(os.getenv('TUSHARE_CALLS_PER_MIN', 200)) # 积分对应的每分钟调用上限
+    DOWNLOAD_WORKERS = 4    # 并发下载线程数
+    SYNC_SHORT_RATIO = 0.9  # 某天行数低于前后交易日中位数的 90% 视为不完整，需要补下载
+    SYNC_MAX_ATTEMPTS = 3   # 同一天最多自动补下载几轮 (每轮内部还有 3 次重试)
+
+    # 数据保留 (retention.py): 各表在 SQLite 里保留的交易日数，0 = 永久保留
+    # 行情表不会少于扫描 / RS 所需的窗口；回测只能覆盖保留窗口内的区间
+    HOT_DAYS = int(os.getenv('RETENTION_DAYS', 500))  # 行情表的热数据窗口 (约两年)
+    RETENTION_DAYS = {
+        'daily_price': HOT_DAYS,
+        'money_flow': HOT_DAYS,
+        'sync_ledger': HOT_DAYS,
+        'index_daily': 750,
+        'scan_cache': 20,
+    }
+    RETENTION_ARCHIVE = os.getenv('RETENTION_ARCHIVE', '1') == '1'  # 删除前按年归档到 archive/<表>/<年>.csv.gz
+    ARCHIVE_TABLES = ('daily_price', 'money_flow')  # 只归档行情表；扫描缓存 / 同步台账直接删除
+    MAINTENANCE_TIME = '03:00'  # 每天几点执行数据维护 (裁剪 + ANALYZE + 按需 VACUUM)
+    VACUUM_INTERVAL_DAYS = 7    # 最长多少天 VACUUM 一次
+    VACUUM_FREE_RATIO = 0.2     # 空闲页超过数据库的 20% 时提前 VACUUM
+
+    # 参考数据缓存 (接口名 -> 过期秒数)，这些数据最多每天变一次
+    API_CACHE_TTL = {
+        'index_classify': 7 * 86400,  # 申万行业分类
+        'index_member': 86400,        # 行业成分股
+        'sw_daily': 12 * 3600,        # 申万行业日线 (按 trade_date 缓存)
+        'index_daily': 6 * 3600,      # 基准指数日线 (按 end_date 缓存)
+    }
+    API_CACHE_MAX_ENTRIES = 500
+
+    # 盘中突破监控 (/monitor)
+    MONITOR_AUTO = os.getenv('MONITOR_AUTO', '0') == '1'  # 交易日 09:25 自动启动
+    MONITOR_FEED = os.getenv('MONITOR_FEED', '')  # 缺省轮询 tushare 实时行情；填 CSV 路径则回放文件
+    MONITOR_INTERVAL = 3    # 两轮全市场快照的间隔秒数
+    MONITOR_WORKERS = 8     # 并发拉取实时行情的线程数
+
+    # Telegram 推送 (notification.TelegramOutbox)
+    TG_MAX_LEN = 4096       # 单条消息长度上限，超过自动分页
+    TG_CHAT_PER_MIN = 60    # 私聊: 每个会话每分钟最多发送条数
+    TG_GROUP_PER_MIN = 20   # 群组 / 频道: 每个会话每分钟最多发送条数
+    TG_CHAT_BURST = 3       # 同一会话允许的短时突发条数
+    TG_GLOBAL_PER_MIN = 1800  # 整个机器人每分钟最多发送条数 (约 30 条/秒)
+    TG_SEND_WORKERS = 4     # 并行发送线程数 (同一会话仍按顺序逐条发送)
+    TG_MAX_RETRIES = 5      # 网络错误 / 5xx 的重试次数 (429 按 retry_after 等待，不计入)
+    TG_TIMEOUT = 10         # 单次请求超时秒数
+
+    # 后台任务
+    JOB_WORKERS = 2         # 同时执行的后台任务数 (同步/扫描之间仍会串行)
+
+    # 参数扫描 (python sweep.py)
+    # 缺省取本进程可用的 CPU (容器里 os.cpu_count() 报的是宿主机核数)，运行时再按可用内存封顶
+    SWEEP_PROCESSES = int(os.getenv('SWEEP_PROCESSES', 0)) or (
+        len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 2)
+    SWEEP_WORKER_PANELS = int(os.getenv('SWEEP_WORKER_PANELS', 12))  # 每个 worker 同时存在的 float64 日期×股票 中间矩阵个数
+    SWEEP_GRID = {
+        'BOX_DAYS': [40, 55, 70],
+        'BREAKOUT_THRESHOLD': [1.0, 1.01, 1.03],
+        'VOL_MA_DAYS': [10, 20],
+        'VOL_MULTIPLIER': [1.2, 1.5, 2.0],
+        'FLOW_DAYS': [2, 3, 5],
+        'SECTOR_TOP_PCT': [0.2, 0.3, 1.0],
+    }
     
     # 调试模式 (True时会打印更多日志)
     DEBUG = True
@@ -1,41 +1,58 @@
+import os
 import tushare as ts
 import pandas as pd
-import time
+from sqlalchemy import text
 from datetime import datetime, timedelta
 from config import Config
 from db_manager import DBManager
+from panel import pivot_panel
+from panel_store import PanelStore, FIELDS
+from downloader import Downloader
+from api_cache import CachedProApi
+from trade_calendar import TradeCalendar
+from indicator_state import IndicatorState
+from sync_ledger import SyncLedger
+from retention import Retention
+from sectors import IndustryMap, sector_strength
+from scan_cache import ScanCache
+from metrics import metrics, InstrumentedApi
+from monitor import build_trigger_levels, trigger_key
 
 class DataManager:
-    def __init__(self):
-        ts.set_token(Config.TUSHARE_TOKEN)
-        self.pro = ts.pro_api(timeout=120) 
-        self.db = DBManager()
+    def __init__(self, pro=None, db=None, store=None):
+        # pro / db / store 可注入替身，便于离线测试
+        if pro is None:
+            ts.set_token(Config.TUSHARE_TOKEN)
+            pro = ts.pro_api(timeout=120)
+        self.db = db or DBManager()
+        # 其余数据文件都放在数据库同目录 (/app/data)
+        data_dir = os.path.dirname(self.db.db_path)
+        self.store = store or PanelStore(os.path.join(data_dir, 'panel'))
+        # 慢变参考数据 (行业分类/成分股/指数日线) 走磁盘缓存，行情接口原样透传
+        # 真实网络调用在缓存层之下计时 (命中缓存的不算)
+        self.pro = CachedProApi(InstrumentedApi(pro), path=os.path.join(data_dir, 'api_cache.db'),
+                                ttls=Config.API_CACHE_TTL, max_entries=Config.API_CACHE_MAX_ENTRIES)
+        self.downloader = Downloader(self.pro)
+        self.calendar = TradeCalendar(self.db, self.pro)
+        self.indicators = IndicatorState(self.db)
+        self.ledger = SyncLedger(self.db, self.calendar)
+        self.industries = IndustryMap(self.db, self.pro)
+        self.scan_cache = ScanCache(self.db)
+        self.retention = Retention(self.db, self.store, os.path.join(data_dir, 'archive'))
 
     def get_trade_date(self):
         """
         获取最近一个【已收盘】的交易日
-        逻辑：如果当前时间 < 16:00，则强制使用上一个交易日
+        逻辑：如果当前时间 < 16:00，则强制使用上一个交易日 (读本地交易日历，不走网络)
         """
-        now = datetime.now()
-        today_str = now.strftime('%Y%m%d')
-        
-        # 往前推 30 天查日历
-        start = (now - timedelta(days=30)).strftime('%Y%m%d')
-        df = self.pro.trade_cal(exchange='', start_date=start, end_date=today_str, is_open='1')
-        df = df.sort_values('cal_date')
-        trade_dates = df['cal_date'].values
-        
-        # === 核心修复逻辑 ===
-        # 如果获取到的最后一天是“今天”，但现在还没到 16:00 (收盘后数据整理时间)
-        # 那么就认为是“未完结”，回退一天
-        if trade_dates[-1] == today_str:
-            if now.hour < 16: 
-                return trade_dates[-2] # 返回倒数第二天
-                
-        # 否则返回最后一天
-        return trade_dates[-1]
-
-    def sync_data(self, lookback_days=60):
+        return self.calendar.last_closed_session()
+
+    def sync_data(self, lookback_days=60, progress=None):
+        """progress: 可选回调 progress(text)，用于把进度推送给后台任务"""
+        with metrics.span('sync_data'):
+            return self._sync_data(lookback_days, progress)
+
+    def _sync_data(self, lookback_days, progress):
         print("🔄 正在检查数据同步状态...")
         
         # 这里的 get_trade_date 也会自动遵循上面的“收盘逻辑”
@@ -43,21 +60,33 @@ class DataManager:
         end_date = self.get_trade_date()
         
         latest_in_db = self.db.check_latest_date('daily_price')
+        # 先把列式库补齐到与数据库一致 (例如新增了字段)，之后才能逐日追加
+        self.ensure_panel_store()
         
+        # 台账里缺失 / 下载失败 / 行数偏少的历史交易日，与新日期一起补
+        with metrics.span('sync.ledger'):
+            gaps = self.ledger.gaps(latest_in_db)
+
+        start_date = None
         if latest_in_db is None:
             start_date = (pd.to_datetime(end_date) - timedelta(days=lookback_days)).strftime('%Y%m%d')
             print(f"⚡️ 首次初始化模式: {start_date} -> {end_date}")
         elif latest_in_db < end_date:
             start_date = (pd.to_datetime(latest_in_db) + timedelta(days=1)).strftime('%Y%m%d')
             print(f"📈 增量更新模式: {start_date} -> {end_date}")
-        else:
+        elif not gaps:
             print(f"✅ 数据已是最新 (DB: {latest_in_db} == Target: {end_date})")
+            self.ensure_indicator_state()
+            self.sync_indexes(end_date, lookback_days)
+            self.ensure_trigger_levels()
             return 0, 0, f"数据已最新 ({latest_in_db})"
+        if gaps:
+            print(f"🩹 发现 {len(gaps)} 个缺失/不完整的交易日，一并补齐: {', '.join(gaps[:5])}{' ...' if len(gaps) > 5 else ''}")
 
-        # 获取交易日
-        cal = self.pro.trade_cal(exchange='', start_date=start_date, end_date=end_date, is_open='1')
-        cal = cal.sort_values('cal_date')
-        trade_dates = cal['cal_date'].tolist()
+        # 获取交易日 (本地日历)
+        with metrics.span('sync.calendar'):
+            new_dates = self.calendar.sessions_between(start_date, end_date) if start_date else []
+        trade_dates = sorted(set(gaps) | set(new_dates))
 
         if not trade_dates:
             return 0, 0, f"无新交易日 ({start_date}-{end_date})"
@@ -65,79 +94,258 @@ class DataManager:
         success_count = 0
         fail_count = 0
         last_error = ""
+        # 滚动指标状态与数据库同步时逐日增量推进，否则同步结束后整体重建
+        # (补历史缺口会改变窗口内的K线，只能重建)
+        state_ok = self.indicators.is_current(latest_in_db) and not gaps
+        if gaps:
+            self.indicators.invalidate()
 
-        for date in trade_dates:
-            print(f"📥 下载全市场: {date} ...")
-            retry_times = 3
-            
-            for i in range(retry_times):
-                try:
-                    # A. 日线
-                    df_daily = self.pro.daily(trade_date=date)
-                    print(f"   -> 日线: {len(df_daily)} 行")
-                    self.db.save_data(df_daily, 'daily_price')
-                    
-                    # B. 资金流
-                    df_flow = self.pro.moneyflow(trade_date=date)
-                    self.db.save_data(df_flow, 'money_flow')
-                    
-                    success_count += 1
-                    time.sleep(1.0)
-                    break 
-                    
-                except Exception as e:
-                    print(f"⚠️ {date} 重试 {i+1}/{retry_times}: {e}")
-                    if i == retry_times - 1:
-                        fail_count += 1
-                        last_error = str(e)
-                    else:
-                        time.sleep(5)
+        # 并发下载 (限速 + 退避重试)，按日期顺序逐天入库
+        for n, (date, df_daily, df_flow, err) in enumerate(self.downloader.fetch_days(trade_dates), 1):
+            if progress:
+                progress(f"下载 {n}/{len(trade_dates)} ({date})")
+            if err is not None:
+                print(f"❌ {date} 下载失败: {err}")
+                self.ledger.record(date, error=err)
+                fail_count += 1
+                last_error = str(err)
+                continue
+
+            print(f"📥 {date} 日线: {len(df_daily)} 行, 资金流: {len(df_flow)} 行")
+            try:
+                with metrics.span('sync.save_db'):
+                    # 日线 + 资金流 + 台账同一个事务批量写入，失败则这一天整体回滚
+                    counts = {'daily_price': len(df_daily), 'money_flow': len(df_flow)}
+                    self.db.save_day({'daily_price': df_daily, 'money_flow': df_flow},
+                                     extra=lambda cur: self.ledger.record(date, counts, cur=cur))
+            except Exception as e:
+                print(f"❌ {date} 入库失败: {e}")
+                self.ledger.record(date, error=e)
+                fail_count += 1
+                last_error = str(e)
+                continue
+            metrics.count('quant_rows_written_total', len(df_daily), table='daily_price')
+            metrics.count('quant_rows_written_total', len(df_flow), table='money_flow')
+            # 追加到列式行情库
+            with metrics.span('sync.panel_store'):
+                self.store.write_day(date, df_daily, df_flow)
+            if state_ok:
+                with metrics.span('sync.indicators'):
+                    self.indicators.advance(date, df_daily, df_flow)
+            success_count += 1
+        metrics.count('quant_sync_days_total', success_count, status='ok')
+        metrics.count('quant_sync_days_total', fail_count, status='failed')
+
+        if success_count:
+            # 数据有变动: 版本号 +1，旧的扫描结果全部失效
+            self.db.bump_data_version()
+            self.scan_cache.invalidate()
+        with metrics.span('sync.finalize'):
+            if state_ok:
+                self.indicators.save()
+            # 列式库 / 滚动指标与数据库对不上 (首次启用 / 曾经写入失败) 时全量重建
+            self.ensure_panel_store()
+            self.ensure_indicator_state()
+        with metrics.span('sync.indexes'):
+            self.sync_indexes(end_date, lookback_days)
+        with metrics.span('sync.triggers'):
+            self.ensure_trigger_levels()
 
         # 更新列表
         try:
             df_basic = self.pro.stock_basic(exchange='', list_status='L', fields='ts_code,symbol,name,industry,market')
             self.db.save_data(df_basic, 'stock_basic', if_exists='replace')
         except: pass
+        # 行业映射 (到期才刷新，约每月一次)
+        try:
+            self.industries.refresh()
+        except Exception as e:
+            print(f"⚠️ 行业映射刷新失败 (继续使用旧映射): {e}")
             
         return success_count, fail_count, last_error
 
     # ============ 其他接口保持不变 ============
     
-    def get_history_batch(self, codes, days=60):
-        start_date = (datetime.now() - timedelta(days=days*2)).strftime('%Y%m%d')
-        return self.db.get_data('daily_price', start_date=start_date, codes=codes)
+    def ensure_panel_store(self):
+        """保证列式行情库与 SQLite 的最新日期一致"""
+        try:
+            latest_in_db = self.db.check_latest_date('daily_price')
+            if latest_in_db and not self.store.is_current(latest_in_db):
+                self.store.rebuild(self.db)
+        except Exception as e:
+            print(f"⚠️ 列式行情库重建失败: {e}")
 
-    def get_moneyflow_batch(self, codes, days=10):
-        start_date = (datetime.now() - timedelta(days=days*2)).strftime('%Y%m%d')
-        return self.db.get_data('money_flow', start_date=start_date, codes=codes)
-    
-    def get_history_from_db(self, days=60):
-        start_date = (datetime.now() - timedelta(days=days*2)).strftime('%Y%m%d')
-        return self.db.get_data('daily_price', start_date=start_date)
+    def ensure_trigger_levels(self):
+        """保证盘中监控的触发价位是按最新收盘数据、当前参数算出来的"""
+        try:
+            latest_in_db = self.db.check_latest_date('daily_price')
+            if latest_in_db and self.indicators.is_current(latest_in_db) \
+                    and self.db.get_meta('trigger_levels_key') != f"{self.db.get_data_version()}/{trigger_key()}":
+                build_trigger_levels(self, latest_in_db)
+        except Exception as e:
+            print(f"⚠️ 盘中触发价位计算失败: {e}")
 
-    def get_moneyflow_from_db(self, days=10):
+    def ensure_indicator_state(self):
+        """保证滚动指标状态与 SQLite 的最新日期、当前参数一致"""
+        try:
+            latest_in_db = self.db.check_latest_date('daily_price')
+            if latest_in_db and not self.indicators.is_current(latest_in_db):
+                self.indicators.rebuild(self.load_panels(days=Config.BOX_DAYS + 20, flow_days=Config.FLOW_DAYS + 5))
+        except Exception as e:
+            print(f"⚠️ 滚动指标状态重建失败: {e}")
+
+    def load_panels(self, days=60, flow_days=10, fields=None):
+        """
+        读取扫描窗口的 日期×股票 矩阵: {字段: DataFrame}
+        列式库与数据库同步时直接 mmap 读取，否则退回 SQLite 查询 + pivot
+        fields: 只读这些字段 (缺省为全部)；flow_days 为 0 时资金流取与日线相同的窗口
+        """
         start_date = (datetime.now() - timedelta(days=days*2)).strftime('%Y%m%d')
-        return self.db.get_data('money_flow', start_date=start_date)
-    
+        flow_start = (datetime.now() - timedelta(days=flow_days*2)).strftime('%Y%m%d') if flow_days else None
+        return self.load_panels_between(start_date, flow_start=flow_start, fields=fields)
+
+    def load_panels_between(self, start_date=None, end_date=None, flow_start=None, fields=None):
+        """按日期区间读取 日期×股票 矩阵 (回测等长区间场景)"""
+        flow_start = flow_start or start_date
+        fields = {f: t for f, t in FIELDS.items() if fields is None or f in fields or f == 'close'}
+        if self.store.is_current(self.db.check_latest_date('daily_price')):
+            return {
+                field: self.store.frame(field, start_date if table == 'daily_price' else flow_start, end_date)
+                for field, table in fields.items()
+            }
+
+        # 只读需要的列，紧凑类型 (category 代码 / 整数日期 / float32)
+        daily_cols = [f for f, t in fields.items() if t == 'daily_price']
+        flow_cols = [f for f, t in fields.items() if t == 'money_flow']
+        df_daily = self._index_by_code_date(self.db.get_data('daily_price', start_date=start_date, end_date=end_date,
+                                                             columns=daily_cols, compact=True))
+        df_flow = pd.DataFrame()
+        if flow_cols:
+            df_flow = self._index_by_code_date(self.db.get_data('money_flow', start_date=flow_start, end_date=end_date,
+                                                                columns=flow_cols, compact=True))
+        return {
+            field: pivot_panel(df_daily if table == 'daily_price' else df_flow, field)
+            for field, table in fields.items()
+        }
+
+    def fetch_panels_online(self, codes, end_date, days=60, flow_days=10, chunk=40):
+        """
+        本地数据缺失/过期时的兜底: 联网拉取少量股票的 日线 + 资金流，返回与 load_panels 相同结构
+        多只股票合并成逗号分隔的 ts_code 批量请求 (每批 chunk 只)，走限速与重试
+        """
+        start_date = (pd.to_datetime(end_date) - timedelta(days=days*2)).strftime('%Y%m%d')
+        flow_start = (pd.to_datetime(end_date) - timedelta(days=flow_days*2)).strftime('%Y%m%d')
+        codes = list(codes)
+        daily, flow = [], []
+        for i in range(0, len(codes), chunk):
+            batch = ','.join(codes[i:i + chunk])
+            daily.append(self.downloader.call('daily', ts_code=batch, start_date=start_date, end_date=end_date))
+            flow.append(self.downloader.call('moneyflow', ts_code=batch, start_date=flow_start, end_date=end_date))
+        df_daily = self._index_by_code_date(pd.concat(daily, ignore_index=True)) if daily else pd.DataFrame()
+        df_flow = self._index_by_code_date(pd.concat(flow, ignore_index=True)) if flow else pd.DataFrame()
+        return {
+            field: pivot_panel(df_daily if table == 'daily_price' else df_flow, field)
+            for field, table in FIELDS.items()
+        }
+
+    @staticmethod
+    def _index_by_code_date(df):
+        if df.empty: return df
+        df = df.set_index(['ts_code', 'trade_date'])
+        df = df[~df.index.duplicated(keep='last')]
+        return df.sort_index()
+
     def get_stock_basics(self):
         return self.db.get_data('stock_basic')
 
-    def get_top_sectors(self, trade_date):
+    def get_top_sectors(self, trade_date, days=None, weight=None):
+        """
+        申万一级行业强度排名 (本地计算: 行业映射 + 日线矩阵，不走网络)
+        days: 按最近几日累计涨幅排名 (缺省 SECTOR_MOMENTUM_DAYS)；weight: amount / equal (缺省 SECTOR_WEIGHT)
+        返回列: index_code, industry_name, pct_change, momentum, codes，按 momentum 降序
+        """
+        days = days or Config.SECTOR_MOMENTUM_DAYS
+        weight = weight or Config.SECTOR_WEIGHT
         try:
-            sw_index = self.pro.index_classify(level='L1', src='SW2021')
-            df = self.pro.sw_daily(trade_date=trade_date)
-            if df.empty: return pd.DataFrame()
-            df = df.merge(sw_index[['index_code', 'industry_name']], left_on='ts_code', right_on='index_code')
-            return df.sort_values('pct_change', ascending=False)
-        except:
+            if self.industries.labels().empty:
+                self.industries.refresh()
+            labels = self.industries.labels('index_code')
+            if labels.empty:
+                return pd.DataFrame()
+            panels = self.load_panels(days=days + 5, flow_days=0, fields={'pct_chg', 'amount'})
+            pct_chg = panels['pct_chg'].loc[:trade_date].tail(days)
+            if pct_chg.empty:
+                return pd.DataFrame()
+            amount = panels['amount'].loc[:trade_date].tail(days) if weight == 'amount' else None
+            df = sector_strength(pct_chg, labels, amount, days)
+        except Exception as e:
+            print(f"⚠️ 行业强度计算失败: {e}")
             return pd.DataFrame()
-            
-    def get_sector_members(self, sector_code):
-        return self.pro.index_member(index_code=sector_code)['con_code'].tolist()
+        names = self.industries.table().drop_duplicates('index_code').set_index('index_code')['industry_name']
+        df.index.name = 'index_code'
+        df = df.reset_index()
+        df.insert(1, 'industry_name', df['index_code'].map(names))
+        return df
+
+    def get_sector_members(self, sector_codes):
+        """一个或多个行业代码的成分股 (本地映射)"""
+        if isinstance(sector_codes, str):
+            sector_codes = [sector_codes]
+        labels = self.industries.labels('index_code')
+        return labels.index[labels.isin(list(sector_codes))].tolist()
         
+    def sync_indexes(self, end_date, lookback_days=60):
+        """基准及常用指数 (INDEX_CODES) 日线增量同步到本地 (表 index_daily)，每个指数一次调用"""
+        # 首次至少取一年，覆盖 RS 最长周期
+        first_start = (pd.to_datetime(end_date) - timedelta(days=max(lookback_days, 365))).strftime('%Y%m%d')
+        for code in Config.INDEX_CODES:
+            latest = self.db.get_meta(f'index_daily_latest:{code}')
+            if latest and latest >= end_date:
+                continue
+            start_date = (pd.to_datetime(latest) + timedelta(days=1)).strftime('%Y%m%d') if latest else first_start
+            try:
+                df = self.downloader.call('index_daily', ts_code=code, start_date=start_date, end_date=end_date)
+            except Exception as e:
+                print(f"⚠️ 指数 {code} 同步失败: {e}")
+                continue
+            if not df.empty:
+                self.db.save_data(df.assign(ts_code=code), 'index_daily')
+                self.db.set_meta(f'index_daily_latest:{code}', df['trade_date'].max())
+                print(f"📈 指数 {code}: {len(df)} 根K线 -> {df['trade_date'].max()}")
+
+    def get_index_close(self, ts_code, start_date, end_date):
+        """
+        指数收盘价序列 (index=trade_date，升序)
+        优先读本地 index_daily；本地覆盖不到所需区间时联网补取一次并落地
+        """
+        with self.db.engine.connect() as conn:
+            df = pd.read_sql(text("SELECT trade_date, close FROM index_daily WHERE ts_code = :c "
+                                  "AND trade_date BETWEEN :s AND :e ORDER BY trade_date"),
+                             conn, params={'c': ts_code, 's': start_date, 'e': end_date})
+        close = df.set_index('trade_date')['close']
+        try:
+            last_closed = min(end_date, self.get_trade_date())
+            sessions = self.calendar.sessions_between(start_date, last_closed)
+        except Exception:
+            sessions = []
+        if sessions and (close.empty or close.index[0] > sessions[0] or close.index[-1] < sessions[-1]):
+            print(f"🌐 本地指数 {ts_code} 不完整，联网补取 {start_date}-{end_date}")
+            df = self.pro.index_daily(ts_code=ts_code, start_date=start_date, end_date=end_date)
+            if df.empty:
+                return close
+            self.db.save_data(df.assign(ts_code=ts_code), 'index_daily')
+            close = df.set_index('trade_date')['close'].sort_index()
+        return close
+
     def get_benchmark_return(self, end_date, days=20):
+        """基准最近 days 根K线的涨幅 (本地指数)"""
         start_date = (pd.to_datetime(end_date) - timedelta(days=days*2)).strftime('%Y%m%d')
-        df = self.pro.index_daily(ts_code=Config.RS_BENCHMARK, start_date=start_date, end_date=end_date)
-        if len(df) < days: return 0
-        df = df.head(days)
-        return (df.iloc[0]['close'] - df.iloc[-1]['close']) / df.iloc[-1]['close']
+        close = self.get_index_close(Config.RS_BENCHMARK, start_date, end_date)
+        if len(close) < days: return 0
+        close = close.tail(days)
+        return (close.iloc[-1] - close.iloc[0]) / close.iloc[0]
+
+    def get_benchmark_close(self, start_date, end_date, days=20):
+        """基准指数收盘价序列 (index=trade_date)，向前多取 days 根K线用于计算区间首日的涨幅"""
+        fetch_start = (pd.to_datetime(start_date) - timedelta(days=days*2)).strftime('%Y%m%d')
+        return self.get_index_close(Config.RS_BENCHMARK, fetch_start, end_date)
@@ -1,29 +1,275 @@
 import os
-from sqlalchemy import create_engine, text
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, text
 import pandas as pd
+from metrics import metrics
+
+_MONEYFLOW_FIELDS = [
+    f'{side}_{size}_{unit}'
+    for size in ('sm', 'md', 'lg', 'elg')
+    for side in ('buy', 'sell')
+    for unit in ('vol', 'amount')
+]
+
+# 受管表结构: 主键去重 + trade_date 二级索引
+# columns: [(列名, 类型)]，key: 主键，indexes: {索引名: [列]}
+SCHEMAS = {
+    'daily_price': {
+        'columns': [('ts_code', 'TEXT'), ('trade_date', 'TEXT')] + [
+            (c, 'REAL') for c in ('open', 'high', 'low', 'close', 'pre_close', 'change', 'pct_chg', 'vol', 'amount')
+        ],
+        'key': ['ts_code', 'trade_date'],
+        'indexes': {'idx_daily_price_date': ['trade_date']},
+    },
+    'money_flow': {
+        'columns': [('ts_code', 'TEXT'), ('trade_date', 'TEXT')] + [
+            (c, 'REAL') for c in _MONEYFLOW_FIELDS + ['net_mf_vol', 'net_mf_amount']
+        ],
+        'key': ['ts_code', 'trade_date'],
+        'indexes': {'idx_money_flow_date': ['trade_date']},
+    },
+    'index_daily': {
+        'columns': [('ts_code', 'TEXT'), ('trade_date', 'TEXT')] + [
+            (c, 'REAL') for c in ('open', 'high', 'low', 'close', 'pre_close', 'pct_chg', 'vol', 'amount')
+        ],
+        'key': ['ts_code', 'trade_date'],
+        'indexes': {},
+    },
+    'stock_basic': {
+        'columns': [('ts_code', 'TEXT'), ('symbol', 'TEXT'), ('name', 'TEXT'), ('industry', 'TEXT'), ('market', 'TEXT')],
+        'key': ['ts_code'],
+        'indexes': {},
+    },
+    'meta': {
+        'columns': [('key', 'TEXT'), ('value', 'TEXT')],
+        'key': ['key'],
+        'indexes': {},
+    },
+    'indicator_state': {
+        'columns': [('ts_code', 'TEXT'), ('last_date', 'TEXT'), ('bars', 'INTEGER'), ('close', 'REAL'),
+                    ('vol', 'REAL'), ('pct_chg', 'REAL'), ('box_high', 'REAL'), ('vol_ma', 'REAL'),
+                    ('close_n_ago', 'REAL'), ('flow_streak', 'INTEGER'), ('flow_date', 'TEXT'), ('window', 'TEXT')],
+        'key': ['ts_code'],
+        'indexes': {},
+    },
+    'scan_cache': {
+        'columns': [('trade_date', 'TEXT'), ('params_hash', 'TEXT'), ('data_version', 'TEXT'),
+                    ('created', 'TEXT'), ('results', 'TEXT')],
+        'key': ['trade_date', 'params_hash'],
+        'indexes': {},
+    },
+    'stock_industry': {
+        'columns': [('ts_code', 'TEXT'), ('index_code', 'TEXT'), ('industry_name', 'TEXT')],
+        'key': ['ts_code'],
+        'indexes': {},
+    },
+    'trigger_levels': {
+        'columns': [('ts_code', 'TEXT'), ('name', 'TEXT'), ('price_trigger', 'REAL'), ('vol_trigger', 'REAL'),
+                    ('rs_base', 'REAL'), ('flow_ready', 'INTEGER')],
+        'key': ['ts_code'],
+        'indexes': {},
+    },
+    'subscribers': {
+        'columns': [('chat_id', 'TEXT'), ('name', 'TEXT'), ('sectors', 'TEXT'), ('screens', 'TEXT'),
+                    ('min_score', 'INTEGER'), ('max_names', 'INTEGER'), ('delivery_time', 'TEXT'),
+                    ('active', 'INTEGER'), ('last_sent', 'TEXT'), ('created', 'TEXT')],
+        'key': ['chat_id'],
+        'indexes': {},
+    },
+    'sync_ledger': {
+        'columns': [('trade_date', 'TEXT'), ('table_name', 'TEXT'), ('row_count', 'INTEGER'), ('status', 'TEXT'),
+                    ('attempts', 'INTEGER'), ('error', 'TEXT'), ('updated', 'TEXT')],
+        'key': ['trade_date', 'table_name'],
+        'indexes': {},
+    },
+    'trade_cal': {
+        'columns': [('exchange', 'TEXT'), ('cal_date', 'TEXT'), ('is_open', 'INTEGER'), ('pretrade_date', 'TEXT')],
+        'key': ['cal_date'],
+        'indexes': {},
+    },
+}
+
+
+def compact_frame(df, code_categories=None, float32=True):
+    """
+    压缩行情表的内存占用 (原地修改并返回):
+        ts_code    -> category (每个代码只存一份字符串)
+        trade_date -> int32 (YYYYMMDD)
+        float64    -> float32 (价格两位小数、量额相对误差 1e-7，规则判断不受影响)
+    """
+    if 'ts_code' in df.columns:
+        df['ts_code'] = pd.Categorical(df['ts_code'], categories=code_categories)
+    if 'trade_date' in df.columns:
+        df['trade_date'] = pd.to_numeric(df['trade_date']).astype('int32')
+    if float32:
+        floats = df.select_dtypes('float64').columns
+        df[floats] = df[floats].astype('float32')
+    return df
+
 
 class DBManager:
     def __init__(self, db_path='/app/data/quant.db'):
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
         # 初始化数据库引擎
         self.engine = create_engine(f'sqlite:///{db_path}')
-        
+        event.listen(self.engine, 'connect', self._on_connect)
+        self.ensure_schema()
+
+    @staticmethod
+    def _on_connect(dbapi_conn, _record):
+        """
+        每个新连接的 PRAGMA
+        WAL: 同步写入时扫描/查询照常读取，互不阻塞；synchronous=NORMAL 在 WAL 下不会损坏数据库
+        """
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.execute("PRAGMA cache_size=-65536")  # 64MB 页缓存
+        cur.close()
+
+    def ensure_schema(self):
+        """建表/建索引；旧版无主键的表会自动去重迁移"""
+        with self.engine.begin() as conn:
+            for table_name, schema in SCHEMAS.items():
+                info = conn.execute(text(f"PRAGMA table_info({table_name})")).fetchall()
+                if info and not any(row[5] for row in info):
+                    self._migrate_legacy(conn, table_name, [row[1] for row in info])
+                conn.execute(text(self._create_sql(table_name)))
+                for index_name, cols in schema['indexes'].items():
+                    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({', '.join(cols)})"))
+
+    @staticmethod
+    def _create_sql(table_name):
+        schema = SCHEMAS[table_name]
+        cols = ', '.join(f'"{c}" {t}' for c, t in schema['columns'])
+        return f"CREATE TABLE IF NOT EXISTS {table_name} ({cols}, PRIMARY KEY ({', '.join(schema['key'])}))"
+
+    def _migrate_legacy(self, conn, table_name, old_cols):
+        """to_sql 建出来的旧表 (无主键、可能有重复行) -> 受管表，重复行保留最后写入的一条"""
+        print(f"🛠️ 迁移旧表 {table_name} -> 带主键的受管表...")
+        legacy = f"{table_name}_legacy"
+        conn.execute(text(f"DROP TABLE IF EXISTS {legacy}"))
+        conn.execute(text(f"ALTER TABLE {table_name} RENAME TO {legacy}"))
+        # 旧表上的同名索引会跟着改名的表走，先删掉避免与新索引重名
+        for index_name in SCHEMAS[table_name]['indexes']:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+        conn.execute(text(self._create_sql(table_name)))
+        cols = [c for c, _ in SCHEMAS[table_name]['columns'] if c in old_cols]
+        col_str = ', '.join(f'"{c}"' for c in cols)
+        conn.execute(text(f"INSERT OR REPLACE INTO {table_name} ({col_str}) SELECT {col_str} FROM {legacy} ORDER BY rowid"))
+        conn.execute(text(f"DROP TABLE {legacy}"))
+
     def save_data(self, df, table_name, if_exists='append'):
-        """保存数据到数据库"""
+        """
+        保存数据到数据库
+        受管表按主键 upsert (重复跑同一天不会产生重复行)；
+        if_exists='replace' 时先清空整表再写入
+        """
         if df.empty: return
+        if table_name not in SCHEMAS:
+            try:
+                df.to_sql(table_name, self.engine, if_exists=if_exists, index=False)
+            except Exception as e:
+                print(f"❌ 保存 {table_name} 失败: {e}")
+            return
+
         try:
-            # 这里的 to_sql Pandas 会自动处理连接，通常没问题
-            # 如果报错，也可以改为 with self.engine.connect() as conn: ...
-            df.to_sql(table_name, self.engine, if_exists=if_exists, index=False)
+            with self.bulk_writer(synchronous='NORMAL') as cur:
+                if if_exists == 'replace':
+                    cur.execute(f"DELETE FROM {table_name}")
+                self._upsert(cur, df, table_name)
         except Exception as e:
             print(f"❌ 保存 {table_name} 失败: {e}")
 
-    def get_data(self, table_name, start_date=None, end_date=None, codes=None):
+    def save_day(self, frames, extra=None):
+        """
+        批量入库一个交易日: {表名: DataFrame} 在同一个事务里写入 (日线 + 资金流一次提交)
+        extra(cur): 可选，在同一事务里追加的写入 (例如同步台账)
+        写入期间 synchronous=OFF，断电最多丢掉这一天，重新同步即可补回
+        """
+        with self.bulk_writer(synchronous='OFF') as cur:
+            for table_name, df in frames.items():
+                if df is not None and not df.empty:
+                    self._upsert(cur, df, table_name)
+            if extra is not None:
+                extra(cur)
+
+    @contextmanager
+    def bulk_writer(self, synchronous='OFF'):
+        """
+        原生 sqlite3 游标 + 显式事务，块内的全部写入一次提交 (出错整体回滚)
+        绕开 SQLAlchemy 的逐行参数绑定，executemany 直接吃元组
+        """
+        conn = self.engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"PRAGMA synchronous={synchronous}")
+            try:
+                cur.execute("BEGIN")
+                yield cur
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cur.execute("PRAGMA synchronous=NORMAL")
+                cur.close()
+        finally:
+            conn.close()
+
+    @classmethod
+    def _upsert(cls, cur, df, table_name, chunk=5000):
+        """分块 executemany 写入受管表"""
+        sql, rows = cls._upsert_statement(df, table_name)
+        for i in range(0, len(rows), chunk):
+            cur.executemany(sql, rows[i:i + chunk])
+
+    @staticmethod
+    def _upsert_statement(df, table_name):
+        """生成 INSERT ... ON CONFLICT DO UPDATE 语句和参数元组 (只写入表结构里有的列)"""
+        schema = SCHEMAS[table_name]
+        cols = [c for c, _ in schema['columns'] if c in df.columns]
+        df = df[cols].drop_duplicates(schema['key'], keep='last')
+        values = df.to_numpy(dtype=object)
+        values[df.isna().to_numpy()] = None
+
+        updates = [c for c in cols if c not in schema['key']]
+        conflict = f"DO UPDATE SET {', '.join(f'{c}=excluded.{c}' for c in updates)}" if updates else "DO NOTHING"
+        sql = (
+            f"INSERT INTO {table_name} ({', '.join(cols)}) "
+            f"VALUES ({', '.join('?' for _ in cols)}) "
+            f"ON CONFLICT({', '.join(schema['key'])}) {conflict}"
+        )
+        return sql, list(map(tuple, values))
+
+    def get_data(self, table_name, start_date=None, end_date=None, codes=None, columns=None,
+                 compact=False, float32=None, chunksize=200000):
         """
         【关键修复】读取数据
         修复 'OptionEngine object has no attribute execute' 错误
+        columns: 只读取这些列 (受管表自动带上主键列)，缺省为全部列
+        compact: 返回紧凑的表 (见 compact_frame)，按 chunksize 分块读取并逐块压缩，
+                 峰值内存只有一块的原始字符串；float32=False 时数值列保留 float64
         """
-        query = f"SELECT * FROM {table_name} WHERE 1=1"
+        schema = SCHEMAS.get(table_name)
+        cols = None
+        if columns:
+            keys = [c for c in (schema['key'] if schema else []) if c not in columns]
+            cols = keys + list(columns)
+        elif compact and schema:
+            cols = [c for c, _ in schema['columns']]
+
+        if cols is None:
+            select = '*'
+        else:
+            # 紧凑模式下日期直接在 SQLite 里转成整数，不再逐行生成 Python 字符串
+            select = ', '.join(
+                'CAST(trade_date AS INTEGER) AS trade_date' if compact and c == 'trade_date' else f'"{c}"'
+                for c in cols
+            )
+        query = f"SELECT {select} FROM {table_name} WHERE 1=1"
         
         if start_date:
             query += f" AND trade_date >= '{start_date}'"
@@ -38,13 +284,58 @@ class DBManager:
         try:
             # === 修改点开始 ===
             # SQLAlchemy 2.0 必须显式建立连接
-            with self.engine.connect() as conn:
-                return pd.read_sql(text(query), conn)
+            with metrics.span('db.get_data', table=table_name), self.engine.connect() as conn:
+                if not compact:
+                    df = pd.read_sql(text(query), conn)
+                else:
+                    df = self._read_compact(conn, table_name, query, cols, codes,
+                                            compact if float32 is None else float32, chunksize)
+            metrics.count('quant_db_rows_read_total', len(df), table=table_name)
+            return df
             # === 修改点结束 ===
         except Exception as e:
             print(f"SQL Error: {e}")
             return pd.DataFrame()
 
+    @staticmethod
+    def _read_compact(conn, table_name, query, cols, codes, float32, chunksize):
+        categories = None
+        if cols and 'ts_code' in cols:
+            # 所有块共用同一套类别，拼接后仍然是 category
+            categories = sorted(set(codes)) if codes else [
+                r[0] for r in conn.execute(text(f"SELECT DISTINCT ts_code FROM {table_name} ORDER BY ts_code"))
+            ]
+        chunks = [compact_frame(chunk, categories, float32)
+                  for chunk in pd.read_sql(text(query), conn, chunksize=chunksize)]
+        if not chunks:
+            return pd.DataFrame(columns=cols)
+        df = pd.concat(chunks, ignore_index=True)
+        if categories is not None:
+            df['ts_code'] = df['ts_code'].cat.remove_unused_categories()
+        return df
+
+    def get_meta(self, key, default=None):
+        """读取 meta 表里的键值 (数据版本、状态日期等)"""
+        with self.engine.connect() as conn:
+            value = conn.execute(text("SELECT value FROM meta WHERE key = :k"), {'k': key}).scalar()
+        return default if value is None else value
+
+    def set_meta(self, key, value):
+        with self.engine.begin() as conn:
+            conn.execute(
+                text("INSERT INTO meta (key, value) VALUES (:k, :v) ON CONFLICT(key) DO UPDATE SET value=excluded.value"),
+                {'k': key, 'v': str(value)},
+            )
+
+    def get_data_version(self):
+        return self.get_meta('data_version', '0')
+
+    def bump_data_version(self):
+        """行情数据有变动时调用，所有基于旧数据的缓存随之失效"""
+        version = str(int(self.get_data_version()) + 1)
+        self.set_meta('data_version', version)
+        return version
+
     def check_latest_date(self, table_name):
         """检查最新日期"""
         try:
@@ -0,0 +1,114 @@
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+
+class TokenBucket:
+    """
+    令牌桶限流: 平均每分钟 rate_per_min 次，最多允许 burst 次突发
+    多线程共享同一个桶，acquire() 拿不到令牌时阻塞等待
+    """
+
+    def __init__(self, rate_per_min, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate_per_min / 60.0
+        self.capacity = float(burst or max(1, rate_per_min // 10))
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            self.sleep(wait)
+
+    def try_acquire(self, take=True):
+        """不阻塞: 有令牌就拿走 (take=False 只看不拿) 并返回 0，否则返回还要等几秒"""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                if take:
+                    self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds):
+        """服务端要求暂停 (例如 429 retry_after): 清空令牌，seconds 秒后才恢复"""
+        with self.lock:
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+            self.updated = self.clock()
+
+
+class Downloader:
+    """
+    并发下载 Tushare 全市场日数据
+    - 线程池并行: 同一天的 daily / moneyflow 同时请求，多天之间也并行
+    - 令牌桶按积分配额限速，总耗时只受配额约束而不是串行往返
+    - 失败按指数退避 + 随机抖动重试
+    pro 可以是 tushare.pro_api() 或任意实现了同名方法的替身 (便于离线测试)
+    """
+
+    def __init__(self, pro, calls_per_min=None, max_workers=None, retries=3,
+                 base_delay=1.0, max_delay=30.0, sleep=time.sleep):
+        self.pro = pro
+        self.limiter = TokenBucket(calls_per_min or Config.TUSHARE_CALLS_PER_MIN, sleep=sleep)
+        self.max_workers = max_workers or Config.DOWNLOAD_WORKERS
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+
+    def backoff(self, attempt):
+        """第 attempt 次失败后的等待秒数: 指数增长，取后一半区间做抖动，避免多线程同时重试"""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def call(self, endpoint, **kwargs):
+        """限速 + 重试地调用一个接口，重试耗尽后抛出最后一次的异常"""
+        for attempt in range(self.retries):
+            self.limiter.acquire()
+            try:
+                return getattr(self.pro, endpoint)(**kwargs)
+            except Exception as e:
+                print(f"⚠️ {endpoint} {kwargs} 重试 {attempt+1}/{self.retries}: {e}")
+                if attempt == self.retries - 1:
+                    raise
+                self.sleep(self.backoff(attempt))
+
+    def fetch_days(self, trade_dates):
+        """
+        按日期顺序逐个产出 (date, df_daily, df_flow, error)
+        后台最多预取 max_workers 个交易日，内存占用有上限；调用方可以边下载边入库
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = deque()
+            dates = iter(trade_dates)
+
+            def submit_next():
+                date = next(dates, None)
+                if date is None:
+                    return
+                pending.append((
+                    date,
+                    pool.submit(self.call, 'daily', trade_date=date),
+                    pool.submit(self.call, 'moneyflow', trade_date=date),
+                ))
+
+            for _ in range(self.max_workers):
+                submit_next()
+
+            while pending:
+                date, f_daily, f_flow = pending.popleft()
+                submit_next()
+                try:
+                    yield date, f_daily.result(), f_flow.result(), None
+                except Exception as e:
+                    yield date, None, None, e
@@ -0,0 +1,210 @@
+import time
+import random
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# 申万一级行业 (代码与 Tushare SW2021 一致)
+SW_L1 = [
+    ('801010.SI', '农林牧渔'), ('801030.SI', '基础化工'), ('801040.SI', '钢铁'), ('801050.SI', '有色金属'),
+    ('801080.SI', '电子'), ('801110.SI', '家用电器'), ('801120.SI', '食品饮料'), ('801130.SI', '纺织服饰'),
+    ('801140.SI', '轻工制造'), ('801150.SI', '医药生物'), ('801160.SI', '公用事业'), ('801170.SI', '交通运输'),
+    ('801180.SI', '房地产'), ('801200.SI', '商贸零售'), ('801210.SI', '社会服务'), ('801230.SI', '综合'),
+    ('801710.SI', '建筑材料'), ('801720.SI', '建筑装饰'), ('801730.SI', '电力设备'), ('801740.SI', '国防军工'),
+    ('801750.SI', '计算机'), ('801760.SI', '传媒'), ('801770.SI', '通信'), ('801780.SI', '银行'),
+    ('801790.SI', '非银金融'), ('801880.SI', '汽车'), ('801890.SI', '机械设备'), ('801950.SI', '煤炭'),
+    ('801960.SI', '石油石化'), ('801970.SI', '环保'), ('801980.SI', '美容护理'),
+]
+
+
+class SyntheticMarket:
+    """
+    可复现的合成行情: n_codes 只股票 × n_days 个交易日 (工作日)
+    日线 / 资金流 / 行业归属 / 行业日线 / 基准指数都由同一个随机种子生成，
+    并刻意埋入一部分箱体突破 + 放量 + 资金连续流入的样本，让扫描有结果可算。
+    """
+
+    def __init__(self, n_codes=5000, n_days=500, seed=0, end_date=None, suspend_rate=0.02):
+        rng = np.random.default_rng(seed)
+        end = pd.Timestamp(end_date or datetime.now().strftime('%Y%m%d'))
+        self.dates = list(pd.bdate_range(end=end, periods=n_days).strftime('%Y%m%d'))
+        self.codes = [f"{600000 + i:06d}.SH" if i % 2 == 0 else f"{i:06d}.SZ" for i in range(n_codes)]
+        self.industry = pd.Series([SW_L1[i % len(SW_L1)][0] for i in range(n_codes)], index=self.codes)
+
+        # 行业因子 + 个股噪声的对数收益
+        sector_ret = rng.normal(0.0005, 0.012, (n_days, len(SW_L1)))
+        sector_idx = np.arange(n_codes) % len(SW_L1)
+        rets = sector_ret[:, sector_idx] + rng.normal(0.0005, 0.02, (n_days, n_codes))
+        hot = rng.random(n_codes) < 0.05
+        rets[-1, hot] += 0.08
+        close = np.round(10 * np.exp(np.cumsum(rets, axis=0)), 2)
+        pre_close = np.vstack([close[:1], close[:-1]])
+        high = np.round(close * (1 + rng.uniform(0, 0.02, close.shape)), 2)
+        low = np.round(close * (1 - rng.uniform(0, 0.02, close.shape)), 2)
+        open_ = np.round((high + low) / 2, 2)
+        vol = rng.uniform(1e4, 5e4, close.shape)
+        vol[-1, hot] *= 3
+        flow = rng.normal(50, 300, close.shape)
+        flow[-5:, hot] = np.abs(flow[-5:, hot]) + 1
+
+        # 停牌: 当天没有日线也没有资金流
+        listed = rng.random(close.shape) >= suspend_rate
+        t, j = np.nonzero(listed)
+        dates = np.asarray(self.dates)[t]
+        codes = np.asarray(self.codes)[j]
+        pct_chg = (close / pre_close - 1) * 100
+        self.daily = pd.DataFrame({
+            'ts_code': codes, 'trade_date': dates,
+            'open': open_[t, j], 'high': high[t, j], 'low': low[t, j], 'close': close[t, j],
+            'pre_close': pre_close[t, j], 'change': (close - pre_close)[t, j], 'pct_chg': pct_chg[t, j],
+            'vol': vol[t, j], 'amount': (vol * close / 10)[t, j],
+        })
+        # 资金流: 各档买卖金额按净流入拆分，保证 net_mf_amount 与之自洽
+        net = flow[t, j]
+        base = (vol * close / 40)[t, j]
+        self.moneyflow = pd.DataFrame({'ts_code': codes, 'trade_date': dates})
+        for size in ('sm', 'md', 'lg', 'elg'):
+            self.moneyflow[f'buy_{size}_vol'] = vol[t, j] / 8
+            self.moneyflow[f'buy_{size}_amount'] = base / 2 + net / 8
+            self.moneyflow[f'sell_{size}_vol'] = vol[t, j] / 8
+            self.moneyflow[f'sell_{size}_amount'] = base / 2 - net / 8
+        self.moneyflow['net_mf_vol'] = 0.0
+        self.moneyflow['net_mf_amount'] = net
+
+        # 行业日线: 成分股等权涨跌幅
+        sector_pct = pd.DataFrame(pct_chg).T.groupby(sector_idx).mean().T.to_numpy()
+        sector_close = 1000 * np.cumprod(1 + sector_pct / 100, axis=0)
+        self.sw_daily = pd.DataFrame({
+            'ts_code': np.repeat([[c for c, _ in SW_L1]], n_days, axis=0).ravel(),
+            'trade_date': np.repeat(self.dates, len(SW_L1)),
+            'name': np.repeat([[n for _, n in SW_L1]], n_days, axis=0).ravel(),
+            'close': sector_close.ravel(),
+            'pct_change': sector_pct.ravel(),
+        })
+
+        # 基准指数: 全市场等权
+        bench_close = 4000 * np.cumprod(1 + np.nanmean(pct_chg, axis=1) / 100)
+        self.index_daily = pd.DataFrame({'trade_date': self.dates, 'close': bench_close})
+
+        self._daily_by_date = dict(tuple(self.daily.groupby('trade_date', sort=False)))
+        self._flow_by_date = dict(tuple(self.moneyflow.groupby('trade_date', sort=False)))
+        self._sw_by_date = dict(tuple(self.sw_daily.groupby('trade_date', sort=False)))
+
+    @property
+    def rows(self):
+        return len(self.daily)
+
+
+class FakeProApi:
+    """
+    tushare.pro_api() 的离线替身，数据来自 SyntheticMarket
+    latency / error_rate 可以是数值 (所有接口) 或 {接口名: 数值}，用于模拟网络延迟和偶发失败
+    calls 记录每个接口被调用的次数
+    """
+
+    def __init__(self, market, latency=0.0, error_rate=0.0, seed=0):
+        self.market = market
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _setting(value, endpoint):
+        return value.get(endpoint, 0.0) if isinstance(value, dict) else value
+
+    def _hit(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+            fail = self.rng.random() < self._setting(self.error_rate, endpoint)
+        delay = self._setting(self.latency, endpoint)
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise IOError(f"模拟的 {endpoint} 接口错误")
+
+    @staticmethod
+    def _by_code(df, ts_code, start_date, end_date, limit):
+        """按 ts_code (可逗号分隔多只) + 日期区间查询，与 Tushare 一样按日期倒序返回"""
+        df = df[df['ts_code'].isin(ts_code.split(','))]
+        if start_date:
+            df = df[df['trade_date'] >= start_date]
+        if end_date:
+            df = df[df['trade_date'] <= end_date]
+        df = df.sort_values('trade_date', ascending=False)
+        return (df.head(limit) if limit else df).reset_index(drop=True)
+
+    # ============ 行情 ============
+
+    def daily(self, trade_date=None, ts_code=None, start_date=None, end_date=None, limit=None, **kwargs):
+        self._hit('daily')
+        if trade_date:
+            return self.market._daily_by_date.get(trade_date, self.market.daily.iloc[:0]).reset_index(drop=True)
+        return self._by_code(self.market.daily, ts_code, start_date, end_date, limit)
+
+    def moneyflow(self, trade_date=None, ts_code=None, start_date=None, end_date=None, limit=None, **kwargs):
+        self._hit('moneyflow')
+        if trade_date:
+            return self.market._flow_by_date.get(trade_date, self.market.moneyflow.iloc[:0]).reset_index(drop=True)
+        return self._by_code(self.market.moneyflow, ts_code, start_date, end_date, limit)
+
+    def index_daily(self, ts_code=None, start_date=None, end_date=None, **kwargs):
+        self._hit('index_daily')
+        df = self.market.index_daily.assign(ts_code=ts_code)
+        df = df[(df['trade_date'] >= (start_date or '')) & (df['trade_date'] <= (end_date or '99999999'))]
+        return df.sort_values('trade_date', ascending=False).reset_index(drop=True)
+
+    # ============ 参考数据 ============
+
+    def trade_cal(self, exchange='SSE', start_date=None, end_date=None, is_open=None, **kwargs):
+        """合成行情的交易日为开市日；行情末日之后的工作日也视为开市 (便于测试增量同步)"""
+        self._hit('trade_cal')
+        days = pd.date_range(start_date, end_date)
+        open_days = set(self.market.dates)
+        last = self.market.dates[-1]
+        cal = days.strftime('%Y%m%d')
+        opened = [int(d in open_days or (d > last and day.weekday() < 5)) for d, day in zip(cal, days)]
+        df = pd.DataFrame({'exchange': exchange, 'cal_date': cal, 'is_open': opened})
+        df['pretrade_date'] = df['cal_date'].where(df['is_open'] == 1).ffill().shift(1)
+        if is_open is not None:
+            df = df[df['is_open'] == int(is_open)]
+        return df.sort_values('cal_date', ascending=False).reset_index(drop=True)
+
+    def stock_basic(self, **kwargs):
+        self._hit('stock_basic')
+        names = dict(SW_L1)
+        return pd.DataFrame({
+            'ts_code': self.market.codes,
+            'symbol': [c[:6] for c in self.market.codes],
+            'name': [f"合成{c[:6]}" for c in self.market.codes],
+            'industry': self.market.industry.map(names).to_numpy(),
+            'market': '主板',
+        })
+
+    def index_classify(self, level='L1', src='SW2021', **kwargs):
+        self._hit('index_classify')
+        return pd.DataFrame({
+            'index_code': [c for c, _ in SW_L1],
+            'industry_name': [n for _, n in SW_L1],
+            'level': level,
+            'src': src,
+        })
+
+    def sw_daily(self, trade_date=None, **kwargs):
+        self._hit('sw_daily')
+        return self.market._sw_by_date.get(trade_date, self.market.sw_daily.iloc[:0]).reset_index(drop=True)
+
+    def index_member(self, index_code=None, **kwargs):
+        self._hit('index_member')
+        industry = self.market.industry
+        members = industry[industry == index_code].index
+        current = pd.DataFrame({'index_code': index_code, 'con_code': members, 'in_date': self.market.dates[0],
+                                'out_date': None, 'is_new': 'Y'})
+        # 与真实接口一样带上历史成分: 每 7 只里有一只曾属于相邻行业、已调出
+        codes = [SW_L1[(i + 1) % len(SW_L1)][0] for i in range(len(industry))]
+        moved = industry.index[(np.arange(len(industry)) % 7 == 0) & (np.array(codes) == index_code)]
+        stale = pd.DataFrame({'index_code': index_code, 'con_code': moved, 'in_date': self.market.dates[0],
+                              'out_date': self.market.dates[0], 'is_new': 'N'})
+        return pd.concat([current, stale], ignore_index=True)
@@ -0,0 +1,244 @@
+import json
+import numpy as np
+import pandas as pd
+from collections import deque
+from sqlalchemy import text
+from config import Config
+from panel import align_right
+
+# 快照里的标量列 (扫描只读这些，不读窗口 JSON)
+SNAPSHOT_COLUMNS = ['ts_code', 'last_date', 'bars', 'close', 'vol', 'pct_chg',
+                    'box_high', 'vol_ma', 'close_n_ago', 'flow_streak']
+
+
+class StockState:
+    """
+    单只股票的滚动指标，每来一根新K线 O(1) 摊还更新
+        highs:  单调递减队列 [(序号, 最高价)]，队首即过去 BOX_DAYS 根K线的箱体上沿
+        vols:   过去 VOL_MA_DAYS 根K线的成交量 (配合 vol_sum 算均量)
+        closes: 最近 VOL_MA_DAYS+1 根收盘价，队首即 N 天前收盘价
+    "过去" 都不含当前这根K线，与 run_daily_scan 的规则口径一致
+    """
+
+    def __init__(self, box_days, vol_days):
+        self.box_days = box_days
+        self.vol_days = vol_days
+        self.bars = 0
+        self.last_date = None
+        self.cur = None  # 当前K线 (close, high, vol, pct_chg)
+        self.highs = deque()
+        self.vols = deque()
+        self.vol_sum = 0.0
+        self.closes = deque(maxlen=vol_days + 1)
+        self.flow_streak = 0
+        self.flow_date = None
+
+    def push_bar(self, trade_date, close, high, vol, pct_chg):
+        if self.cur is not None:
+            # 上一根K线进入 "过去" 窗口
+            seq = self.bars - 1
+            prev_high, prev_vol = self.cur[1], self.cur[2]
+            while self.highs and self.highs[-1][1] <= prev_high:
+                self.highs.pop()
+            self.highs.append((seq, prev_high))
+            while self.highs[0][0] <= seq - self.box_days:
+                self.highs.popleft()
+
+            self.vols.append(prev_vol)
+            self.vol_sum += prev_vol
+            if len(self.vols) > self.vol_days:
+                self.vol_sum -= self.vols.popleft()
+
+        self.cur = (close, high, vol, pct_chg)
+        self.closes.append(close)
+        self.bars += 1
+        self.last_date = trade_date
+
+    def push_flow(self, trade_date, net_mf_amount):
+        self.flow_streak = self.flow_streak + 1 if net_mf_amount > 0 else 0
+        self.flow_date = trade_date
+
+    def row(self, ts_code):
+        close, high, vol, pct_chg = self.cur if self.cur else (np.nan,) * 4
+        return {
+            'ts_code': ts_code,
+            'last_date': self.last_date,
+            'bars': self.bars,
+            'close': close,
+            'vol': vol,
+            'pct_chg': pct_chg,
+            'box_high': self.highs[0][1] if self.highs else np.nan,
+            'vol_ma': self.vol_sum / len(self.vols) if self.vols else np.nan,
+            'close_n_ago': self.closes[0] if len(self.closes) > self.vol_days else np.nan,
+            'flow_streak': self.flow_streak,
+            'flow_date': self.flow_date,
+            'window': json.dumps({
+                'high': self.cur[1] if self.cur else None,
+                'highs': list(self.highs),
+                'vols': list(self.vols),
+                'closes': list(self.closes),
+            }),
+        }
+
+    def next_levels(self):
+        """
+        假设当前K线已进入 "过去" 窗口，下一根K线判断时用到的
+        (箱体上沿, 均量, N 天前收盘价)，不修改状态 (盘中监控的触发价位)
+        """
+        if self.cur is None:
+            return np.nan, np.nan, np.nan
+        close, high, vol, _ = self.cur
+        seq = self.bars - 1
+        box_high = max([h for s, h in self.highs if s > seq - self.box_days] + [high])
+        vols = list(self.vols)[-(self.vol_days - 1):] if self.vol_days > 1 else []
+        vol_ma = (sum(vols) + vol) / (len(vols) + 1)
+        closes = list(self.closes)
+        close_n_ago = closes[-self.vol_days] if len(closes) >= self.vol_days else np.nan
+        return box_high, vol_ma, close_n_ago
+
+    @classmethod
+    def from_row(cls, row, box_days, vol_days):
+        st = cls(box_days, vol_days)
+        window = json.loads(row['window'])
+        st.bars = int(row['bars'])
+        st.last_date = row['last_date']
+        if window['high'] is not None:
+            st.cur = (row['close'], window['high'], row['vol'], row['pct_chg'])
+        st.highs = deque(tuple(x) for x in window['highs'])
+        st.vols = deque(window['vols'])
+        st.vol_sum = float(sum(st.vols))
+        st.closes = deque(window['closes'], maxlen=vol_days + 1)
+        st.flow_streak = int(row['flow_streak'])
+        st.flow_date = row['flow_date']
+        return st
+
+
+class IndicatorState:
+    """
+    全市场的持久化增量指标 (表 indicator_state，一只股票一行)
+    sync_data 每落地一个交易日就 advance() 一次；扫描时只读每只股票的一行快照
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.states = None  # 懒加载 {ts_code: StockState}
+        self.date = None    # 内存中状态已推进到的日期
+        self.stale = False  # 收到了比状态更早的日期 (补缺口)，只能重建
+
+    @staticmethod
+    def params_key():
+        return f"{Config.BOX_DAYS}/{Config.VOL_MA_DAYS}/{Config.FLOW_DAYS}"
+
+    @property
+    def last_date(self):
+        return self.db.get_meta('indicator_state_date')
+
+    def is_current(self, latest_date):
+        return bool(latest_date) and self.last_date == latest_date \
+            and self.db.get_meta('indicator_state_params') == self.params_key()
+
+    def invalidate(self):
+        """作废已保存的状态 (例如补了历史缺口)，下次 ensure_indicator_state 时整体重建"""
+        self.db.set_meta('indicator_state_date', '')
+        self.states = None
+        self.date = None
+        self.stale = False
+
+    def _load(self):
+        if self.states is None:
+            df = self.db.get_data('indicator_state')
+            self.states = {
+                row['ts_code']: StockState.from_row(row, Config.BOX_DAYS, Config.VOL_MA_DAYS)
+                for row in df.to_dict('records')
+            }
+        return self.states
+
+    def advance(self, trade_date, df_daily, df_flow=None):
+        """把新的一个交易日推进到每只股票的状态里 (需按日期顺序调用)"""
+        current = self.date or self.last_date
+        if current and trade_date <= current:
+            self.stale = True
+            return
+        states = self._load()
+        for code, close, high, vol, pct_chg in df_daily[['ts_code', 'close', 'high', 'vol', 'pct_chg']].itertuples(index=False):
+            st = states.get(code)
+            if st is None:
+                st = states[code] = StockState(Config.BOX_DAYS, Config.VOL_MA_DAYS)
+            st.push_bar(trade_date, close, high, vol, pct_chg)
+        if df_flow is not None and not df_flow.empty:
+            for code, net in df_flow[['ts_code', 'net_mf_amount']].itertuples(index=False):
+                st = states.get(code)
+                if st is None:
+                    st = states[code] = StockState(Config.BOX_DAYS, Config.VOL_MA_DAYS)
+                st.push_flow(trade_date, net)
+        self.date = trade_date
+
+    def save(self):
+        """落盘当前状态，并记录状态对应的日期和参数"""
+        if self.states is None or self.stale:
+            return
+        df = pd.DataFrame([st.row(code) for code, st in self.states.items()])
+        self.db.save_data(df, 'indicator_state', if_exists='replace')
+        self.db.set_meta('indicator_state_date', self.date or self.last_date)
+        self.db.set_meta('indicator_state_params', self.params_key())
+
+    def rebuild(self, panels):
+        """
+        从 日期×股票 矩阵 (load_panels 的结果) 一次性重建全部状态
+        每只股票按自己的K线右对齐后，逐根推进即可得到与增量更新完全相同的状态
+        """
+        print("🧱 正在重建滚动指标状态...")
+        close = panels['close']
+        codes = close.columns
+        rows = max(Config.BOX_DAYS, Config.VOL_MA_DAYS) + 1
+        aligned = {f: align_right(panels[f].reindex(columns=codes), rows).to_numpy()
+                   for f in ('close', 'high', 'vol', 'pct_chg')}
+        flow = panels['net_mf_amount'].reindex(columns=codes)
+        flow_aligned = align_right(flow, Config.FLOW_DAYS + 1).to_numpy()
+        bars = close.notna().sum().to_numpy()
+        last_dates = close.notna()[::-1].idxmax() if len(close) else pd.Series(dtype=object)
+        flow_dates = flow.notna()[::-1].idxmax() if len(flow) else pd.Series(dtype=object)
+
+        self.states = {}
+        self.stale = False
+        for j, code in enumerate(codes):
+            if bars[j] == 0:
+                continue
+            st = StockState(Config.BOX_DAYS, Config.VOL_MA_DAYS)
+            valid = np.nonzero(~np.isnan(aligned['close'][:, j]))[0]
+            # 窗口之外更早的K线只计数，序号从它们之后接着编
+            st.bars = int(bars[j]) - len(valid)
+            for r in valid:
+                st.push_bar(None, aligned['close'][r, j], aligned['high'][r, j],
+                            aligned['vol'][r, j], aligned['pct_chg'][r, j])
+            st.last_date = last_dates[code]
+
+            recent = flow_aligned[:, j]
+            recent = recent[~np.isnan(recent)]
+            for v in recent:
+                st.push_flow(None, v)
+            st.flow_date = flow_dates.get(code) if recent.size else None
+            self.states[code] = st
+
+        self.date = close.index[-1] if len(close) else None
+        self.save()
+        print(f"✅ 滚动指标状态重建完成: {len(self.states)} 只")
+
+    def next_levels(self):
+        """
+        每只股票下一根K线的判断基准 (index=ts_code)，见 StockState.next_levels
+            bars: 加上下一根K线后的K线数; flow_streak: 截至最近一天的资金连续净流入天数
+        """
+        rows = [
+            (code, st.bars + 1, st.flow_streak) + st.next_levels()
+            for code, st in self._load().items()
+        ]
+        df = pd.DataFrame(rows, columns=['ts_code', 'bars', 'flow_streak', 'box_high', 'vol_ma', 'close_n_ago'])
+        return df.set_index('ts_code')
+
+    def snapshot(self):
+        """每只股票一行的紧凑快照 (index=ts_code)，扫描只需对它做一次向量化判断"""
+        cols = ', '.join(SNAPSHOT_COLUMNS)
+        with self.db.engine.connect() as conn:
+            df = pd.read_sql(text(f"SELECT {cols} FROM indicator_state"), conn)
+        return df.set_index('ts_code')
@@ -0,0 +1,157 @@
+import time
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+
+
+class Job:
+    """
+    一个后台任务
+    listeners: 关心这个任务的会话 [{'chat_id', 'message_id', 'on_done'}]
+               相同任务重复提交时只追加 listener，不会重复执行
+    """
+
+    def __init__(self, job_id, key, name):
+        self.id = job_id
+        self.key = key
+        self.name = name
+        self.status = 'queued'      # queued / running / done / failed
+        self.progress_text = '排队中'
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.listeners = []
+        self.done_event = threading.Event()
+        self._last_edit = 0.0
+        self._manager = None
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+    def elapsed(self):
+        if not self.started:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def progress(self, text, force=False):
+        """更新进度；对应的 Telegram 消息原地编辑 (节流，避免触发限流)"""
+        self.progress_text = text
+        now = time.time()
+        if force or now - self._last_edit >= self._manager.edit_interval:
+            self._last_edit = now
+            self._manager.edit_listeners(self, f"⏳ {self.name}: {text}")
+
+    def wait(self, timeout=None):
+        self.done_event.wait(timeout)
+        return self
+
+
+class JobManager:
+    """
+    有界线程池的后台任务队列
+    - 同一个 key 在排队/执行中时再次提交，直接复用正在进行的任务 (不会重复计算)
+    - 同一 lock 组的任务串行执行 (例如数据同步和扫描共用一份 SQLite)
+    - edit_message(chat_id, message_id, text) 由调用方注入，用于原地刷新进度
+    """
+
+    def __init__(self, max_workers=2, edit_message=None, history=20, edit_interval=3.0):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.edit_message = edit_message
+        self.history = history
+        self.edit_interval = edit_interval
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.group_locks = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, key, name, fn, chat_id=None, message_id=None, on_done=None, lock_group=None):
+        """
+        提交任务，返回 (job, is_new)
+        fn(job) 在后台线程执行，返回值存入 job.result；
+        任务结束后对每个 listener 调用 on_done(job, chat_id)
+        """
+        with self.lock:
+            job = next((j for j in self.jobs.values() if j.key == key and j.active), None)
+            is_new = job is None
+            if is_new:
+                job = Job(next(self._ids), key, name)
+                job._manager = self
+                self.jobs[job.id] = job
+                self._trim()
+            if chat_id is not None or on_done is not None:
+                job.listeners.append({'chat_id': chat_id, 'message_id': message_id, 'on_done': on_done})
+
+        if is_new:
+            self.pool.submit(self._run, job, fn, lock_group)
+        return job, is_new
+
+    def _trim(self):
+        finished = [j for j in self.jobs.values() if not j.active]
+        for j in finished[:max(0, len(self.jobs) - self.history)]:
+            del self.jobs[j.id]
+
+    def group_lock(self, name):
+        """某个 lock 组的锁；任务以外的操作 (例如 /reset) 也可以持有它，与该组任务互斥"""
+        with self.lock:
+            return self.group_locks.setdefault(name, threading.Lock())
+
+    def _run(self, job, fn, lock_group):
+        group_lock = None
+        if lock_group:
+            group_lock = self.group_lock(lock_group)
+            if group_lock.locked():
+                job.progress('等待其他任务完成...', force=True)
+            group_lock.acquire()
+        status = 'failed'
+        try:
+            job.status = 'running'
+            job.started = time.time()
+            job.progress('开始执行', force=True)
+            job.result = fn(job)
+            status = 'done'
+        except Exception as e:
+            job.error = e
+            print(f"❌ 任务 {job.name} 失败: {e}")
+        finally:
+            job.finished = time.time()
+            if group_lock:
+                group_lock.release()
+
+        # 与 submit 的查重在同一把锁下切换状态，保证后来的 listener 不会漏掉回调
+        with self.lock:
+            job.status = status
+            listeners = list(job.listeners)
+
+        metrics.observe('quant_job_seconds', job.elapsed(), job=job.key.split(':')[0], status=status)
+
+        icon = '✅' if status == 'done' else '❌'
+        tail = f"完成 ({job.elapsed():.0f}s)" if status == 'done' else f"失败: {job.error}"
+        self.edit_listeners(job, f"{icon} {job.name}: {tail}")
+        job.done_event.set()
+        for listener in listeners:
+            if listener['on_done']:
+                try:
+                    listener['on_done'](job, listener['chat_id'])
+                except Exception as e:
+                    print(f"⚠️ 任务回调失败: {e}")
+
+    def edit_listeners(self, job, text):
+        if not self.edit_message:
+            return
+        for listener in list(job.listeners):
+            if listener['message_id'] is None:
+                continue
+            try:
+                self.edit_message(listener['chat_id'], listener['message_id'], text)
+            except Exception:
+                # 文本未变化等编辑失败不影响任务本身
+                pass
+
+    def list_jobs(self):
+        with self.lock:
+            return list(self.jobs.values())
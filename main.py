@@ -1,30 +1,69 @@
 # main.py
 import os
 import time
+import shutil
 import telebot
 import threading
+import pandas as pd
 from datetime import datetime, timedelta
-from flask import Flask, request, abort
+from flask import Flask, Response, request, abort
 from sqlalchemy import text
 from config import Config
 from data_manager import DataManager
-from strategy import StrategyAnalyzer
+from strategy import StrategyAnalyzer, SCREENS
+from backtest import Backtester, format_report
+from jobs import JobManager
+from metrics import metrics
+from monitor import MonitorRunner, FileFeed, TushareFeed, format_alerts
+from notification import TelegramOutbox
+from subscribers import SubscriberRegistry, filter_results, split_list
 
 # ==================== 初始化 Flask 和 Bot ====================
 app = Flask(__name__)
 bot = telebot.TeleBot(Config.TG_BOT_TOKEN)
+# 推送类消息 (结果 / 报告 / 告警) 走发送队列: 长连接 + 按会话限速 + 429 重发 + 自动分页
+outbox = TelegramOutbox(Config.TG_BOT_TOKEN)
 
 # 初始化数据和策略模块
 dm = DataManager()
 strategy = StrategyAnalyzer(dm)
+# 订阅者 (每日报告按各自偏好过滤后推送)；管理员 TG_CHAT_ID 始终是第一个订阅者
+subscribers = SubscriberRegistry(dm.db)
+if Config.TG_CHAT_ID:
+    subscribers.ensure(Config.TG_CHAT_ID, 'admin')
 
 
-def is_authorized(message):
-    """只允许配置的 chat_id 使用"""
-    if str(message.chat.id) != Config.TG_CHAT_ID:
-        bot.reply_to(message, "⛔️ 无权访问")
-        return False
-    return True
+def edit_message(chat_id, message_id, text):
+    bot.edit_message_text(text, chat_id, message_id)
+
+
+# 后台任务队列: /update /scan /backtest 都在这里执行，webhook 线程只负责提交
+jobs = JobManager(max_workers=Config.JOB_WORKERS, edit_message=edit_message)
+
+
+def make_feed(codes):
+    """盘中行情源: 配置了 MONITOR_FEED 文件就回放，否则轮询实时行情"""
+    if Config.MONITOR_FEED:
+        return FileFeed(Config.MONITOR_FEED, speed=1)
+    return TushareFeed(codes)
+
+
+def send_alerts(alerts):
+    outbox.send(Config.TG_CHAT_ID, format_alerts(alerts), parse_mode='Markdown')
+
+
+# 盘中突破监控: 独立常驻线程，触发后几秒内推送
+# 传入取库函数而不是 dm.db: /reset 之后 dm 会被整体替换
+monitor = MonitorRunner(lambda: dm.db, make_feed, send_alerts)
+
+
+def is_authorized(message, admin=False):
+    """管理员 (TG_CHAT_ID) 可用全部命令；订阅者只能用查询类命令 (admin=False)"""
+    chat_id = str(message.chat.id)
+    if chat_id == Config.TG_CHAT_ID or (not admin and subscribers.is_subscriber(chat_id)):
+        return True
+    bot.reply_to(message, "⛔️ 无权访问")
+    return False
 
 
 # ==================== 命令处理 ====================
@@ -40,35 +79,65 @@ def send_welcome(message):
         "2️⃣ **第二步**：发送 `/update`\n"
         "   (下载最近60天数据，约需2分钟)\n\n"
         "3️⃣ **第三步**：发送 `/scan`\n"
-        "   (极速选股，秒出结果)\n\n"
+        "   (极速选股，秒出结果)\n"
+        f"   其他模型: `/scan <名字>` 或 `/scan all` ({screen_names()})\n\n"
         "🔍 `/info` - 查看数据库健康状态\n"
-        "🔍 `/check 600519.SH` - 实时诊断单股"
+        "🔍 `/check 600519.SH 000001.SZ` - 诊断个股 (可一次多只)\n"
+        "🧵 `/jobs` - 查看后台任务进度\n"
+        "⏱️ `/stats` - 各阶段耗时统计\n"
+        "⚡️ `/monitor on|off` - 盘中突破实时监控\n"
+        "📬 `/sub` - 日报订阅偏好 (板块 / 评分 / 数量 / 推送时间)\n"
+        "📈 `/backtest 20240101 20241231 5` - 历史回测 (持有5天)\n"
+        "🧹 `/maintain [vacuum]` - 裁剪过期数据 + 整理数据库"
     )
     bot.reply_to(message, msg, parse_mode='Markdown')
 
 
 @bot.message_handler(commands=['reset'])
 def handle_reset(message):
-    if not is_authorized(message):
+    global dm, strategy, subscribers
+    if not is_authorized(message, admin=True):
         return
     
-    bot.reply_to(message, "⚠️ 正在重置系统... (删除脏数据)")
-    db_path = '/app/data/quant.db'
-    
+    # 整个重置期间持有 'data' 组锁: 同步 / 扫描 / 维护等任务要么已结束，要么排队等重置完成后用新库执行
+    data_lock = jobs.group_lock('data')
+    if not data_lock.acquire(blocking=False):
+        bot.reply_to(message, "⛔️ 有后台任务正在执行，请用 /jobs 查看，结束后再重置")
+        return
+
     try:
+        bot.reply_to(message, "⚠️ 正在重置系统... (删除脏数据)")
+        db_path = '/app/data/quant.db'
+        # 订阅者不是行情数据，重建数据库后原样恢复
+        saved_subscribers = subscribers.list(active_only=False)
+
+        # 监控线程持有旧库的触发价位，删库前先停掉
+        if monitor.running and not monitor.stop(timeout=10):
+            bot.reply_to(message, "⛔️ 盘中监控未能停止，请先 `/monitor off` 再重置", parse_mode='Markdown')
+            return
         if os.path.exists(db_path):
             os.remove(db_path)
-            bot.send_message(message.chat.id, "🗑️ 旧数据库文件已删除。")
-        
-        global dm, strategy
+            outbox.send(message.chat.id, "🗑️ 旧数据库文件已删除。")
+        # WAL 模式的日志文件随库一起删掉，避免被新库误用
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        # 列式行情库由数据库派生，一并清掉
+        shutil.rmtree(dm.store.root, ignore_errors=True)
+
         dm = DataManager()
         strategy = StrategyAnalyzer(dm)
+        subscribers = SubscriberRegistry(dm.db)
+        if saved_subscribers:
+            dm.db.save_data(pd.DataFrame(saved_subscribers), 'subscribers')
         
-        bot.send_message(message.chat.id,
-                         "✅ **重置成功！**\n请立即发送 `/update` 重新下载最近 60 天的数据。",
-                         parse_mode='Markdown')
+        outbox.send(message.chat.id,
+                    "✅ **重置成功！**\n请立即发送 `/update` 重新下载最近 60 天的数据。",
+                    parse_mode='Markdown')
     except Exception as e:
         bot.reply_to(message, f"❌ 重置失败: {e}")
+    finally:
+        data_lock.release()
 
 
 @bot.message_handler(commands=['info'])
@@ -87,71 +156,202 @@ def handle_info(message):
             f"📊 **数据库状态**\n"
             f"------------------\n"
             f"📅 日期范围: `{min_date}` -> `{max_date}`\n"
-            f"🔢 总数据量: `{count}` 行\n\n"
-            f"💡 *正确状态*: 开始日期应为2025年9月左右，结束日期应为最新交易日。"
+            f"🔢 总数据量: `{count}` 行\n"
         )
+
+        # 对照交易日历的完整性 (同步台账)
+        if max_date:
+            info = dm.ledger.summary(max_date)
+            msg += f"✅ 完整交易日: `{info['complete']}/{info['sessions']}`\n"
+            labels = {'missing': '缺失', 'failed': '下载失败', 'short': '行数偏少'}
+            for status, n in info['counts'].items():
+                msg += f"⚠️ {labels.get(status, status)}: `{n}` 天\n"
+            if info['bad_dates']:
+                msg += f"🩹 待补日期: `{', '.join(info['bad_dates'][:10])}`{' ...' if len(info['bad_dates']) > 10 else ''}\n"
+                msg += "   (下次 /update 自动补齐"
+                msg += f"，其中 {len(info['gave_up'])} 天已多次补下载仍不完整)\n" if info['gave_up'] else ")\n"
+        size = dm.retention.stats()
+        msg += f"💾 数据库: `{size['size_mb']:.1f}MB` (空闲 {size['free_ratio']:.0%}, WAL `{size['wal_mb']:.1f}MB`)\n"
+        msg += f"🧹 上次 VACUUM: `{dm.db.get_meta('last_vacuum', '无')}`\n"
+        msg += f"\n💡 *正确状态*: 结束日期应为最新交易日，且没有待补日期。"
         bot.reply_to(message, msg, parse_mode='Markdown')
     except Exception as e:
         bot.reply_to(message, f"❌ 查询失败(可能是空库): {e}")
 
 
+def run_update(job):
+    return dm.sync_data(lookback_days=Config.BOX_DAYS + 10, progress=job.progress)
+
+
+def screen_names():
+    return ', '.join(f"{name} {s.title}" for name, s in SCREENS.items())
+
+
+def scan_job(names):
+    """返回跑一组模型的任务函数 (所有模型共享一次数据读取)，结果为 {模型名: 结果列表}"""
+    def run(job):
+        return strategy.run_screens(names, progress=job.progress)
+    return run
+
+
+def submit_job(message, key, name, fn, on_done, lock_group=None):
+    """把重活丢进后台队列，webhook 线程立即返回；已有相同任务时直接挂上去等结果"""
+    status = bot.reply_to(message, f"✅ 已收到，{name}已加入后台队列...")
+    job, is_new = jobs.submit(key, name, fn, chat_id=message.chat.id, message_id=status.message_id,
+                              on_done=on_done, lock_group=lock_group)
+    if not is_new:
+        edit_message(message.chat.id, status.message_id,
+                     f"♻️ {name}已在进行中 ({job.progress_text})，完成后会一并通知你")
+    return job
+
+
+def reply_update(job, chat_id):
+    if job.status != 'done':
+        outbox.send(chat_id, f"❌ 严重错误: {job.error}")
+        return
+
+    success, fail, err = job.result
+    latest_date = dm.db.check_latest_date('daily_price')
+
+    msg = f"✅ **同步流程结束**\n\n"
+    msg += f"📅 数据库最新日期: `{latest_date}`\n"
+    msg += f"📥 成功下载: `{success}` 天\n"
+
+    if fail > 0:
+        msg += f"❌ **失败天数**: `{fail}` 天\n"
+        msg += f"⚠️ 错误原因: `{err}`\n"
+        msg += "建议：请稍后再次执行 `/update` 补全缺失数据。"
+    else:
+        msg += "🎉 所有数据已是最新！\n快去试试 `/scan` 吧！"
+
+    outbox.send(chat_id, msg, parse_mode='Markdown')
+    print(f"✅ 用户 /update 完成: 成功 {success} 天, 失败 {fail} 天")
+
+
+def reply_scan(job, chat_id):
+    if job.status != 'done':
+        outbox.send(chat_id, f"❌ 扫描过程崩溃: {job.error}")
+        return
+
+    total = sum(len(results) for results in job.result.values())
+    if not total:
+        outbox.send(chat_id, "📅 扫描完成，今日无符合模型的标的。")
+    else:
+        # 完整结果自动分页 (每只股票一段，不会被拆到两条消息里)
+        blocks = []
+        for name, results in job.result.items():
+            blocks.append(f"🚀 **{SCREENS[name].title}** ({len(results)}只)\n")
+            for s in results:
+                block = f"🐂 **{s['name']}** (`{s['ts_code']}`)\n"
+                block += f"   现价: `{s['price']}`\n"
+                block += f"   理由: {s['reason']}\n"
+                blocks.append(block)
+        outbox.send_pages(chat_id, blocks, parse_mode='Markdown')
+
+    print(f"🏁 用户 /scan 完成，最终选中 {total} 只")
+
+
 @bot.message_handler(commands=['update'])
 def handle_update(message):
-    if not is_authorized(message):
+    if not is_authorized(message, admin=True):
         return
-    
-    bot.reply_to(message, "✅ 已收到 /update 命令，正在后台同步数据（预计2-5分钟）...")
     print("🔄 用户手动触发 /update，开始同步数据...")
-    
-    try:
-        success, fail, err = dm.sync_data(lookback_days=Config.BOX_DAYS + 10)
-        latest_date = dm.db.check_latest_date('daily_price')
-        
-        msg = f"✅ **同步流程结束**\n\n"
-        msg += f"📅 数据库最新日期: `{latest_date}`\n"
-        msg += f"📥 成功下载: `{success}` 天\n"
-
-        if fail > 0:
-            msg += f"❌ **失败天数**: `{fail}` 天\n"
-            msg += f"⚠️ 错误原因: `{err}`\n"
-            msg += "建议：请稍后再次执行 `/update` 补全缺失数据。"
-        else:
-            msg += "🎉 所有数据已是最新！\n快去试试 `/scan` 吧！"
-
-        bot.reply_to(message, msg, parse_mode='Markdown')
-        print(f"✅ 用户 /update 完成: 成功 {success} 天, 失败 {fail} 天")
-        
-    except Exception as e:
-        bot.reply_to(message, f"❌ 严重错误: {e}")
-        print(f"❌ 用户 /update 异常: {e}")
+    submit_job(message, 'update', '数据同步', run_update, reply_update, lock_group='data')
 
 
 @bot.message_handler(commands=['scan'])
 def handle_scan(message):
     if not is_authorized(message):
         return
-    
-    bot.reply_to(message, "✅ 已收到 /scan 命令，正在分析最新数据，请稍候...")
-    print("🚀 用户手动触发 /scan，开始策略分析...")
-    
-    try:
-        results = strategy.run_daily_scan()
-        
-        if not results:
-            bot.send_message(message.chat.id, "📅 扫描完成，今日无符合模型的标的。")
-        else:
-            msg = f"🚀 **选股结果** ({len(results)}只)\n\n"
-            for s in results[:10]:
-                msg += f"🐂 **{s['name']}** (`{s['ts_code']}`)\n"
-                msg += f"   现价: `{s['price']}`\n"
-                msg += f"   理由: {s['reason']}\n\n"
-            bot.send_message(message.chat.id, msg, parse_mode='Markdown')
-        
-        print(f"🏁 用户 /scan 完成，最终选中 {len(results)} 只")
-        
-    except Exception as e:
-        bot.send_message(message.chat.id, f"❌ 扫描过程崩溃: {str(e)}")
-        print(f"❌ 用户 /scan 异常: {e}")
+    # /scan → 箱体突破；/scan pullback dryup → 指定模型；/scan all → 全部模型
+    args = message.text.split()[1:]
+    names = list(SCREENS) if args == ['all'] else (args or ['breakout'])
+    unknown = [n for n in names if n not in SCREENS]
+    if unknown:
+        bot.reply_to(message, f"❓ 未知模型: {', '.join(unknown)}\n可选: {screen_names()}")
+        return
+    print(f"🚀 用户手动触发 /scan {' '.join(names)}，开始策略分析...")
+    submit_job(message, 'scan:' + ','.join(names), '选股扫描', scan_job(names), reply_scan, lock_group='data')
+
+
+@bot.message_handler(commands=['jobs'])
+def handle_jobs(message):
+    if not is_authorized(message):
+        return
+
+    all_jobs = jobs.list_jobs()
+    if not all_jobs:
+        bot.reply_to(message, "📭 暂无后台任务")
+        return
+
+    icons = {'queued': '🕒', 'running': '⏳', 'done': '✅', 'failed': '❌'}
+    msg = "🧵 **后台任务**\n------------------\n"
+    for job in reversed(all_jobs[-10:]):
+        started = datetime.fromtimestamp(job.created).strftime('%H:%M:%S')
+        msg += f"{icons[job.status]} #{job.id} {job.name} ({started}, {job.elapsed():.0f}s)\n"
+        if job.active:
+            msg += f"   {job.progress_text}\n"
+        elif job.status == 'failed':
+            msg += f"   {job.error}\n"
+    bot.reply_to(message, msg, parse_mode='Markdown')
+
+
+def format_check(code, row):
+    """单只股票的详细诊断"""
+    mark = lambda ok: '✅' if ok else '❌'
+    vol_ratio = round(row['vol'] / row['vol_ma'], 1) if row['vol_ma'] > 0 else 0
+    rs_rank = '' if pd.isna(row.get('rs_rank')) else f", 全市场RS排名 `{row['rs_rank']:.0f}`"
+    return (
+        f"📊 **{code} 诊断结果** {'🎯 入选' if row['signal'] else ''}\n"
+        f"现价: `{row['close']}` ({'本地数据' if row['source'] == 'local' else '联网数据'})\n"
+        f"------------------\n"
+        f"1. 突破箱体: {mark(row['breakout'])}\n"
+        f"   (上沿 `{row['box_high']:.2f}`)\n"
+        f"2. 有效放量: {mark(row['volume'])}\n"
+        f"   (量比 `{vol_ratio}`)\n"
+        f"3. 跑赢大盘: {mark(row['rs'])}\n"
+        f"   (个股 `{row['stock_ret']:.2%}` / 基准 `{row['benchmark_ret']:.2%}`{rs_rank})\n"
+        f"4. 资金连续流入: {mark(row['flow_ok'])}"
+    )
+
+
+@bot.message_handler(commands=['stats'])
+def handle_stats(message):
+    if not is_authorized(message):
+        return
+
+    rows = metrics.stage_summary()
+    if not rows:
+        bot.reply_to(message, "📭 暂无统计数据，先执行一次 /update 或 /scan")
+        return
+
+    msg = "⏱️ **各阶段耗时** (次数 | 最近 | p50 | p95)\n------------------\n"
+    for r in rows:
+        msg += f"`{r['stage']}` {r['count']} | {r['last']:.2f}s | {r['p50']:.2f}s | {r['p95']:.2f}s\n"
+
+    calls = metrics.counter_values('quant_api_calls_total')
+    hits = metrics.counter_values('quant_api_cache_hits_total')
+    if calls or hits:
+        msg += "\n🌐 **接口调用** (联网 / 命中缓存)\n"
+        for endpoint in sorted(set(calls) | set(hits)):
+            msg += f"`{endpoint}` {calls.get(endpoint, 0)} / {hits.get(endpoint, 0)}\n"
+
+    rows_written = metrics.counter_values('quant_rows_written_total')
+    rows_read = metrics.counter_values('quant_db_rows_read_total')
+    if rows_written or rows_read:
+        msg += "\n🗄️ **数据库行数** (写入 / 读取)\n"
+        for table in sorted(set(rows_written) | set(rows_read)):
+            msg += f"`{table}` {rows_written.get(table, 0)} / {rows_read.get(table, 0)}\n"
+
+    scan_cache = metrics.counter_values('quant_scan_cache_total')
+    if scan_cache:
+        msg += f"\n⚡️ 扫描缓存: 命中 {scan_cache.get('hit', 0)} / 未命中 {scan_cache.get('miss', 0)}"
+
+    sent = metrics.counter_values('quant_telegram_messages_total')
+    if sent:
+        msg += (f"\n📨 推送: 成功 {sent.get('sent', 0)} / 限流重发 {sent.get('throttled', 0)} / "
+                f"失败 {sent.get('failed', 0)}，队列中 {outbox.pending()}")
+    bot.reply_to(message, msg, parse_mode='Markdown')
 
 
 @bot.message_handler(commands=['check'])
@@ -159,46 +359,380 @@ def handle_check(message):
     if not is_authorized(message):
         return
     
+    # 支持一次诊断多只: /check 600519.SH 000001.SZ,300750.SZ ...
+    codes = [c.upper() for c in message.text.replace(',', ' ').split()[1:]]
+    if not codes:
+        bot.reply_to(message, "用法：/check 600519.SH [000001.SZ ...]")
+        return
+
+    def run(job):
+        # 本地数据过期时会回退到网络接口，且要读列式库 / 指标状态: 放进后台队列，与同步 / 维护串行
+        t0 = time.time()
+        return strategy.diagnose(codes), time.time() - t0
+
+    def reply(job, chat_id):
+        if job.status != 'done':
+            outbox.send(chat_id, f"Error: {job.error}")
+            return
+        res, elapsed = job.result
+        not_found = [c for c in codes if c not in res.index]
+
+        if len(res) == 1:
+            code = res.index[0]
+            outbox.send(chat_id, format_check(code, res.loc[code]), parse_mode='Markdown')
+        elif len(res) > 1:
+            # 批量: 每只一行 (突破/放量/RS/资金)，按入选和满足条数排序
+            rules = ['breakout', 'volume', 'rs', 'flow_ok']
+            res = res.assign(hits=res[rules].sum(axis=1)).sort_values(['signal', 'hits'], ascending=False)
+            lines = [f"📊 **批量诊断** ({len(res)}只, {elapsed:.2f}s)",
+                     "突破/放量/RS/资金", "------------------"]
+            for code, row in res.iterrows():
+                marks = ''.join('✅' if row[r] else '❌' for r in rules)
+                lines.append(f"{'🎯' if row['signal'] else '▫️'} `{code}` {marks} `{row['close']}`")
+            outbox.send_pages(chat_id, lines, parse_mode='Markdown')
+
+        if not_found:
+            outbox.send(chat_id, f"❌ 未获取到数据: {', '.join(not_found)}")
+
+    submit_job(message, 'check:' + ','.join(codes), '个股诊断', run, reply, lock_group='data')
+
+
+@bot.message_handler(commands=['backtest'])
+def handle_backtest(message):
+    if not is_authorized(message, admin=True):
+        return
+
+    args = message.text.split()[1:]
+    if len(args) < 2:
+        bot.reply_to(message, "用法：/backtest 20240101 20241231 [持有天数] [止损] [止盈]\n例如 `/backtest 20240101 20241231 5 0.08 0.2`",
+                     parse_mode='Markdown')
+        return
+
+    start, end = args[0], args[1]
     try:
-        code = message.text.split()[1].upper()
-    except:
-        bot.reply_to(message, "用法：/check 600519.SH")
+        hold = int(args[2]) if len(args) > 2 else 5
+        sl = float(args[3]) if len(args) > 3 else None
+        tp = float(args[4]) if len(args) > 4 else None
+    except ValueError:
+        bot.reply_to(message, "❌ 参数格式错误")
+        return
+
+    def run(job):
+        job.progress("读取历史行情")
+        return Backtester(dm).run(start, end, hold_days=hold, stop_loss=sl, take_profit=tp)
+
+    def reply(job, chat_id):
+        if job.status != 'done':
+            outbox.send(chat_id, f"❌ 回测失败: {job.error}")
+            return
+        report, _ = job.result
+        outbox.send(chat_id, format_report(report, start, end, hold), parse_mode='Markdown')
+
+    # 回测整段读取列式库，与同步 / 维护改写 mmap 文件串行
+    submit_job(message, f"backtest:{start}:{end}:{hold}:{sl}:{tp}", '历史回测', run, reply, lock_group='data')
+
+
+@bot.message_handler(commands=['monitor'])
+def handle_monitor(message):
+    if not is_authorized(message, admin=True):
+        return
+
+    args = message.text.split()[1:]
+    if args == ['on']:
+        if not dm.db.get_meta('trigger_levels_date'):
+            bot.reply_to(message, "⚠️ 还没有触发价位，请先执行 /update")
+        elif monitor.start():
+            st = monitor.status()
+            bot.reply_to(message, f"👀 盘中监控已启动: {st['watched']} 只 (触发价位日期 {st['levels_date']})")
+        else:
+            bot.reply_to(message, "♻️ 盘中监控已在运行中")
+        return
+    if args == ['off']:
+        monitor.stop()
+        bot.reply_to(message, "🛑 盘中监控将在本轮快照后停止")
+        return
+
+    st = monitor.status()
+    msg = f"⚡️ **盘中监控** {'运行中' if st['running'] else '未运行'}\n"
+    msg += f"📅 触发价位日期: `{st['levels_date']}`\n"
+    if st['started']:
+        msg += f"🕘 启动于 {st['started']}，监控 {st['watched']} 只\n"
+        msg += f"📶 已处理 {st['ticks']} 个 tick，触发 {st['alerted']} 只\n"
+    if st['error']:
+        msg += f"❌ 异常: {st['error']}\n"
+    msg += "\n用法: `/monitor on` / `/monitor off`"
+    bot.reply_to(message, msg, parse_mode='Markdown')
+
+
+def format_subscriber(sub):
+    return (
+        f"📬 **日报订阅** `{sub['chat_id']}` {'✅ 已启用' if sub['active'] else '⏸️ 已暂停'}\n"
+        f"📂 板块: {sub['sectors'] or '不限'}\n"
+        f"🧩 模型: {sub['screens'] or ','.join(Config.DAILY_SCREENS)}\n"
+        f"📊 最低评分: `{sub['min_score']}`\n"
+        f"🔢 每个模型最多: `{sub['max_names'] or '不限'}`\n"
+        f"⏰ 推送时间: `{sub['delivery_time'] or '扫描完成后立即'}`\n"
+    )
+
+
+SUB_USAGE = (
+    "用法:\n"
+    "`/sub sectors 计算机,电子` (`all` 不限)\n"
+    "`/sub screens breakout,pullback` (`all` 为默认)\n"
+    "`/sub min 60` / `/sub max 10` (0 不限)\n"
+    "`/sub time 08:30` (`now` 扫描完立即推送)\n"
+    "`/sub on` / `/sub off`\n"
+    "管理员: `/sub add <chat_id>` / `/sub del <chat_id>` / `/sub list`"
+)
+
+
+@bot.message_handler(commands=['sub'])
+def handle_sub(message):
+    # 暂停了的订阅者也要能 /sub on 恢复，所以按是否登记过判断
+    chat_id = str(message.chat.id)
+    if chat_id == Config.TG_CHAT_ID:
+        subscribers.ensure(chat_id, 'admin')
+    elif subscribers.get(chat_id) is None:
+        bot.reply_to(message, "⛔️ 无权访问")
+        return
+
+    args = message.text.split(maxsplit=2)[1:]
+    cmd = args[0].lower() if args else ''
+    value = args[1].strip() if len(args) > 1 else ''
+
+    # 管理员维护订阅名单
+    if cmd in ('add', 'del', 'list'):
+        if not is_authorized(message, admin=True):
+            return
+        if cmd == 'list':
+            msg = "📬 **订阅者**\n------------------\n"
+            for sub in subscribers.list(active_only=False):
+                msg += (f"{'✅' if sub['active'] else '⏸️'} `{sub['chat_id']}` {sub['name']} "
+                        f"(最近推送 {sub['last_sent'] or '无'})\n")
+            bot.reply_to(message, msg, parse_mode='Markdown')
+        elif not value:
+            bot.reply_to(message, SUB_USAGE, parse_mode='Markdown')
+        elif cmd == 'add':
+            target, _, name = value.partition(' ')
+            subscribers.ensure(target, name)
+            subscribers.update(target, active=1)
+            bot.reply_to(message, f"✅ 已添加订阅者 {target}")
+        else:
+            n = subscribers.remove(value)
+            bot.reply_to(message, f"🗑️ 已删除订阅者 {value}" if n else f"❓ 没有订阅者 {value}")
         return
 
-    bot.reply_to(message, f"🔍 正在联网诊断 `{code}` ...", parse_mode='Markdown')
     try:
-        trade_date = dm.get_trade_date()
-        df = dm.pro.daily(ts_code=code, end_date=trade_date, limit=Config.BOX_DAYS + 10)
-        
-        if df.empty:
-            bot.send_message(message.chat.id, "❌ 未获取到数据")
+        if cmd == 'sectors':
+            names = split_list(value.replace(' ', ','))
+            if names == ['all']:
+                names = []
+            known = set(dm.industries.labels())
+            unknown = [n for n in names if n not in known]
+            if unknown:
+                bot.reply_to(message, f"❓ 未知板块: {', '.join(unknown)}\n可选: {', '.join(sorted(known))}")
+                return
+            subscribers.update(chat_id, sectors=','.join(names))
+        elif cmd == 'screens':
+            names = split_list(value.replace(' ', ','))
+            if names == ['all']:
+                names = []
+            unknown = [n for n in names if n not in SCREENS]
+            if unknown:
+                bot.reply_to(message, f"❓ 未知模型: {', '.join(unknown)}\n可选: {screen_names()}")
+                return
+            subscribers.update(chat_id, screens=','.join(names))
+        elif cmd in ('min', 'max'):
+            subscribers.update(chat_id, **{'min_score' if cmd == 'min' else 'max_names': max(0, int(value))})
+        elif cmd == 'time':
+            if value != 'now':
+                datetime.strptime(value, '%H:%M')
+            subscribers.update(chat_id, delivery_time='' if value == 'now' else value)
+        elif cmd in ('on', 'off'):
+            subscribers.update(chat_id, active=int(cmd == 'on'))
+        elif cmd:
+            bot.reply_to(message, SUB_USAGE, parse_mode='Markdown')
             return
+    except ValueError:
+        bot.reply_to(message, "❌ 参数格式错误\n" + SUB_USAGE, parse_mode='Markdown')
+        return
 
-        curr = df.iloc[0]
-        past = df.iloc[1:Config.BOX_DAYS + 1]
-        
-        box_high = past['high'].max()
-        vol_ma20 = past['vol'].head(20).mean()
-        
-        is_breakout = curr['close'] > box_high * 1.01
-        is_vol = curr['vol'] > vol_ma20 * 1.5
+    sub = subscribers.get(chat_id)
+    bot.reply_to(message, format_subscriber(sub) + ("" if cmd else "\n" + SUB_USAGE), parse_mode='Markdown')
+
+
+def maintenance_job(vacuum=None):
+    def run(job):
+        return dm.retention.run(vacuum=vacuum, progress=job.progress)
+    return run
 
-        res = (
-            f"📊 **{code} 诊断结果**\n"
-            f"现价: `{curr['close']}`\n"
-            f"------------------\n"
-            f"1. 突破箱体: {'✅' if is_breakout else '❌'}\n"
-            f"   (上沿 `{box_high:.2f}`)\n"
-            f"2. 有效放量: {'✅' if is_vol else '❌'}\n"
-            f"   (量比 `{round(curr['vol']/vol_ma20, 1) if vol_ma20 > 0 else 0}`)"
-        )
-        bot.send_message(message.chat.id, res, parse_mode='Markdown')
-    except Exception as e:
-        bot.send_message(message.chat.id, f"Error: {e}")
+
+def reply_maintenance(job, chat_id):
+    if job.status != 'done':
+        outbox.send(chat_id, f"❌ 数据维护失败: {job.error}")
+        return
+    res = job.result
+    msg = "🧹 **数据维护完成**\n------------------\n"
+    for table, n in res['deleted'].items():
+        if n:
+            msg += f"✂️ `{table}` 删除 {n} 行\n"
+    msg += f"💾 `{res['before']['size_mb']:.1f}MB` -> `{res['after']['size_mb']:.1f}MB`"
+    msg += " (已 VACUUM)" if res['vacuumed'] else ""
+    outbox.send(chat_id, msg, parse_mode='Markdown')
+
+
+@bot.message_handler(commands=['maintain'])
+def handle_maintain(message):
+    if not is_authorized(message, admin=True):
+        return
+    # /maintain → 裁剪 + ANALYZE，按需 VACUUM；/maintain vacuum → 强制 VACUUM
+    vacuum = True if message.text.split()[1:] == ['vacuum'] else None
+    submit_job(message, 'maintenance', '数据维护', maintenance_job(vacuum), reply_maintenance, lock_group='data')
+
+
+# ==================== 数据维护 (每天 MAINTENANCE_TIME) ====================
+
+def maintenance_auto_task():
+    """每天凌晨裁剪过期数据并整理数据库；与同步 / 扫描同一锁组，不会同时运行"""
+    while True:
+        hour, minute = map(int, Config.MAINTENANCE_TIME.split(':'))
+        now = datetime.now()
+        next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if now >= next_run:
+            next_run += timedelta(days=1)
+        time.sleep((next_run - datetime.now()).total_seconds())
+
+        try:
+            job, _ = jobs.submit('maintenance', '自动数据维护', maintenance_job(), lock_group='data')
+            job.wait()
+            if job.status != 'done':
+                raise job.error
+        except Exception as e:
+            print(f"❌ 自动数据维护失败: {e}")
+
+
+# ==================== 盘中监控自动启动 ====================
+
+def monitor_auto_task():
+    """MONITOR_AUTO=1 时，每个交易日 09:25 自动启动盘中监控 (行情源 15:00 后自动结束)"""
+    while True:
+        now = datetime.now()
+        next_run = now.replace(hour=9, minute=25, second=0, microsecond=0)
+        if now >= next_run:
+            next_run += timedelta(days=1)
+        time.sleep((next_run - datetime.now()).total_seconds())
+
+        try:
+            today_str = datetime.now().strftime('%Y%m%d')
+            if not dm.calendar.is_open(today_str):
+                continue
+            if monitor.start():
+                st = monitor.status()
+                outbox.send(Config.TG_CHAT_ID, f"👀 盘中监控已自动启动: {st['watched']} 只")
+        except Exception as e:
+            print(f"❌ 盘中监控自动启动失败: {e}")
 
 
 # ==================== 自动每日任务（下载数据 + 选股 + 推送） ====================
 
+def build_report(trade_date, results):
+    """日报: (标题, 每只股票一段)，每个模型一节；超长由发送队列自动分页"""
+    total = sum(len(picks) for picks in results.values())
+    if not total:
+        return f"📅 {trade_date} \n\n今日无符合模型的标的。\n保持观察，耐心等待主升浪！", []
+
+    header = f"🚀 **量化选股日报** ({trade_date})\n"
+    header += f"共选中 {total} 只优质标的\n"
+    header += f"========================\n"
+    blocks = []
+    for name, picks in results.items():
+        blocks.append(f"📌 **{SCREENS[name].title}** ({len(picks)}只)" + ("\n   今日无标的\n" if not picks else ""))
+        for s in picks:
+            block = f"🔥 **{s['name']}** (`{s['ts_code']}`)\n"
+            block += f"   💰 现价: {s['price']}\n"
+            block += f"   💡 理由: {s['reason']}\n"
+            blocks.append(block)
+    return header, blocks
+
+
+# 检查 last_sent 与推送之间不能被另一路推送 (重启补发 / 当天任务) 插进来
+report_lock = threading.Lock()
+
+
+def send_report(chat_id, trade_date, results, sectors=None):
+    """
+    按订阅者当前的偏好过滤后推送一份日报 (到点时才读偏好，等待期间改的偏好 / 退订同样生效)
+    该交易日 (或更新的) 已推送过则跳过，返回是否发送
+    """
+    with report_lock:
+        sub = subscribers.get(chat_id)
+        if not sub or not sub['active'] or sub['last_sent'] >= trade_date:
+            return False
+        if sub['sectors'] and sectors is None:
+            sectors = dm.industries.labels().to_dict()
+        picks = filter_results(results, sub, sectors)
+        header, blocks = build_report(trade_date, picks)
+        outbox.send_pages(sub['chat_id'], blocks, header, parse_mode='Markdown')
+        subscribers.mark_sent(sub['chat_id'], trade_date)
+    print(f"✅ 日报已推送给 {chat_id} ({sum(len(p) for p in picks.values())} 只)")
+    return True
+
+
+def send_report_later(chat_id, trade_date, results):
+    """定时器线程里执行的推送，出错只记日志"""
+    try:
+        send_report(chat_id, trade_date, results)
+    except Exception as e:
+        print(f"❌ 定时日报推送失败 ({chat_id}): {e}")
+
+
+def deliver_reports(trade_date, results, run_start):
+    """
+    扫描结果只算一次，逐个订阅者在内存里过滤后推送
+    delivery_time 还没到的订阅者各挂一个定时器到点再发，不占用每日任务线程
+    定时器只在内存里，进程重启后由 catch_up_reports 补上
+    """
+    sectors = None
+    sent = scheduled = 0
+    for due, sub in subscribers.schedule(run_start):
+        if sub['last_sent'] >= trade_date:
+            continue
+        wait = (due - datetime.now()).total_seconds()
+        if wait > 0:
+            timer = threading.Timer(wait, send_report_later, args=(sub['chat_id'], trade_date, results))
+            timer.daemon = True
+            timer.start()
+            scheduled += 1
+            print(f"⏰ 订阅者 {sub['chat_id']} 的日报将在 {due.strftime('%m-%d %H:%M')} 推送")
+            continue
+        if sub['sectors'] and sectors is None:
+            sectors = dm.industries.labels().to_dict()
+        sent += send_report(sub['chat_id'], trade_date, results, sectors)
+    print(f"✅ 自动日报推送完成: {sent} 位订阅者，{scheduled} 位定时推送")
+
+
+def catch_up_reports():
+    """
+    启动时补发: 最近交易日的扫描缓存还有效、但 last_sent 更早的活跃订阅者
+    推送时间已过的立即发，未到的重新挂定时器 (按当天 17:00 任务的口径排定)
+    """
+    try:
+        trade_date = dm.get_trade_date()
+        if not any(sub['last_sent'] < trade_date for sub in subscribers.list()):
+            return
+        results = {}
+        for name in subscribers.screens():
+            results[name] = dm.scan_cache.get(trade_date, name)
+            if results[name] is None:
+                print(f"📭 {trade_date} 没有可用的扫描缓存 ({name})，等每日任务推送")
+                return
+        print(f"📬 补发 {trade_date} 的日报...")
+        run_start = datetime.strptime(trade_date, '%Y%m%d').replace(hour=17)
+        deliver_reports(trade_date, results, run_start)
+    except Exception as e:
+        print(f"❌ 日报补发失败: {e}")
+
+
 def daily_auto_task():
     """每天下午17:00自动执行：更新数据 → 选股 → 推送报告"""
     def get_next_run_time():
@@ -219,53 +753,49 @@ def daily_auto_task():
             today_str = datetime.now().strftime('%Y%m%d')
             print(f"🕔 {today_str} 到达自动任务时间，开始执行...")
 
-            # 1. 检查是否为交易日
-            cal = dm.pro.trade_cal(exchange='', start_date=today_str, end_date=today_str)
-            if cal.empty or cal.iloc[0]['is_open'] == 0:
+            # 1. 检查是否为交易日 (本地日历)
+            if not dm.calendar.is_open(today_str):
                 print(f"📅 {today_str} 非交易日，跳过本次自动任务")
                 continue
 
             # 2. 自动更新数据
+            # 与手动 /update /scan 共用任务队列: 正在进行的同类任务直接复用，不会重复跑
             print("🔄 自动任务：开始更新最新数据...")
-            success, fail, err = dm.sync_data(lookback_days=Config.BOX_DAYS + 10)
+            job, _ = jobs.submit('update', '自动同步', run_update, lock_group='data')
+            job.wait()
+            if job.status != 'done':
+                raise job.error
+            success, fail, err = job.result
             latest_date = dm.db.check_latest_date('daily_price')
             print(f"✅ 数据更新完成：最新日期 {latest_date}，成功 {success} 天，失败 {fail} 天")
 
-            # 3. 自动选股扫描
+            # 3. 自动选股扫描 (结果写入扫描缓存，当晚的 /scan 直接命中)
             print("🚀 自动任务：开始选股扫描...")
-            results = strategy.run_daily_scan()
+            # 多个模型 (所有订阅者用到的) 放在同一个任务里，共享一次数据读取
+            names = subscribers.screens()
+            job, _ = jobs.submit('scan:' + ','.join(names), '自动选股', scan_job(names), lock_group='data')
+            job.wait()
+            if job.status != 'done':
+                raise job.error
             trade_date = dm.get_trade_date()
 
-            # 4. 构建并推送报告
-            if not results:
-                msg = f"📅 {trade_date} \n\n今日无符合【严格突破模型】的标的。\n保持观察，耐心等待主升浪！"
-            else:
-                msg = f"🚀 **量化选股日报** ({trade_date})\n"
-                msg += f"策略：突破箱体 + 机构主线 + 资金连买\n"
-                msg += f"共选中 {len(results)} 只优质标的\n"
-                msg += f"========================\n\n"
-
-                for s in results[:10]:
-                    msg += f"🔥 **{s['name']}** (`{s['ts_code']}`)\n"
-                    msg += f"   💰 现价: {s['price']} (涨幅 {s.get('pct_chg', 'N/A')}%)\n"
-                    msg += f"   💡 理由: {s['reason']}\n\n"
-
-                if len(results) > 10:
-                    msg += f"... 共 {len(results)} 只（更多请手动 /scan 查看）"
-
-            bot.send_message(Config.TG_CHAT_ID, msg, parse_mode='Markdown')
-            print(f"✅ 自动日报已推送（{len(results)} 只标的）")
+            # 4. 同一份结果按订阅者偏好过滤后分别推送 (可各自指定推送时间)
+            deliver_reports(trade_date, job.result, next_run)
 
         except Exception as e:
             print(f"❌ 自动任务执行出错: {e}")
             try:
-                bot.send_message(Config.TG_CHAT_ID, f"⚠️ 自动任务出错：{str(e)}")
+                outbox.send(Config.TG_CHAT_ID, f"⚠️ 自动任务出错：{str(e)}")
             except:
                 pass
 
 
 # 启动后台线程执行自动任务
 threading.Thread(target=daily_auto_task, daemon=True).start()
+threading.Thread(target=catch_up_reports, daemon=True).start()
+threading.Thread(target=maintenance_auto_task, daemon=True).start()
+if Config.MONITOR_AUTO:
+    threading.Thread(target=monitor_auto_task, daemon=True).start()
 
 
 # ==================== Webhook 路由 ====================
@@ -282,6 +812,12 @@ def webhook():
         abort(403)
 
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus 抓取入口 (各阶段耗时直方图 + 行数 / 接口调用计数)"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/')
 def index():
     return "🤖 Quant Bot is running! Webhook 已就绪。"
@@ -0,0 +1,160 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# 耗时直方图的分桶 (秒)，覆盖单次接口调用到整轮同步
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Histogram:
+    """
+    累计分桶 (Prometheus 口径，进程启动以来) + 最近 window 次观测 (算滚动分位数给 /stats 看)
+    """
+
+    def __init__(self, window=200):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantile(self, q):
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Metrics:
+    """
+    进程内的轻量指标登记处 (不依赖 prometheus_client)
+        span(): 计时一个阶段，写入 quant_stage_seconds{stage=...}
+        count(): 累加计数器，例如行数、接口调用次数
+    以 (指标名, 标签) 为键，线程安全，/metrics 与 /stats 都从这里读
+    """
+
+    def __init__(self, window=200):
+        self.window = window
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram(self.window)
+            hist.observe(value)
+
+    def count(self, name, n=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    @contextmanager
+    def span(self, stage, **labels):
+        """with metrics.span('scan.sectors'): ... 记录该阶段耗时 (出错也记录，并计入错误数)"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.count('quant_stage_errors_total', stage=stage, **labels)
+            raise
+        finally:
+            self.observe('quant_stage_seconds', time.perf_counter() - t0, stage=stage, **labels)
+
+    # ============ 输出 ============
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ''
+        body = ','.join(f'{k}="{str(v)}"' for k, v in items)
+        return '{' + body + '}'
+
+    def render_prometheus(self):
+        """Prometheus text exposition format (0.0.4)"""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        lines = []
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), hist in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            for bound, n in zip(BUCKETS, hist.counts):
+                lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {n}")
+            lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {hist.total}")
+            lines.append(f"{name}_sum{self._labels(labels)} {hist.sum:.6f}")
+            lines.append(f"{name}_count{self._labels(labels)} {hist.total}")
+        return '\n'.join(lines) + '\n'
+
+    def stage_summary(self):
+        """每个阶段一行: 次数、最近一次、滚动 p50/p95 (按阶段名排序)"""
+        with self.lock:
+            rows = []
+            for (name, labels), hist in self.histograms.items():
+                if name != 'quant_stage_seconds':
+                    continue
+                labels = dict(labels)
+                stage = labels.pop('stage')
+                if labels:
+                    stage += '[' + ','.join(str(v) for v in labels.values()) + ']'
+                rows.append({'stage': stage, 'count': hist.total, 'last': hist.recent[-1],
+                             'p50': hist.quantile(0.5), 'p95': hist.quantile(0.95)})
+        return sorted(rows, key=lambda r: r['stage'])
+
+    def counter_values(self, name):
+        """某个计数器按标签拆开的当前值 {标签值: 数值}"""
+        with self.lock:
+            return {','.join(str(v) for _, v in labels): value
+                    for (n, labels), value in self.counters.items() if n == name}
+
+
+# 全进程共用一个登记处
+metrics = Metrics()
+
+
+class InstrumentedApi:
+    """
+    给 tushare pro_api 的每次真实网络调用计时，并统计调用次数 / 返回行数
+    套在 CachedProApi 里面，命中缓存的调用不会走到这里
+    """
+
+    def __init__(self, pro, registry=None):
+        self.pro = pro
+        self.registry = registry or metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self.pro, name)
+        if not callable(attr):
+            return attr
+
+        def timed(*args, **kwargs):
+            self.registry.count('quant_api_calls_total', endpoint=name)
+            with self.registry.span('api', endpoint=name):
+                result = attr(*args, **kwargs)
+            self.registry.count('quant_api_rows_total', len(result) if result is not None else 0, endpoint=name)
+            return result
+        return timed
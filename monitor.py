@@ -0,0 +1,306 @@
+import csv
+import json
+import time
+import threading
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from screens import strategy_params
+from metrics import metrics
+
+
+# ==================== 触发价位 (每次同步后预计算) ====================
+
+def trigger_key():
+    """触发价位对应的参数指纹 (与数据版本号一起比较，数据或参数一变就重算)"""
+    return json.dumps(dict(strategy_params(), RS_BENCHMARK=Config.RS_BENCHMARK), sort_keys=True)
+
+
+def build_trigger_levels(dm, trade_date):
+    """
+    收盘数据落地后，预计算下一交易日每只股票的突破触发价位 (表 trigger_levels)
+    除了当天这根K线，规则需要的其余量前一晚就都已知:
+        price_trigger = 箱体上沿 * BREAKOUT_THRESHOLD      (规则1)
+        vol_trigger   = 均量 * VOL_MULTIPLIER               (规则2，盘中用当日累计成交量比较)
+        rs_base       = N 天前收盘价，现价 >= rs_base * (1 + 基准涨幅) 即跑赢基准 (规则3)
+        flow_ready    = 此前 FLOW_DAYS-1 天资金连续净流入 (规则4，当天的资金流收盘后才确认)
+    """
+    p = strategy_params()
+    levels = dm.indicators.next_levels()
+    levels = levels[(levels['bars'] >= p['BOX_DAYS']) & (levels['vol_ma'] > 0)]
+    levels = levels.dropna(subset=['box_high', 'vol_ma', 'close_n_ago'])
+
+    df_basic = dm.get_stock_basics()
+    names = dict(zip(df_basic['ts_code'], df_basic['name'])) if not df_basic.empty else {}
+    df = pd.DataFrame({
+        'ts_code': levels.index,
+        'name': [names.get(code, code) for code in levels.index],
+        'price_trigger': (levels['box_high'] * p['BREAKOUT_THRESHOLD']).to_numpy(),
+        'vol_trigger': (levels['vol_ma'] * p['VOL_MULTIPLIER']).to_numpy(),
+        'rs_base': levels['close_n_ago'].to_numpy(),
+        'flow_ready': (levels['flow_streak'] >= p['FLOW_DAYS'] - 1).astype(int).to_numpy(),
+    })
+    dm.db.save_data(df, 'trigger_levels', if_exists='replace')
+
+    # 基准: 明天取最近 20 根K线时的起点 = 从今天数起第 19 根 (与 get_benchmark_return 口径一致)
+    bench_base, bench_close = benchmark_levels(dm, trade_date)
+    dm.db.set_meta('trigger_benchmark', json.dumps({'base': bench_base, 'close': bench_close}))
+    dm.db.set_meta('trigger_levels_key', f"{dm.db.get_data_version()}/{trigger_key()}")
+    dm.db.set_meta('trigger_levels_date', trade_date)
+    print(f"🎯 盘中触发价位已更新: {len(df)} 只 (资金流就绪 {int(df['flow_ready'].sum())} 只)")
+    return df
+
+
+def benchmark_levels(dm, trade_date, days=20):
+    """(下一交易日 RS 的基准起点收盘价, 最新收盘价)，数据不足时返回 (None, None) 即基准涨幅按 0 计"""
+    start_date = (pd.to_datetime(trade_date) - pd.Timedelta(days=days * 2)).strftime('%Y%m%d')
+    close = dm.get_index_close(Config.RS_BENCHMARK, start_date, trade_date)
+    if len(close) < days:
+        return None, None
+    return float(close.iloc[-(days - 1)]), float(close.iloc[-1])
+
+
+# ==================== 行情快照源 ====================
+
+class QuoteFeed:
+    """
+    盘中行情快照源 (可替换): 迭代产出一批批 [(ts_code, 现价, 当日累计成交量)]
+    成交量单位与日线 vol 一致 (手)；每一批是同一时刻的一次全市场/部分快照
+    """
+
+    def __init__(self):
+        self.stopped = False
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def stop(self):
+        self.stopped = True
+
+
+class FileFeed(QuoteFeed):
+    """
+    从 CSV 回放快照 (测试 / 复盘用)，列: time, ts_code, price, vol
+    同一个 time 的行为一批；speed=None 不等待，否则按原始时间间隔 / speed 回放
+    """
+
+    def __init__(self, path, speed=None):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+
+    def __iter__(self):
+        with open(self.path, newline='') as f:
+            batch, batch_time, last_time = [], None, None
+            for row in csv.DictReader(f):
+                if self.stopped:
+                    return
+                if row['time'] != batch_time and batch:
+                    self._wait(last_time, batch_time)
+                    last_time = batch_time
+                    yield batch
+                    batch = []
+                batch_time = row['time']
+                batch.append((row['ts_code'], float(row['price']), float(row['vol'])))
+            if batch and not self.stopped:
+                self._wait(last_time, batch_time)
+                yield batch
+
+    def _wait(self, last_time, batch_time):
+        if self.speed and last_time is not None:
+            gap = (pd.to_datetime(batch_time) - pd.to_datetime(last_time)).total_seconds()
+            time.sleep(max(gap, 0) / self.speed)
+
+
+class TushareFeed(QuoteFeed):
+    """
+    轮询 tushare 实时行情 (ts.realtime_quote，新浪源，每次最多 batch 只)
+    多线程并发拉取，一轮即一次全市场快照；until 之后自动结束
+    """
+
+    def __init__(self, codes, interval=None, batch=50, workers=None, until='15:00'):
+        super().__init__()
+        self.codes = list(codes)
+        self.interval = interval or Config.MONITOR_INTERVAL
+        self.batch = batch
+        self.workers = workers or Config.MONITOR_WORKERS
+        self.until = until
+
+    def _fetch(self, chunk):
+        import tushare as ts
+        try:
+            df = ts.realtime_quote(ts_code=','.join(chunk))
+        except Exception as e:
+            metrics.count('quant_monitor_feed_errors_total')
+            print(f"⚠️ 实时行情拉取失败: {e}")
+            return []
+        df = df[df['PRICE'].astype(float) > 0]  # 停牌 / 未开盘
+        # 新浪源成交量单位为股，换算成与日线一致的手
+        return list(zip(df['TS_CODE'], df['PRICE'].astype(float), df['VOLUME'].astype(float) / 100))
+
+    def __iter__(self):
+        chunks = [self.codes[i:i + self.batch] for i in range(0, len(self.codes), self.batch)]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while not self.stopped and datetime.now().strftime('%H:%M') < self.until:
+                started = time.time()
+                with metrics.span('monitor.poll'):
+                    snapshot = [tick for ticks in pool.map(self._fetch, chunks) for tick in ticks]
+                yield snapshot
+                time.sleep(max(0.0, self.interval - (time.time() - started)))
+
+
+# ==================== 盘中突破监控 ====================
+
+class BreakoutMonitor:
+    """
+    逐笔快照对照预计算的触发价位，每个 tick 只做一次字典查找 + 三次比较 (O(1))
+    基准指数的 tick (RS_BENCHMARK) 会实时刷新 RS 门槛；同一只股票一天只提醒一次
+    """
+
+    def __init__(self, levels, bench_base=None, bench_close=None, trade_date=None):
+        # {ts_code: (price_trigger, vol_trigger, rs_base, name)}，只监控资金流已就绪的股票
+        ready = levels[levels['flow_ready'] == 1]
+        self.levels = {
+            code: (price, vol, base, name)
+            for code, name, price, vol, base in ready[['ts_code', 'name', 'price_trigger', 'vol_trigger', 'rs_base']]
+            .itertuples(index=False)
+        }
+        self.bench_base = bench_base
+        self.rs_factor = bench_close / bench_base if bench_base else 1.0
+        self.trade_date = trade_date
+        self.alerted = set()
+        self.ticks = 0
+
+    @classmethod
+    def load(cls, db):
+        levels = db.get_data('trigger_levels')
+        bench = json.loads(db.get_meta('trigger_benchmark', '{}'))
+        return cls(levels, bench.get('base'), bench.get('close'), db.get_meta('trigger_levels_date'))
+
+    def codes(self):
+        return list(self.levels) + [Config.RS_BENCHMARK]
+
+    def on_tick(self, ts_code, price, vol):
+        """返回新触发的提醒 dict，未触发返回 None"""
+        self.ticks += 1
+        if ts_code == Config.RS_BENCHMARK:
+            if self.bench_base:
+                self.rs_factor = price / self.bench_base
+            return None
+        level = self.levels.get(ts_code)
+        if level is None or ts_code in self.alerted:
+            return None
+        price_trigger, vol_trigger, rs_base, name = level
+        if price > price_trigger and vol > vol_trigger and price >= rs_base * self.rs_factor:
+            self.alerted.add(ts_code)
+            return {
+                'ts_code': ts_code,
+                'name': name,
+                'price': price,
+                'box_high': price_trigger / Config.BREAKOUT_THRESHOLD,
+                'vol_ratio': vol / vol_trigger * Config.VOL_MULTIPLIER,
+                'time': datetime.now().strftime('%H:%M:%S'),
+            }
+        return None
+
+    def run(self, feed, on_alert):
+        """消费快照源直到结束；每批快照里新触发的提醒立即整批回调 on_alert(alerts)"""
+        for batch in feed:
+            with metrics.span('monitor.batch'):
+                alerts = [alert for alert in (self.on_tick(*tick) for tick in batch) if alert]
+            metrics.count('quant_monitor_ticks_total', len(batch))
+            if alerts:
+                metrics.count('quant_monitor_alerts_total', len(alerts))
+                on_alert(alerts)
+
+
+def format_alerts(alerts):
+    msg = f"⚡️ **盘中突破提醒** ({len(alerts)}只)\n\n"
+    for a in alerts:
+        msg += f"🔥 **{a['name']}** (`{a['ts_code']}`) {a['time']}\n"
+        msg += f"   现价 `{a['price']:.2f}` > 箱体上沿 `{a['box_high']:.2f}`, 量比 {a['vol_ratio']:.1f}\n"
+    msg += "\n(资金流收盘后确认)"
+    return msg
+
+
+class MonitorRunner:
+    """
+    在独立线程里运行盘中监控 (整天常驻，不占用后台任务队列的线程)
+    get_db() 返回当前的 DBManager (/reset 会重建数据库，不能持有旧对象)
+    make_feed(codes) 返回一个 QuoteFeed；on_alert(alerts) 负责推送
+    """
+
+    def __init__(self, get_db, make_feed, on_alert):
+        self.get_db = get_db
+        self.make_feed = make_feed
+        self.on_alert = on_alert
+        self.monitor = None
+        self.feed = None
+        self.thread = None
+        self.started = None
+        self.error = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        """已在运行时返回 False"""
+        if self.running:
+            return False
+        self.monitor = BreakoutMonitor.load(self.get_db())
+        self.feed = self.make_feed(self.monitor.codes())
+        self.started = datetime.now()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print(f"👀 盘中监控启动: {len(self.monitor.levels)} 只 (触发价位日期 {self.monitor.trade_date})")
+        return True
+
+    def _run(self):
+        try:
+            self.monitor.run(self.feed, self.on_alert)
+        except Exception as e:
+            self.error = e
+            print(f"❌ 盘中监控异常退出: {e}")
+        print("🛑 盘中监控结束")
+
+    def stop(self, timeout=None):
+        """通知行情源停止；给了 timeout 时等监控线程退出，返回是否已停止"""
+        if self.feed is not None:
+            self.feed.stop()
+        if timeout is not None and self.thread is not None:
+            self.thread.join(timeout)
+        return not self.running
+
+    def status(self):
+        m = self.monitor
+        return {
+            'running': self.running,
+            'levels_date': m.trade_date if m else self.get_db().get_meta('trigger_levels_date'),
+            'watched': len(m.levels) if m else 0,
+            'ticks': m.ticks if m else 0,
+            'alerted': len(m.alerted) if m else 0,
+            'started': self.started.strftime('%H:%M:%S') if self.started else None,
+            'error': str(self.error) if self.error else None,
+        }
+
+
+if __name__ == "__main__":
+    # 用法: python monitor.py ticks.csv [--db /app/data/quant.db] [--speed 10]
+    import argparse
+    from db_manager import DBManager
+
+    parser = argparse.ArgumentParser(description='回放行情快照文件，检验盘中突破提醒')
+    parser.add_argument('path')
+    parser.add_argument('--db', default='/app/data/quant.db')
+    parser.add_argument('--speed', type=float, default=None, help='回放倍速 (缺省不等待)')
+    args = parser.parse_args()
+
+    monitor = BreakoutMonitor.load(DBManager(args.db))
+    print(f"👀 监控 {len(monitor.levels)} 只 (触发价位日期 {monitor.trade_date})")
+    t0 = time.perf_counter()
+    monitor.run(FileFeed(args.path, args.speed), lambda alerts: print(format_alerts(alerts)))
+    elapsed = time.perf_counter() - t0
+    print(f"🏁 回放完成: {monitor.ticks} 个 tick, {len(monitor.alerted)} 只触发, 耗时 {elapsed:.3f}s")
@@ -1,38 +1,231 @@
+import time
+import threading
+from collections import deque
 import requests
+from requests.adapters import HTTPAdapter
 from config import Config
+from downloader import TokenBucket
+from metrics import metrics
 
-class TelegramBot:
-    def send_report(self, stocks, date_str):
-        if not stocks:
-            self.send_message(f"📅 {date_str} \n\n今日无符合【严格突破模型】的标的。")
-            return
-
-        msg = f"🚀 **量化选股日报** ({date_str})\n"
-        msg += f"策略：突破箱体 + 机构主线 + 资金连买\n"
-        msg += f"========================\n\n"
-
-        for s in stocks[:10]: # 避免消息过长，只发前10
-            msg += f"🔥 **{s['name']}** (`{s['ts_code']}`)\n"
-            msg += f"   📂 板块: {s['sector']}\n"
-            msg += f"   💰 现价: {s['price']} (涨幅 {s['pct_chg']}%)\n"
-            msg += f"   📊 评分: {s['score']}\n"
-            msg += f"   💡 理由: {s['reason']}\n\n"
-        
-        self.send_message(msg)
-
-    def send_message(self, text):
-        if not Config.TG_BOT_TOKEN:
+
+def tg_len(text):
+    """Telegram 按 UTF-16 码元计算消息长度 (emoji 占 2 个)"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _hard_cut(text, limit):
+    """单行本身就超长时按长度硬切 (尽量不会发生)"""
+    parts, cur = [], ''
+    for ch in text:
+        if tg_len(cur + ch) > limit:
+            parts.append(cur)
+            cur = ''
+        cur += ch
+    return parts + [cur] if cur else parts
+
+
+def paginate(blocks, header='', limit=None, sep='\n'):
+    """
+    把若干段落 (例如每只股票一段) 装进尽量少的消息，每条不超过 limit (缺省 TG_MAX_LEN)
+    段落不会被拆开，Markdown 标记因此不会跨消息断开；header 只放在第一页
+    多于一页时每页末尾标注页码
+    """
+    limit = limit or Config.TG_MAX_LEN
+    room = limit - 16  # 给页码留位置
+    pages, cur = [], header
+    for block in blocks:
+        pieces = _hard_cut(block, room) if tg_len(block) > room else [block]
+        for piece in pieces:
+            candidate = cur + sep + piece if cur else piece
+            if cur and tg_len(candidate) > room:
+                pages.append(cur)
+                candidate = piece
+            cur = candidate
+    if cur or not pages:
+        pages.append(cur)
+    if len(pages) > 1:
+        pages = [f"{page}\n📄 {i}/{len(pages)}" for i, page in enumerate(pages, 1)]
+    return pages
+
+
+def split_message(text, limit=None):
+    """超过 Telegram 单条上限的文本按行切成多条"""
+    limit = limit or Config.TG_MAX_LEN
+    if tg_len(text) <= limit:
+        return [text]
+    return paginate(text.split('\n'), limit=limit)
+
+
+class Delivery:
+    """一条待发送的消息；wait() 等到发送成功或最终失败"""
+
+    def __init__(self, chat_id, text, parse_mode=None):
+        self.chat_id = str(chat_id)
+        self.text = text
+        self.parse_mode = parse_mode
+        self.attempts = 0        # 非 429 的失败次数
+        self.throttled = 0       # 被 429 限流的次数
+        self.ok = None
+        self.error = None
+        self.done_event = threading.Event()
+
+    def finish(self, ok, error=None):
+        self.ok = ok
+        self.error = error
+        self.done_event.set()
+
+    def wait(self, timeout=None):
+        self.done_event.wait(timeout)
+        return self.ok
+
+
+class TelegramOutbox:
+    """
+    Telegram 发送队列
+    - 复用一个 requests.Session (连接池 + keep-alive)，不再每条消息新建连接
+    - 每个会话一个令牌桶 (私聊约 1 条/秒、群组 20 条/分钟)，外加全局令牌桶 (约 30 条/秒)
+    - 同一会话的消息严格按顺序、一次只发一条；不同会话之间由 workers 个线程并行
+    - 429 按返回的 retry_after 暂停该会话后重发；网络错误 / 5xx 指数退避重试
+    - 超过 4096 字符的消息自动切分
+    session 可替换为任意实现了 post() 的对象 (便于离线测试)
+    """
+
+    def __init__(self, token=None, session=None, workers=None, clock=time.monotonic):
+        self.token = token if token is not None else Config.TG_BOT_TOKEN
+        self.session = session or self._make_session(workers or Config.TG_SEND_WORKERS)
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.queues = {}         # chat_id -> deque[Delivery]
+        self.limiters = {}       # chat_id -> TokenBucket
+        self.busy = set()        # 正在发送的会话
+        self.global_limiter = TokenBucket(Config.TG_GLOBAL_PER_MIN, burst=Config.TG_GLOBAL_PER_MIN // 60, clock=clock)
+        for i in range(workers or Config.TG_SEND_WORKERS):
+            threading.Thread(target=self._worker, name=f'tg-outbox-{i}', daemon=True).start()
+
+    @staticmethod
+    def _make_session(workers):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+        session.mount('https://', adapter)
+        return session
+
+    # ============ 入队 ============
+
+    def send(self, chat_id, text, parse_mode=None):
+        """入队一条消息 (超长自动切分)，立即返回 [Delivery]"""
+        return self._enqueue(chat_id, split_message(text), parse_mode)
+
+    def send_pages(self, chat_id, blocks, header='', parse_mode=None):
+        """完整结果列表分页发送: 每段落不被拆开，按顺序入队，返回 [Delivery]"""
+        return self._enqueue(chat_id, paginate(blocks, header), parse_mode)
+
+    def _enqueue(self, chat_id, texts, parse_mode):
+        items = [Delivery(chat_id, text, parse_mode) for text in texts]
+        if not self.token:
             print("❌ 未配置 Telegram Token，仅打印结果:")
-            print(text)
-            return
-
-        url = f"https://api.telegram.org/bot{Config.TG_BOT_TOKEN}/sendMessage"
-        payload = {
-            "chat_id": Config.TG_CHAT_ID,
-            "text": text,
-            "parse_mode": "Markdown"
-        }
+            for item in items:
+                print(item.text)
+                item.finish(False, 'no token')
+            return items
+        with self.cond:
+            self.queues.setdefault(items[0].chat_id, deque()).extend(items)
+            self.cond.notify_all()
+        return items
+
+    def pending(self):
+        with self.cond:
+            return sum(len(q) for q in self.queues.values()) + len(self.busy)
+
+    # ============ 发送线程 ============
+
+    def _limiter(self, chat_id):
+        limiter = self.limiters.get(chat_id)
+        if limiter is None:
+            # 群组 / 频道的 chat_id 为负数，限额比私聊低得多
+            per_min = Config.TG_GROUP_PER_MIN if chat_id.startswith('-') else Config.TG_CHAT_PER_MIN
+            limiter = self.limiters[chat_id] = TokenBucket(per_min, burst=Config.TG_CHAT_BURST, clock=self.clock)
+        return limiter
+
+    def _next(self):
+        """挑一个可以立即发送的会话 (已持有 cond)，返回 (Delivery, None) 或 (None, 需要等待的秒数)"""
+        wait = None
+        for chat_id, queue in self.queues.items():
+            if not queue or chat_id in self.busy:
+                continue
+            delay = self._limiter(chat_id).try_acquire(take=False)
+            if delay <= 0:
+                delay = self.global_limiter.try_acquire()
+                if delay <= 0:
+                    self._limiter(chat_id).try_acquire()
+                    self.busy.add(chat_id)
+                    item = queue.popleft()
+                    # 轮转: 刚发过的会话排到最后，多会话之间公平
+                    del self.queues[chat_id]
+                    if queue:
+                        self.queues[chat_id] = queue
+                    return item, None
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                item, wait = self._next()
+                while item is None:
+                    self.cond.wait(wait)
+                    item, wait = self._next()
+            retry = self._post(item)
+            with self.cond:
+                self.busy.discard(item.chat_id)
+                if retry:
+                    self.queues.setdefault(item.chat_id, deque()).appendleft(item)
+                self.cond.notify_all()
+
+    def _post(self, item):
+        """发一条，返回是否需要放回队首重发"""
+        url = f"https://api.telegram.org/bot{self.token}/sendMessage"
+        payload = {'chat_id': item.chat_id, 'text': item.text, 'disable_web_page_preview': True}
+        if item.parse_mode:
+            payload['parse_mode'] = item.parse_mode
         try:
-            requests.post(url, json=payload, timeout=10)
+            with metrics.span('telegram.send'):
+                resp = self.session.post(url, json=payload, timeout=Config.TG_TIMEOUT)
+            data = resp.json()
+            status = resp.status_code
         except Exception as e:
-            print(f"Telegram 发送失败: {e}")
+            data, status = {'description': str(e)}, None
+
+        if data.get('ok'):
+            metrics.count('quant_telegram_messages_total', result='sent')
+            item.finish(True)
+            return False
+        description = data.get('description', '')
+        if status == 429:
+            retry_after = (data.get('parameters') or {}).get('retry_after', 1)
+            item.throttled += 1
+            metrics.count('quant_telegram_messages_total', result='throttled')
+            print(f"⏳ Telegram 限流 (chat {item.chat_id})，{retry_after} 秒后重发")
+            self._limiter(item.chat_id).pause(retry_after)
+            return True
+        if status == 400 and item.parse_mode and "can't parse" in description:
+            # Markdown 标记不成对 (例如股票名里的下划线)，退回纯文本重发
+            item.parse_mode = None
+            return True
+        item.attempts += 1
+        if (status is None or status >= 500) and item.attempts < Config.TG_MAX_RETRIES:
+            print(f"⚠️ Telegram 发送失败 {item.attempts}/{Config.TG_MAX_RETRIES}: {description}")
+            self._limiter(item.chat_id).pause(min(30, 2 ** item.attempts))
+            return True
+        metrics.count('quant_telegram_messages_total', result='failed')
+        print(f"❌ Telegram 发送失败 (chat {item.chat_id}): {description}")
+        item.finish(False, description)
+        return False
+
+
+def wait_all(deliveries, timeout=None):
+    """等一组消息发完，返回成功条数"""
+    deadline = None if timeout is None else time.time() + timeout
+    for item in deliveries:
+        item.wait(None if deadline is None else max(0, deadline - time.time()))
+    return sum(1 for item in deliveries if item.ok)
+
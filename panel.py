@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+
+def pivot_panel(df, value, index='trade_date', columns='ts_code'):
+    """
+    长表 -> 日期×股票 矩阵
+    行按日期升序，列为股票代码；重复的 (代码, 日期) 只保留最后一条
+    也支持已按 (ts_code, trade_date) 建好索引的表，直接 unstack
+    紧凑表 (整数日期 / category 代码) 同样适用，结果的行列都是字符串
+    """
+    if df.empty or value not in df.columns:
+        return pd.DataFrame()
+    if isinstance(df.index, pd.MultiIndex):
+        s = df[value]
+        s = s[~s.index.duplicated(keep='last')]
+        panel = s.unstack(columns).sort_index()
+    else:
+        df = df.drop_duplicates([columns, index], keep='last')
+        panel = df.pivot(index=index, columns=columns, values=value).sort_index()
+    # 紧凑表 (整数日期 / category 代码，见 compact_frame) 还原成普通字符串索引
+    if panel.index.dtype.kind in 'iu':
+        panel.index = panel.index.astype(str)
+    if isinstance(panel.columns, pd.CategoricalIndex):
+        panel.columns = panel.columns.astype(str)
+    return panel
+
+
+def align_right(panel, rows=None):
+    """
+    把每只股票的有效数据"压"到矩阵底部 (停牌日的 NaN 挪到顶部)
+    压缩后最后一行 = 每只股票自己的最新一根K线，倒数第 k 行 = 它往前第 k 根K线，
+    与逐只 sort_values + iloc 的取数方式完全一致。
+    rows: 输出行数 (不足时顶部补 NaN，多余时截掉最早的行)
+    """
+    values = panel.to_numpy(dtype='float64')
+    valid = ~np.isnan(values)
+    # 稳定排序: False(NaN) 在前，True(有效值) 在后且保持原有时间顺序
+    order = np.argsort(valid, axis=0, kind='stable')
+    packed = np.take_along_axis(values, order, axis=0)
+
+    if rows is not None:
+        if rows > len(packed):
+            pad = np.full((rows - len(packed), packed.shape[1]), np.nan)
+            packed = np.vstack([pad, packed])
+        else:
+            packed = packed[len(packed) - rows:]
+    return pd.DataFrame(packed, columns=panel.columns)
@@ -0,0 +1,208 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from panel import pivot_panel
+
+# 列式存储的字段 -> 来源表
+FIELDS = {
+    'open': 'daily_price',
+    'close': 'daily_price',
+    'high': 'daily_price',
+    'vol': 'daily_price',
+    'pct_chg': 'daily_price',
+    'amount': 'daily_price',
+    'net_mf_amount': 'money_flow',
+}
+
+
+class PanelStore:
+    """
+    日期×股票 的列式行情库 (每个字段一个 .npy 文件，与 SQLite 并存)
+    读取时直接 mmap 打开，不经过 SQL / 解析，只有真正访问到的页才会进内存。
+
+    目录结构:
+        meta.json       {"dates": [...], "codes": [...]}  行/列标签
+        close.npy ...   float64 矩阵，按容量预分配，未用部分为 NaN
+    """
+
+    def __init__(self, root='/app/data/panel'):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._load_meta()
+
+    # ============ 元数据 ============
+
+    def _meta_path(self):
+        return os.path.join(self.root, 'meta.json')
+
+    def _field_path(self, field):
+        return os.path.join(self.root, f'{field}.npy')
+
+    def _load_meta(self):
+        self.dates, self.codes = [], []
+        if os.path.exists(self._meta_path()):
+            with open(self._meta_path()) as f:
+                meta = json.load(f)
+            self.dates, self.codes = meta['dates'], meta['codes']
+        self._code_pos = {c: i for i, c in enumerate(self.codes)}
+
+    def _save_meta(self):
+        tmp = self._meta_path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'dates': self.dates, 'codes': self.codes}, f)
+        os.replace(tmp, self._meta_path())
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if self.dates else None
+
+    def missing_fields(self):
+        """新增字段后旧库里还没有对应文件，需要重建"""
+        return [f for f in FIELDS if not os.path.exists(self._field_path(f))]
+
+    def is_current(self, latest_date):
+        return bool(latest_date) and self.last_date == latest_date and not self.missing_fields()
+
+    # ============ 读取 ============
+
+    def read(self, field):
+        """mmap 只读打开某字段，返回 [日期数, 股票数] 视图 (不拷贝)"""
+        if not self.dates or not os.path.exists(self._field_path(field)):
+            return None
+        arr = np.load(self._field_path(field), mmap_mode='r')
+        return arr[:len(self.dates), :len(self.codes)]
+
+    def frame(self, field, start_date=None, end_date=None):
+        """按日期切片后包装成 DataFrame (行=日期升序, 列=代码)"""
+        arr = self.read(field)
+        if arr is None:
+            return pd.DataFrame()
+        dates = np.array(self.dates)
+        start = int(np.searchsorted(dates, start_date)) if start_date else 0
+        end = int(np.searchsorted(dates, end_date, side='right')) if end_date else len(dates)
+        return pd.DataFrame(arr[start:end], index=pd.Index(self.dates[start:end], name='trade_date'),
+                            columns=pd.Index(self.codes, name='ts_code'))
+
+    # ============ 写入 ============
+
+    def _open_rw(self, field, rows, cols):
+        """读写打开字段文件；容量不足时按倍数扩容并搬迁旧数据"""
+        path = self._field_path(field)
+        if os.path.exists(path):
+            arr = np.load(path, mmap_mode='r+')
+            if arr.shape[0] >= rows and arr.shape[1] >= cols:
+                return arr
+            old = arr
+            shape = (max(rows, old.shape[0] * 2), max(cols, int(old.shape[1] * 1.2)))
+        else:
+            old = None
+            shape = (max(rows, 256), max(cols, 6000))
+
+        tmp = path + '.tmp.npy'
+        new = np.lib.format.open_memmap(tmp, mode='w+', dtype='float64', shape=shape)
+        new[:] = np.nan
+        if old is not None:
+            new[:old.shape[0], :old.shape[1]] = old
+            del old
+        new.flush()
+        del new
+        os.replace(tmp, path)
+        return np.load(path, mmap_mode='r+')
+
+    def write_day(self, trade_date, df_daily, df_flow=None):
+        """
+        写入一个交易日 (通常是 sync 刚下载完的那一天)
+        新日期追加到末尾；已存在的日期原地覆盖；更早的缺口日期插入到对应位置
+        """
+        frames = {'daily_price': df_daily, 'money_flow': df_flow}
+        new_codes = set()
+        for df in frames.values():
+            if df is not None and not df.empty:
+                new_codes.update(c for c in df['ts_code'] if c not in self._code_pos)
+        for code in sorted(new_codes):
+            self._code_pos[code] = len(self.codes)
+            self.codes.append(code)
+
+        pos = int(np.searchsorted(np.array(self.dates), trade_date)) if self.dates else 0
+        exists = pos < len(self.dates) and self.dates[pos] == trade_date
+        n_rows = len(self.dates) + (0 if exists else 1)
+
+        for field, table in FIELDS.items():
+            arr = self._open_rw(field, n_rows, len(self.codes))
+            if not exists:
+                # 插入新行: 其后的行整体下移一格 (追加时这一步是空操作)
+                arr[pos + 1:n_rows] = arr[pos:n_rows - 1]
+                arr[pos] = np.nan
+            df = frames[table]
+            if df is not None and not df.empty and field in df.columns:
+                cols = df['ts_code'].map(self._code_pos).to_numpy()
+                arr[pos, cols] = df[field].to_numpy(dtype='float64')
+            arr.flush()
+            del arr
+
+        if not exists:
+            self.dates.insert(pos, trade_date)
+        self._save_meta()
+
+    def trim(self, keep_from):
+        """
+        丢掉 keep_from 之前的日期 (与数据库的保留窗口一致)，剩余行上移，文件容量不再增长
+        先写新文件再整体替换: 正在 mmap 读旧文件的扫描不受影响
+        """
+        k = int(np.searchsorted(np.array(self.dates), keep_from)) if self.dates else 0
+        if k == 0:
+            return 0
+        n = len(self.dates)
+        written = []
+        for field in FIELDS:
+            path = self._field_path(field)
+            if not os.path.exists(path):
+                continue
+            old = np.load(path, mmap_mode='r')
+            tmp = path + '.tmp.npy'
+            new = np.lib.format.open_memmap(tmp, mode='w+', dtype='float64', shape=old.shape)
+            new[:n - k] = old[k:n]
+            new[n - k:] = np.nan
+            new.flush()
+            del new, old
+            written.append((tmp, path))
+        for tmp, path in written:
+            os.replace(tmp, path)
+        self.dates = self.dates[k:]
+        self._save_meta()
+        return k
+
+    def rebuild(self, db):
+        """从 SQLite 全量重建 (首次启用或数据不一致时)"""
+        print("🧱 正在从数据库重建列式行情库...")
+        # 全量历史只读需要的列；代码/日期用紧凑类型，数值保持 float64 与逐日追加的口径一致
+        df_daily = db.get_data('daily_price', columns=[f for f, t in FIELDS.items() if t == 'daily_price'],
+                               compact=True, float32=False)
+        df_flow = db.get_data('money_flow', columns=[f for f, t in FIELDS.items() if t == 'money_flow'],
+                              compact=True, float32=False)
+        for field in FIELDS:
+            if os.path.exists(self._field_path(field)):
+                os.remove(self._field_path(field))
+        if os.path.exists(self._meta_path()):
+            os.remove(self._meta_path())
+        self._load_meta()
+        if df_daily.empty:
+            return
+
+        panels = {}
+        for field, table in FIELDS.items():
+            src = df_daily if table == 'daily_price' else df_flow
+            panels[field] = pivot_panel(src, field)
+        dates = sorted(set(panels['close'].index).union(panels['net_mf_amount'].index))
+        codes = sorted(set(panels['close'].columns).union(panels['net_mf_amount'].columns))
+
+        for field, p in panels.items():
+            arr = self._open_rw(field, len(dates), len(codes))
+            arr[:len(dates), :len(codes)] = p.reindex(index=dates, columns=codes).to_numpy(dtype='float64')
+            arr.flush()
+            del arr
+        self.dates, self.codes = list(dates), list(codes)
+        self._code_pos = {c: i for i, c in enumerate(self.codes)}
+        self._save_meta()
+        print(f"✅ 列式行情库重建完成: {len(dates)} 天 × {len(codes)} 只")
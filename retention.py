@@ -0,0 +1,151 @@
+import os
+import gzip
+import sqlite3
+import pandas as pd
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from config import Config
+from metrics import metrics
+
+
+def min_hot_days():
+    """扫描 / 滚动指标 / RS 至少需要的交易日数，保留窗口不会小于它"""
+    return max(Config.BOX_DAYS + 20, max(Config.RS_HORIZONS) + 5, Config.SECTOR_MOMENTUM_DAYS + 5)
+
+
+class Retention:
+    """
+    SQLite 数据保留策略
+    - 每张表只保留最近 RETENTION_DAYS[表] 个交易日 (热数据窗口)，更早的行删掉
+    - RETENTION_ARCHIVE 开启时，行情表 (ARCHIVE_TABLES) 删除前按年追加到 archive/<表>/<年>.csv.gz (可直接 pd.read_csv 读回)
+    - 列式行情库同步裁掉同样的日期；定期 ANALYZE，空闲页多了或到期就 VACUUM 回收空间
+    """
+
+    def __init__(self, db, store=None, archive_dir=None):
+        self.db = db
+        self.store = store
+        self.archive_dir = archive_dir or os.path.join(os.path.dirname(db.db_path), 'archive')
+
+    # ============ 裁剪 ============
+
+    @staticmethod
+    def window(table):
+        days = Config.RETENTION_DAYS.get(table, 0)
+        if days and table in ('daily_price', 'money_flow', 'sync_ledger'):
+            days = max(days, min_hot_days())
+        return days
+
+    def cutoff(self, table):
+        """table 需要保留的最早交易日 (按表里实际存在的交易日计数)；不需要裁剪时返回 None"""
+        days = self.window(table)
+        if not days:
+            return None
+        with self.db.engine.connect() as conn:
+            return conn.execute(
+                text(f"SELECT trade_date FROM (SELECT DISTINCT trade_date FROM {table}) "
+                     f"ORDER BY trade_date DESC LIMIT 1 OFFSET :n"), {'n': days - 1}
+            ).scalar()
+
+    def prune(self, table):
+        """裁剪一张表，返回删除的行数"""
+        cutoff = self.cutoff(table)
+        if cutoff is None:
+            return 0
+        if Config.RETENTION_ARCHIVE and table in Config.ARCHIVE_TABLES:
+            self.archive(table, cutoff)
+        with self.db.bulk_writer(synchronous='NORMAL') as cur:
+            cur.execute(f"DELETE FROM {table} WHERE trade_date < ?", (cutoff,))
+            deleted = cur.rowcount
+        if deleted:
+            print(f"✂️ {table}: 删除 {cutoff} 之前的 {deleted} 行")
+            metrics.count('quant_rows_pruned_total', deleted, table=table)
+        return deleted
+
+    def archive(self, table, cutoff):
+        """cutoff 之前、还没归档过的行按年追加到压缩文件 (每次追加一个 gzip 分段，不重写旧内容)"""
+        archived = self.db.get_meta(f'archive_latest:{table}', '')
+        folder = os.path.join(self.archive_dir, table)
+        os.makedirs(folder, exist_ok=True)
+        total, latest = 0, None
+        # 分块读取，首次归档多年历史时内存也有上限
+        with self.db.engine.connect() as conn:
+            chunks = pd.read_sql(text(f"SELECT * FROM {table} WHERE trade_date < :c AND trade_date > :a "
+                                      f"ORDER BY trade_date"), conn, params={'c': cutoff, 'a': archived},
+                                 chunksize=200000)
+            for df in chunks:
+                for year, part in df.groupby(df['trade_date'].str[:4]):
+                    path = os.path.join(folder, f'{year}.csv.gz')
+                    exists = os.path.exists(path)
+                    with gzip.open(path, 'at', encoding='utf-8', newline='') as f:
+                        part.to_csv(f, header=not exists, index=False)
+                total += len(df)
+                latest = df['trade_date'].max()
+        if not total:
+            return 0
+        # 先落盘再记进度: 中途失败最多重复归档，不会丢行
+        self.db.set_meta(f'archive_latest:{table}', latest)
+        print(f"🗄️ {table}: 归档 {total} 行 -> {folder}")
+        return total
+
+    # ============ 维护 ============
+
+    def stats(self):
+        """数据库文件大小与空闲页比例"""
+        with self.db.engine.connect() as conn:
+            page_size = conn.execute(text("PRAGMA page_size")).scalar()
+            pages = conn.execute(text("PRAGMA page_count")).scalar()
+            free = conn.execute(text("PRAGMA freelist_count")).scalar()
+        wal = self.db.db_path + '-wal'
+        return {
+            'size_mb': pages * page_size / 2**20,
+            'wal_mb': os.path.getsize(wal) / 2**20 if os.path.exists(wal) else 0.0,
+            'free_ratio': free / pages if pages else 0.0,
+        }
+
+    def vacuum_due(self):
+        last = self.db.get_meta('last_vacuum')
+        if not last:
+            return True
+        age = datetime.now() - datetime.strptime(last, '%Y-%m-%d %H:%M:%S')
+        return age >= timedelta(days=Config.VACUUM_INTERVAL_DAYS) or self.stats()['free_ratio'] >= Config.VACUUM_FREE_RATIO
+
+    def vacuum(self):
+        """VACUUM 不能在事务里执行，单独开一个自动提交的连接；之后截断 WAL"""
+        conn = sqlite3.connect(self.db.db_path, timeout=300, isolation_level=None)
+        try:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            conn.close()
+        self.db.set_meta('last_vacuum', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+    def run(self, vacuum=None, progress=None):
+        """
+        一轮维护: 各表裁剪 (+归档) → 裁剪列式库 → ANALYZE → 按需 VACUUM
+        vacuum: True/False 强制 / 跳过，缺省按 vacuum_due() 判断
+        返回 {'deleted': {表: 行数}, 'before': stats, 'after': stats, 'vacuumed': bool}
+        """
+        progress = progress or (lambda text: None)
+        before = self.stats()
+        deleted = {}
+        with metrics.span('maintenance.prune'):
+            for table in Config.RETENTION_DAYS:
+                progress(f"裁剪 {table}")
+                deleted[table] = self.prune(table)
+        cutoff = self.cutoff('daily_price')
+        if self.store is not None and cutoff:
+            self.store.trim(cutoff)
+
+        progress("ANALYZE")
+        with metrics.span('maintenance.analyze'), self.db.engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+
+        vacuumed = self.vacuum_due() if vacuum is None else vacuum
+        if vacuumed:
+            progress("VACUUM")
+            print("🧹 VACUUM 回收空间...")
+            with metrics.span('maintenance.vacuum'):
+                self.vacuum()
+        after = self.stats()
+        print(f"✅ 数据维护完成: {before['size_mb']:.1f}MB -> {after['size_mb']:.1f}MB, 删除 {sum(deleted.values())} 行")
+        return {'deleted': deleted, 'before': before, 'after': after, 'vacuumed': vacuumed}
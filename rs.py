@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+from config import Config
+from panel import align_right
+
+
+def rs_scores(close, benchmark_close, horizons=None, weights=None):
+    """
+    全市场相对强度，一次向量化算完 (index=ts_code)
+    close: 日期×股票 收盘价矩阵 (每只股票按自己的K线右对齐后取最近 N 根)
+    benchmark_close: 基准收盘价 Series (升序)，同样取最近 N 根
+    返回列:
+        ret_<h>     个股 h 日涨幅
+        excess_<h>  跑赢基准的幅度 (个股涨幅 - 基准涨幅)
+        rank_<h>    该周期在全市场的百分位 (0-100，越大越强)
+        rs_score    各周期百分位按 weights 加权 (历史不足某周期的股票只用可用周期重新归一)
+        rs_rank     rs_score 在全市场的百分位 (0-100)
+    """
+    horizons = list(horizons or Config.RS_HORIZONS)
+    weights = np.asarray(weights or Config.RS_WEIGHTS, dtype='float64')
+    rows = max(horizons) + 1
+    aligned = align_right(close, rows).to_numpy(dtype='float64')
+    bench = pd.Series(benchmark_close).dropna().to_numpy(dtype='float64')
+
+    last = aligned[-1]
+    out = {}
+    ranks = np.full((len(horizons), aligned.shape[1]), np.nan)
+    for k, h in enumerate(horizons):
+        past = aligned[-1 - h]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret = np.where(past > 0, last / past - 1, np.nan)
+        bench_ret = bench[-1] / bench[-1 - h] - 1 if len(bench) > h else 0.0
+        excess = ret - bench_ret
+        out[f'ret_{h}'] = ret
+        out[f'excess_{h}'] = excess
+        ranks[k] = pd.Series(excess).rank(pct=True).to_numpy() * 100
+        out[f'rank_{h}'] = ranks[k]
+
+    available = ~np.isnan(ranks)
+    w = weights[:, None] * available
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.nansum(ranks * weights[:, None], axis=0) / w.sum(axis=0)
+    df = pd.DataFrame(out, index=close.columns)
+    df['rs_score'] = score
+    df['rs_rank'] = df['rs_score'].rank(pct=True) * 100
+    return df
@@ -0,0 +1,58 @@
+import json
+import hashlib
+import pandas as pd
+from datetime import datetime
+from sqlalchemy import text
+from config import Config
+from screens import get_screen, strategy_params
+
+
+def params_hash(screen='breakout', industry_version=''):
+    """
+    某个模型当前参数的指纹 (参数一改，旧的扫描结果自然不再命中)
+    规则3 的行业参数 (SECTOR_TOP_PCT / SECTOR_WEIGHT / SECTOR_MOMENTUM_DAYS) 在 strategy_params 里；
+    industry_version 为行业映射的刷新时间，映射一更新旧结果同样失效
+    """
+    params = dict(strategy_params(), RS_BENCHMARK=Config.RS_BENCHMARK, RS_HORIZONS=list(Config.RS_HORIZONS),
+                  RS_WEIGHTS=list(Config.RS_WEIGHTS), RS_MIN_RANK=Config.RS_MIN_RANK, screen=screen,
+                  industry_version=industry_version, **get_screen(screen).params())
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class ScanCache:
+    """
+    选股结果缓存 (表 scan_cache)，每个模型各一条
+    键 = 交易日 + 模型及其参数的指纹，并校验数据版本号；sync_data 落地新数据时版本号 +1，旧结果即失效
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def _hash(self, screen):
+        return params_hash(screen, self.db.get_meta('stock_industry_updated', ''))
+
+    def get(self, trade_date, screen='breakout'):
+        with self.db.engine.connect() as conn:
+            row = conn.execute(
+                text("SELECT data_version, results FROM scan_cache WHERE trade_date = :d AND params_hash = :h"),
+                {'d': trade_date, 'h': self._hash(screen)},
+            ).fetchone()
+        if row is None or row[0] != self.db.get_data_version():
+            return None
+        return json.loads(row[1])
+
+    def put(self, trade_date, results, data_version, screen='breakout'):
+        """data_version 传扫描开始时读到的版本，避免扫描期间数据已更新却被标成新版本"""
+        row = {
+            'trade_date': trade_date,
+            'params_hash': self._hash(screen),
+            'data_version': data_version,
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'results': json.dumps(results, ensure_ascii=False, default=float),
+        }
+        self.db.save_data(pd.DataFrame([row]), 'scan_cache')
+
+    def invalidate(self):
+        """删除所有不属于当前数据版本的缓存"""
+        with self.db.engine.begin() as conn:
+            conn.execute(text("DELETE FROM scan_cache WHERE data_version != :v"), {'v': self.db.get_data_version()})
@@ -0,0 +1,238 @@
+import pandas as pd
+from config import Config
+
+
+class Screen:
+    """
+    一个选股模型 (在 SCREENS 里登记后即可被 /scan <name> 和每日报告调用)
+        name:       /scan 后面跟的名字
+        title:      报告里显示的中文名
+        fields:     需要的行情字段 (panel_store.FIELDS 的键)
+        param_keys: 影响结果的 Config 参数 (进入扫描缓存的指纹)
+        window():   需要的 (日线天数, 资金流天数)，引擎按所有模型的最大值只读一次
+        evaluate(): 在每只股票右对齐后的共享矩阵上返回最新一天的判断
+                    DataFrame(index=ts_code)，必须含 signal / close / pct_chg 列
+        describe(): 入选股票的理由 (评分统一为全市场 RS 百分位，见 rs.py)
+    """
+    name = ''
+    title = ''
+    fields = ()
+    param_keys = ()
+
+    def window(self):
+        raise NotImplementedError
+
+    def params(self):
+        return {k: getattr(Config, k) for k in self.param_keys}
+
+    def evaluate(self, panels, benchmark_ret):
+        raise NotImplementedError
+
+    def describe(self, row):
+        raise NotImplementedError
+
+
+# 模型登记处: {name: Screen 实例}，按登记顺序排列 (即 /scan all、帮助文本里的顺序)
+# 所有模型都在本文件里登记，主模型 breakout 排第一
+SCREENS = {}
+
+
+def register(screen_cls):
+    """类装饰器: 登记一个模型"""
+    SCREENS[screen_cls.name] = screen_cls()
+    return screen_cls
+
+
+def get_screen(name):
+    return SCREENS.get(name)
+
+
+# ==================== 箱体突破 (主模型) ====================
+
+# 可调的策略参数 (参数扫描 / 回测时可逐个覆盖)
+PARAM_KEYS = ('BOX_DAYS', 'BREAKOUT_THRESHOLD', 'VOL_MA_DAYS', 'VOL_MULTIPLIER', 'FLOW_DAYS', 'SECTOR_TOP_PCT',
+              'SECTOR_WEIGHT', 'SECTOR_MOMENTUM_DAYS')
+
+
+def strategy_params(**overrides):
+    """当前 Config 中的策略参数，可用关键字参数覆盖部分取值"""
+    params = {k: getattr(Config, k) for k in PARAM_KEYS}
+    params.update(overrides)
+    return params
+
+
+def compute_signals(close, high, vol, flow, benchmark_ret, params=None):
+    """
+    在 日期×股票 矩阵上一次性计算四条规则 (每个单元格 = 某股某日是否入选)
+    close/high/vol/flow 需同形状同行序；benchmark_ret 为标量或按行对齐的 Series
+    params 为 strategy_params() 形式的字典，缺省使用 Config
+    返回 dict: signal(最终入选) 以及各中间量，取 .iloc[-1] 即最新一天
+    """
+    p = params or strategy_params()
+    # 过去 N 天 = 不含当天，所以先整体下移一行
+    prev_high = high.shift(1)
+    prev_vol = vol.shift(1)
+
+    # 数据长度检查 (至少 BOX_DAYS 根K线)
+    enough = close.notna().cumsum() >= p['BOX_DAYS']
+
+    # 1. 突破箱体 (收盘价 > 过去55天最高价 * 1.01)
+    box_high = prev_high.rolling(p['BOX_DAYS'], min_periods=1).max()
+    breakout = close > box_high * p['BREAKOUT_THRESHOLD']
+
+    # 2. 放量 (今日量 > 20日均量 * 1.5)
+    vol_ma = prev_vol.rolling(p['VOL_MA_DAYS'], min_periods=1).mean()
+    volume = (vol_ma > 0) & (vol > vol_ma * p['VOL_MULTIPLIER'])
+
+    # 3. RS 相对强弱 (跑赢大盘)
+    past_close = close.shift(p['VOL_MA_DAYS'])
+    stock_ret = (close - past_close) / past_close
+    if isinstance(benchmark_ret, pd.Series):
+        rs = stock_ret.ge(benchmark_ret, axis=0)
+    else:
+        rs = stock_ret >= benchmark_ret
+
+    # 4. 资金流 (最近 N 天净流入 > 0)
+    flow_ok = flow.rolling(p['FLOW_DAYS'], min_periods=p['FLOW_DAYS']).min() > 0
+
+    signal = enough & breakout & volume & rs & flow_ok
+    return {
+        'signal': signal,
+        'box_high': box_high,
+        'vol_ma': vol_ma,
+        'stock_ret': stock_ret,
+        'flow_ok': flow_ok,
+    }
+
+
+def snapshot_signals(snap, benchmark_ret, params=None):
+    """
+    在滚动指标快照 (每只股票一行，见 IndicatorState.snapshot) 上判断四条规则
+    与 compute_signals(...).iloc[-1] 口径相同，但不需要任何历史K线
+    """
+    p = params or strategy_params()
+    stock_ret = (snap['close'] - snap['close_n_ago']) / snap['close_n_ago']
+    signal = (
+        (snap['bars'] >= p['BOX_DAYS'])
+        & (snap['close'] > snap['box_high'] * p['BREAKOUT_THRESHOLD'])
+        & (snap['vol_ma'] > 0) & (snap['vol'] > snap['vol_ma'] * p['VOL_MULTIPLIER'])
+        & (stock_ret >= benchmark_ret)
+        & (snap['flow_streak'] >= p['FLOW_DAYS'])
+    )
+    return pd.DataFrame({
+        'signal': signal,
+        'box_high': snap['box_high'],
+        'vol_ma': snap['vol_ma'],
+        'stock_ret': stock_ret,
+        'flow_ok': snap['flow_streak'] >= p['FLOW_DAYS'],
+        'close': snap['close'],
+        'vol': snap['vol'],
+        'pct_chg': snap['pct_chg'],
+    })
+
+
+@register
+class BreakoutScreen(Screen):
+    """箱体突破 + 放量 + RS + 资金流 (主模型，规则见 compute_signals)"""
+    name = 'breakout'
+    title = '箱体突破'
+    fields = ('close', 'high', 'vol', 'pct_chg', 'net_mf_amount')
+    param_keys = PARAM_KEYS
+
+    def window(self):
+        return Config.BOX_DAYS + 20, Config.FLOW_DAYS + 5
+
+    def evaluate(self, panels, benchmark_ret):
+        sig = compute_signals(panels['close'], panels['high'], panels['vol'], panels['net_mf_amount'], benchmark_ret)
+        latest = pd.DataFrame({k: v.iloc[-1] for k, v in sig.items()})
+        latest['close'] = panels['close'].iloc[-1]
+        latest['vol'] = panels['vol'].iloc[-1]
+        latest['pct_chg'] = panels['pct_chg'].iloc[-1]
+        return latest
+
+    def from_snapshot(self, snap, benchmark_ret):
+        """滚动指标状态最新时直接在每股一行的快照上判断，不读矩阵"""
+        return snapshot_signals(snap, benchmark_ret)
+
+    def describe(self, row):
+        return f"突破{Config.BOX_DAYS}日新高, 量比{round(row['vol']/row['vol_ma'], 1)}"
+
+
+# ==================== 其他模型 ====================
+
+@register
+class PullbackScreen(Screen):
+    """
+    回踩箱体: 最近 PULLBACK_DAYS 根K线内曾突破箱体，今天缩量回落到原箱体上沿附近
+    (收盘价在上沿 ± PULLBACK_TOLERANCE 以内，且成交量低于均量)
+    """
+    name = 'pullback'
+    title = '回踩箱体'
+    fields = ('close', 'high', 'vol', 'pct_chg')
+    param_keys = ('BOX_DAYS', 'BREAKOUT_THRESHOLD', 'VOL_MA_DAYS', 'PULLBACK_DAYS', 'PULLBACK_TOLERANCE')
+
+    def window(self):
+        return Config.BOX_DAYS + Config.PULLBACK_DAYS + 20, 0
+
+    def evaluate(self, panels, benchmark_ret):
+        close, high, vol = panels['close'], panels['high'], panels['vol']
+        box_high = high.shift(1).rolling(Config.BOX_DAYS, min_periods=Config.BOX_DAYS).max()
+        broke = close > box_high * Config.BREAKOUT_THRESHOLD
+        # 最近一次突破时的箱体上沿 (不含今天，最多回看 PULLBACK_DAYS 根K线)
+        support = box_high.where(broke).ffill(limit=Config.PULLBACK_DAYS - 1).shift(1)
+        vol_ma = vol.shift(1).rolling(Config.VOL_MA_DAYS, min_periods=1).mean()
+
+        tol = Config.PULLBACK_TOLERANCE
+        signal = (
+            support.notna()
+            & (close >= support * (1 - tol)) & (close <= support * (1 + tol))
+            & (vol < vol_ma)
+        )
+        return pd.DataFrame({
+            'signal': signal.iloc[-1],
+            'support': support.iloc[-1],
+            'close': close.iloc[-1],
+            'pct_chg': panels['pct_chg'].iloc[-1],
+            'vol': vol.iloc[-1],
+            'vol_ma': vol_ma.iloc[-1],
+        })
+
+    def describe(self, row):
+        gap = row['close'] / row['support'] - 1
+        return f"回踩箱体上沿 {row['support']:.2f} ({gap:+.1%}), 量比{round(row['vol'] / row['vol_ma'], 1)}"
+
+
+@register
+class DryUpScreen(Screen):
+    """
+    缩量企稳: 最近 DRYUP_DAYS 天的均量萎缩到此前 VOL_MA_DAYS 天均量的 DRYUP_RATIO 以下，
+    期间每天涨跌幅都不超过 DRYUP_MAX_MOVE%，且收盘仍站在 VOL_MA_DAYS 日均线上方
+    """
+    name = 'dryup'
+    title = '缩量企稳'
+    fields = ('close', 'vol', 'pct_chg')
+    param_keys = ('VOL_MA_DAYS', 'DRYUP_DAYS', 'DRYUP_RATIO', 'DRYUP_MAX_MOVE')
+
+    def window(self):
+        return Config.VOL_MA_DAYS + Config.DRYUP_DAYS + 20, 0
+
+    def evaluate(self, panels, benchmark_ret):
+        close, vol, pct_chg = panels['close'], panels['vol'], panels['pct_chg']
+        n, base_n = Config.DRYUP_DAYS, Config.VOL_MA_DAYS
+        recent = vol.rolling(n, min_periods=n).mean()
+        base = vol.shift(n).rolling(base_n, min_periods=base_n).mean()
+        ratio = recent / base
+        ma = close.rolling(base_n, min_periods=base_n).mean()
+        calm = pct_chg.abs().rolling(n, min_periods=n).max() <= Config.DRYUP_MAX_MOVE
+
+        signal = (base > 0) & (ratio < Config.DRYUP_RATIO) & calm & (close > ma)
+        return pd.DataFrame({
+            'signal': signal.iloc[-1],
+            'ratio': ratio.iloc[-1],
+            'ma': ma.iloc[-1],
+            'close': close.iloc[-1],
+            'pct_chg': pct_chg.iloc[-1],
+        })
+
+    def describe(self, row):
+        return f"近{Config.DRYUP_DAYS}日量能萎缩至 {row['ratio']:.0%}, 站上{Config.VOL_MA_DAYS}日线"
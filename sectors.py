@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from config import Config
+
+
+def sector_returns(pct_chg, labels, amount=None):
+    """
+    日期×股票 涨跌幅 -> 日期×行业 的当日涨跌幅 (%)
+    labels: ts_code -> 行业；amount: 同形状的成交额矩阵 (按成交额加权)，None 为等权
+    停牌 (涨跌幅为空) 的股票当天不参与
+    """
+    groups = pd.Series(labels).reindex(pct_chg.columns).to_numpy()
+    traded = pct_chg.notna()
+    if amount is None:
+        weight = traded.astype('float64')
+    else:
+        weight = amount.reindex_like(pct_chg).where(traded).fillna(0.0)
+    num = (pct_chg.fillna(0.0) * weight).T.groupby(groups).sum().T
+    den = weight.T.groupby(groups).sum().T
+    return num / den.where(den > 0)
+
+
+def sector_momentum(daily, days):
+    """日期×行业 当日涨跌幅 -> 最近 days 天的复利累计涨幅 (%)，每一行都是截至当天的值"""
+    if days <= 1:
+        return daily
+    # 连乘用对数收益的滚动求和代替 rolling.apply，整块向量化
+    growth = np.exp(np.log1p(daily.fillna(0.0) / 100).rolling(days, min_periods=1).sum())
+    return (growth - 1) * 100
+
+
+def sector_strength(pct_chg, labels, amount=None, days=1):
+    """
+    最新一天的行业强度表，按 momentum 降序
+    列: pct_change (当日涨幅 %), momentum (days 日累计涨幅 %), codes (成分股数)
+    """
+    daily = sector_returns(pct_chg, labels, amount)
+    counts = pd.Series(labels).reindex(pct_chg.columns).value_counts()
+    df = pd.DataFrame({
+        'pct_change': daily.iloc[-1],
+        'momentum': sector_momentum(daily.tail(days), days).iloc[-1],
+    })
+    df['codes'] = counts.reindex(df.index).fillna(0).astype(int)
+    return df.dropna(subset=['momentum']).sort_values('momentum', ascending=False)
+
+
+class IndustryMap:
+    """
+    本地 股票 -> 申万一级行业 映射 (表 stock_industry)
+    行业归属很少变化，每 INDUSTRY_REFRESH_DAYS 天才整体刷新一次 (index_classify + 每个行业一次 index_member)；
+    扫描时的行业过滤只是一次本地关联，不再依赖 sw_daily / index_member 的实时调用
+    """
+
+    def __init__(self, db, pro):
+        self.db = db
+        self.pro = pro
+        self._labels = None
+        self._loaded = None  # 内存里的映射对应的刷新时间
+
+    def is_fresh(self):
+        updated = self.db.get_meta('stock_industry_updated')
+        if not updated:
+            return False
+        age = datetime.now() - datetime.strptime(updated, '%Y-%m-%d %H:%M:%S')
+        return age < timedelta(days=Config.INDUSTRY_REFRESH_DAYS)
+
+    def refresh(self, force=False):
+        """到期 (或 force) 时重新下载映射，返回是否刷新了"""
+        if not force and self.is_fresh():
+            return False
+        print("🏷️ 刷新申万一级行业映射...")
+        sectors = self.pro.index_classify(level='L1', src='SW2021')
+        frames = []
+        for index_code, name in sectors[['index_code', 'industry_name']].itertuples(index=False):
+            members = self.pro.index_member(index_code=index_code)
+            # 接口同时返回历史成分 (is_new='N' / 有 out_date)，只保留当前成分，否则调过行业的股票可能落到旧行业
+            if 'is_new' in members.columns:
+                members = members[members['is_new'] == 'Y']
+            elif 'out_date' in members.columns:
+                members = members[members['out_date'].isna()]
+            frames.append(pd.DataFrame({'ts_code': members['con_code'], 'index_code': index_code, 'industry_name': name}))
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if df.empty:
+            raise RuntimeError("行业成分股为空")
+        self.db.save_data(df, 'stock_industry', if_exists='replace')
+        self.db.set_meta('stock_industry_updated', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        print(f"✅ 行业映射已更新: {df['index_code'].nunique()} 个行业, {len(df)} 只股票")
+        return True
+
+    def table(self):
+        """完整映射表: ts_code, index_code, industry_name"""
+        return self.db.get_data('stock_industry')
+
+    def labels(self, key='industry_name'):
+        """ts_code -> 行业 (缺省为行业名，key='index_code' 取行业代码)；本地还没有映射时为空"""
+        updated = self.db.get_meta('stock_industry_updated')
+        if self._labels is None or self._loaded != updated:
+            self._labels = self.table().set_index('ts_code')
+            self._loaded = updated
+        return self._labels[key] if key in self._labels.columns else pd.Series(dtype=object)
@@ -1,20 +1,168 @@
 import pandas as pd
 import time
+from datetime import datetime, timedelta
 from config import Config
+from panel import align_right
+from metrics import metrics
+from screens import SCREENS, get_screen, strategy_params
+from rs import rs_scores
+
 
 class StrategyAnalyzer:
     def __init__(self, data_manager):
         self.dm = data_manager
 
-    def run_daily_scan(self):
-        print("🚀 [Strategy] 开始执行【完全体】策略...", flush=True)
+    def latest_signals(self, codes, benchmark_ret):
+        """
+        每只股票最新一根K线的规则判断结果 (index=ts_code)
+        滚动指标状态是最新的就只读每股一行的快照；否则读取窗口矩阵现算
+        """
+        return self.evaluate_screens([get_screen('breakout')], codes, benchmark_ret)['breakout']
+
+    def evaluate_screens(self, screens, codes, benchmark_ret):
+        """
+        一次性评估多个模型，返回 {模型名: DataFrame(index=ts_code)}
+        支持快照的模型 (breakout) 在滚动指标状态最新时读快照；
+        其余模型所需字段/窗口取并集，矩阵只读一次、每只股票只右对齐一次
+        """
+        results = {}
+        latest_in_db = self.dm.db.check_latest_date('daily_price')
+        snapshot_screens = [s for s in screens if hasattr(s, 'from_snapshot')]
+        if snapshot_screens and self.dm.indicators.is_current(latest_in_db):
+            snap = self.dm.indicators.snapshot()
+            # 与窗口读取口径一致: 窗口内没有K线的股票不参与
+            days = get_screen('breakout').window()[0]
+            start_date = (datetime.now() - timedelta(days=days*2)).strftime('%Y%m%d')
+            snap = snap[snap['last_date'] >= start_date]
+            snap = snap.reindex(pd.Index(codes).intersection(snap.index))
+            for screen in snapshot_screens:
+                results[screen.name] = screen.from_snapshot(snap, benchmark_ret)
+
+        pending = [s for s in screens if s.name not in results]
+        if pending:
+            # 读取扫描窗口的 日期×股票 矩阵 (优先 mmap 列式库，否则 SQLite 各 1 次查询)
+            days = max(s.window()[0] for s in pending)
+            flow_days = max(s.window()[1] for s in pending)
+            fields = set().union(*(s.fields for s in pending))
+            raw = self.dm.load_panels(days=days, flow_days=flow_days, fields=fields)
+            results.update(self.evaluate_panels(raw, codes, benchmark_ret, pending))
+        return results
+
+    @staticmethod
+    def evaluate_panels(raw, codes, benchmark_ret, screens):
+        """在 load_panels 结构的矩阵上评估多个模型，每个字段只对齐一次、各模型共享"""
+        if raw['close'].empty:
+            return {s.name: pd.DataFrame({'signal': pd.Series(dtype=bool)}) for s in screens}
+        codes = pd.Index(codes).intersection(raw['close'].columns)
+        fields = set().union(*(s.fields for s in screens)) | {'close'}
+        rows = max(len(raw[f]) for f in fields)
+        # 每只股票按自己的K线对齐 (停牌股取其最后一根K线，与逐只计算口径一致)
+        panels = {f: align_right(raw[f].reindex(columns=codes), rows) for f in fields}
+
+        results = {}
+        for screen in screens:
+            latest = screen.evaluate(panels, benchmark_ret).reindex(codes)
+            latest['signal'] = latest['signal'].fillna(False).astype(bool)
+            results[screen.name] = latest
+        return results
+
+    @classmethod
+    def panel_signals(cls, raw, codes, benchmark_ret):
+        """在 load_panels 结构的矩阵上取每只股票最新一根K线的规则判断结果"""
+        return cls.evaluate_panels(raw, codes, benchmark_ret, [get_screen('breakout')])['breakout']
+
+    def diagnose(self, codes):
+        """
+        个股诊断 (/check): 与 run_daily_scan 同一套规则，逐条给出是否满足
+        优先读本地数据；本地未同步到最新交易日、或本地没有的代码才联网补取
+        返回 DataFrame (index=ts_code)，source 列标明数据来自 local / online
+        """
+        p = strategy_params()
+        codes = list(dict.fromkeys(codes))
+        trade_date = self.dm.get_trade_date()
+        benchmark_ret = self.dm.get_benchmark_return(trade_date)
+
+        columns = ['signal', 'close', 'pct_chg', 'vol', 'vol_ma', 'box_high', 'stock_ret', 'flow_ok']
+        frames = []
+        missing = codes
+        if self.dm.db.check_latest_date('daily_price') == trade_date:
+            local = self.latest_signals(codes, benchmark_ret).reindex(columns=columns).dropna(subset=['close'])
+            frames.append(local.assign(source='local'))
+            missing = [c for c in codes if c not in local.index]
+        if missing:
+            raw = self.dm.fetch_panels_online(missing, trade_date, days=p['BOX_DAYS'] + 20,
+                                              flow_days=p['FLOW_DAYS'] + 5)
+            online = self.panel_signals(raw, missing, benchmark_ret).reindex(columns=columns).dropna(subset=['close'])
+            frames.append(online.assign(source='online'))
+
+        frames = [f for f in frames if not f.empty]
+        res = pd.concat(frames) if frames else pd.DataFrame(columns=columns + ['source'])
+        res = res.reindex([c for c in codes if c in res.index])
+        res['breakout'] = res['close'] > res['box_high'] * p['BREAKOUT_THRESHOLD']
+        res['volume'] = (res['vol_ma'] > 0) & (res['vol'] > res['vol_ma'] * p['VOL_MULTIPLIER'])
+        res['rs'] = res['stock_ret'] >= benchmark_ret
+        res['flow_ok'] = res['flow_ok'].fillna(False).astype(bool)
+        res['signal'] = res['signal'].fillna(False).astype(bool)
+        res['benchmark_ret'] = benchmark_ret
+        res['rs_rank'] = self.rs_table(trade_date)['rs_rank'].reindex(res.index)
+        return res
+
+    def rs_table(self, trade_date):
+        """全市场多周期 RS 得分与百分位 (index=ts_code)，本地日线 + 本地基准，一次算完"""
+        days = max(Config.RS_HORIZONS) + 5
+        close = self.dm.load_panels(days=days, flow_days=0, fields={'close'})['close'].loc[:trade_date]
+        if close.empty:
+            return pd.DataFrame({'rs_rank': pd.Series(dtype='float64')})
+        benchmark = self.dm.get_index_close(Config.RS_BENCHMARK, close.index[0], trade_date)
+        return rs_scores(close, benchmark)
+
+    def run_daily_scan(self, progress=None, use_cache=True):
+        """
+        progress: 可选回调 progress(text)，用于把进度推送给后台任务
+        use_cache: 同一交易日、同一套参数、数据未更新时直接返回上次的结果
+        """
+        return self.run_screens(['breakout'], progress, use_cache)['breakout']
+
+    def run_screens(self, names=None, progress=None, use_cache=True):
+        """
+        同时运行多个选股模型 (缺省为全部已登记的模型)，返回 {模型名: 结果列表}
+        股票池 / 基准 / 行情矩阵只准备一次，多个模型的耗时约等于一个
+        """
+        names = list(names or SCREENS)
+        unknown = [n for n in names if n not in SCREENS]
+        if unknown:
+            raise ValueError(f"未知模型: {', '.join(unknown)} (可选: {', '.join(SCREENS)})")
+        with metrics.span('scan'):
+            return self._run_screens([SCREENS[n] for n in names], progress, use_cache)
+
+    def _run_screens(self, screens, progress, use_cache):
+        progress = progress or (lambda text: None)
+        print(f"🚀 [Strategy] 开始执行选股模型: {', '.join(s.title for s in screens)}", flush=True)
         
         trade_date = self.dm.get_trade_date()
         print(f"📅 分析日期: {trade_date}", flush=True)
 
-        # 1. 优先获取主线板块 (实时请求)
+        data_version = self.dm.db.get_data_version()
+        order = [s.name for s in screens]
+        results = {}
+        if use_cache:
+            for screen in screens:
+                cached = self.dm.scan_cache.get(trade_date, screen.name)
+                if cached is not None:
+                    metrics.count('quant_scan_cache_total', result='hit')
+                    print(f"⚡️ 命中扫描缓存 ({screen.title} {trade_date})，共 {len(cached)} 只", flush=True)
+                    results[screen.name] = cached
+        screens = [s for s in screens if s.name not in results]
+        if not screens:
+            return results
+
+        # 1. 优先获取主线板块 (本地行业映射 + 日线计算)
         print("🔍 正在扫描领涨板块...", flush=True)
-        sector_df = self.dm.get_top_sectors(trade_date)
+        progress("扫描领涨板块")
+        if use_cache:
+            metrics.count('quant_scan_cache_total', len(screens), result='miss')
+        with metrics.span('scan.sectors'):
+            sector_df = self.dm.get_top_sectors(trade_date)
         
         target_codes = []
         if not sector_df.empty:
@@ -22,12 +170,9 @@ class StrategyAnalyzer:
             top_sectors = sector_df.head(int(len(sector_df) * Config.SECTOR_TOP_PCT))
             print(f"🔥 锁定主线: {len(top_sectors)} 个板块 ({top_sectors['industry_name'].tolist()[:5]}...)", flush=True)
             
-            # 获取成分股
-            code_set = set()
-            for _, row in top_sectors.iterrows():
-                members = self.dm.get_sector_members(row['index_code'])
-                code_set.update(members)
-            target_codes = list(code_set)
+            # 获取成分股 (本地关联)
+            with metrics.span('scan.members'):
+                target_codes = self.dm.get_sector_members(top_sectors['index_code'])
         
         # 兜底机制：如果板块数据没取到，或者太少，就扫描全市场
         if len(target_codes) < 50:
@@ -35,105 +180,59 @@ class StrategyAnalyzer:
             df_basic = self.dm.get_stock_basics()
             if not df_basic.empty:
                 target_codes = df_basic['ts_code'].tolist()
+        metrics.count('quant_scan_codes_total', len(target_codes))
 
         print(f"🎯 最终待扫描股票: {len(target_codes)} 只", flush=True)
         
         if not target_codes:
             print("❌ 错误: 股票列表为空，请检查 /update", flush=True)
-            return []
+            results.update({s.name: [] for s in screens})
+            return {name: results[name] for name in order}
 
         # 2. 准备基准数据
-        benchmark_ret = self.dm.get_benchmark_return(trade_date)
-        df_basic = self.dm.get_stock_basics()
-        
-        results = []
-        batch_size = 50 # 每次处理 50 只，内存安全
-        
+        with metrics.span('scan.benchmark'):
+            benchmark_ret = self.dm.get_benchmark_return(trade_date)
+        with metrics.span('scan.basics'):
+            df_basic = self.dm.get_stock_basics()
+        names = {}
+        if not df_basic.empty:
+            names = dict(zip(df_basic['ts_code'], df_basic['name']))
+
         print(f"💻 开始计算 (共 {len(target_codes)} 只)...", flush=True)
+        progress(f"计算 {len(target_codes)} 只股票")
 
-        # 3. 分批次循环
-        for i in range(0, len(target_codes), batch_size):
-            batch_codes = target_codes[i : i + batch_size]
-            
-            try:
-                # 从数据库批量读取 (History + MoneyFlow)
-                df_daily = self.dm.get_history_batch(batch_codes, days=Config.BOX_DAYS + 20)
-                df_flow = self.dm.get_moneyflow_batch(batch_codes, days=Config.FLOW_DAYS + 5)
-                
-                if df_daily.empty: continue
-
-                # 分组计算
-                grouped = df_daily.groupby('ts_code')
-                
-                for ts_code, df in grouped:
-                    try:
-                        # 按日期倒序
-                        df = df.sort_values('trade_date', ascending=False).reset_index(drop=True)
-                        
-                        # 数据长度检查
-                        if len(df) < Config.BOX_DAYS: continue
-
-                        curr = df.iloc[0] # 今天
-                        past = df.iloc[1:Config.BOX_DAYS+1] # 过去 N 天
-                        
-                        # === 核心策略逻辑 ===
-                        
-                        # 1. 突破箱体 (收盘价 > 过去55天最高价 * 1.01)
-                        box_high = past['high'].max()
-                        if curr['close'] <= box_high * Config.BREAKOUT_THRESHOLD: 
-                            continue
-
-                        # 2. 放量 (今日量 > 20日均量 * 1.5)
-                        vol_ma20 = past['vol'].head(Config.VOL_MA_DAYS).mean()
-                        if vol_ma20 == 0 or curr['vol'] <= vol_ma20 * Config.VOL_MULTIPLIER:
-                            continue
-                        
-                        # 3. RS 相对强弱 (跑赢大盘)
-                        past_20 = df.iloc[Config.VOL_MA_DAYS]
-                        stock_ret = (curr['close'] - past_20['close']) / past_20['close']
-                        if stock_ret < benchmark_ret:
-                            continue
-
-                        # 4. 资金流 (最近 N 天净流入 > 0)
-                        # 注意：如果数据库没资金流数据，是否放行？这里选择严格模式：必须有数据
-                        if df_flow.empty: continue
-                        
-                        flow = df_flow[df_flow['ts_code'] == ts_code]
-                        if len(flow) < Config.FLOW_DAYS: continue
-                        
-                        # 取最近 N 天
-                        recent_flow = flow.sort_values('trade_date', ascending=False).head(Config.FLOW_DAYS)
-                        if not (recent_flow['net_mf_amount'] > 0).all():
-                            continue
-
-                        # === 选中了！ ===
-                        
-                        # 找名字
-                        name = ts_code
-                        if not df_basic.empty:
-                            row = df_basic[df_basic['ts_code'] == ts_code]
-                            if not row.empty: name = row.iloc[0]['name']
-
-                        print(f"✅ 选中: {name} (突破+放量+资金)", flush=True)
-                        
-                        # 计算评分
-                        score = 80
-                        if curr['pct_chg'] > 5: score += 10 # 大涨加分
-                        
-                        results.append({
-                            'ts_code': ts_code,
-                            'name': name,
-                            'sector': '主线优选',
-                            'price': curr['close'],
-                            'score': score,
-                            'reason': f"突破{Config.BOX_DAYS}日新高, 量比{round(curr['vol']/vol_ma20, 1)}"
-                        })
-
-                    except Exception: continue
-            
-            except Exception as e:
-                print(f"Batch Error: {e}", flush=True)
-                continue
+        # 3. 全部模型共享同一份矩阵，一次性向量化计算
+        with metrics.span('scan.signals'):
+            latest = self.evaluate_screens(screens, target_codes, benchmark_ret)
+        # 4. 全市场 RS 百分位: 入选股票按它排序 (可按 RS_MIN_RANK 过滤)
+        with metrics.span('scan.rs'):
+            rs_rank = self.rs_table(trade_date)['rs_rank']
+
+        for screen in screens:
+            picks = latest[screen.name]
+            picks = picks[picks['signal']].assign(rs_rank=rs_rank.reindex(picks.index[picks['signal']]))
+            if Config.RS_MIN_RANK:
+                picks = picks[picks['rs_rank'] >= Config.RS_MIN_RANK]
+            metrics.count('quant_scan_picks_total', len(picks), screen=screen.name)
+
+            screen_results = []
+            for ts_code, row in picks.iterrows():
+                name = names.get(ts_code, ts_code)
+                print(f"✅ 选中: {name} ({screen.title})", flush=True)
+                # 评分 = 全市场 RS 百分位 (0-100)
+                score = 0 if pd.isna(row['rs_rank']) else int(round(row['rs_rank']))
+                screen_results.append({
+                    'ts_code': ts_code,
+                    'name': name,
+                    'sector': '主线优选',
+                    'screen': screen.name,
+                    'price': row['close'],
+                    'score': score,
+                    'reason': f"{screen.describe(row)}, RS排名 {score}",
+                })
 
-        print(f"🏁 扫描完成，最终选中 {len(results)} 只", flush=True)
-        return sorted(results, key=lambda x: x['score'], reverse=True)
+            print(f"🏁 {screen.title}: 最终选中 {len(screen_results)} 只", flush=True)
+            screen_results = sorted(screen_results, key=lambda x: x['score'], reverse=True)
+            self.dm.scan_cache.put(trade_date, screen_results, data_version, screen.name)
+            results[screen.name] = screen_results
+        return {name: results[name] for name in order}
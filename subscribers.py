@@ -0,0 +1,118 @@
+import pandas as pd
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from config import Config
+
+# 新订阅者的缺省偏好
+DEFAULTS = {
+    'name': '',
+    'sectors': '',        # 逗号分隔的申万一级行业名，空 = 不限
+    'screens': '',        # 逗号分隔的模型名，空 = Config.DAILY_SCREENS
+    'min_score': 0,       # 评分 (RS 百分位) 下限
+    'max_names': 0,       # 每个模型最多推送几只，0 = 不限
+    'delivery_time': '',  # HH:MM，空 = 扫描完成后立即推送
+    'active': 1,
+    'last_sent': '',      # 最近一次推送的交易日，重启后不会重复推送
+}
+
+
+def split_list(value):
+    return [v for v in str(value or '').replace('，', ',').split(',') if v]
+
+
+class SubscriberRegistry:
+    """
+    订阅者登记 (表 subscribers)，每个 chat_id 一行偏好
+    每日任务全市场只扫描一次，再对同一份结果逐个订阅者在内存里过滤，
+    多一个订阅者只多 (入选股票数) 次比较，而不是多一次扫描
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def ensure(self, chat_id, name=''):
+        """登记一个订阅者 (已存在则保持原偏好不变)，返回偏好"""
+        sub = self.get(chat_id)
+        if sub is None:
+            row = dict(DEFAULTS, chat_id=str(chat_id), name=name,
+                       created=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            self.db.save_data(pd.DataFrame([row]), 'subscribers')
+            sub = self.get(chat_id)
+        return sub
+
+    def remove(self, chat_id):
+        with self.db.engine.begin() as conn:
+            return conn.execute(text("DELETE FROM subscribers WHERE chat_id = :c"), {'c': str(chat_id)}).rowcount
+
+    def update(self, chat_id, **prefs):
+        unknown = set(prefs) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"未知偏好: {', '.join(sorted(unknown))}")
+        self.db.save_data(pd.DataFrame([dict(prefs, chat_id=str(chat_id))]), 'subscribers')
+        return self.get(chat_id)
+
+    def get(self, chat_id):
+        with self.db.engine.connect() as conn:
+            df = pd.read_sql(text("SELECT * FROM subscribers WHERE chat_id = :c"), conn, params={'c': str(chat_id)})
+        return None if df.empty else self._prefs(df.iloc[0])
+
+    def list(self, active_only=True):
+        df = self.db.get_data('subscribers')
+        if df.empty:
+            return []
+        subs = [self._prefs(row) for _, row in df.iterrows()]
+        return [s for s in subs if s['active']] if active_only else subs
+
+    @staticmethod
+    def _prefs(row):
+        sub = {k: (DEFAULTS[k] if pd.isna(row.get(k)) else row.get(k)) for k in DEFAULTS}
+        sub['chat_id'] = str(row['chat_id'])
+        sub['min_score'] = int(sub['min_score'])
+        sub['max_names'] = int(sub['max_names'])
+        sub['active'] = int(sub['active'])
+        return sub
+
+    def is_subscriber(self, chat_id):
+        sub = self.get(chat_id)
+        return bool(sub and sub['active'])
+
+    def screens(self):
+        """所有活跃订阅者需要的模型 (并上 DAILY_SCREENS)，每日任务一次跑完"""
+        names = list(Config.DAILY_SCREENS)
+        for sub in self.list():
+            names += [n for n in split_list(sub['screens']) if n not in names]
+        return names
+
+    def schedule(self, run_start):
+        """
+        [(推送时间, 订阅者)]，按时间排序
+        delivery_time 早于本次任务开始时间的视为次日早上 (例如 08:30 盘前推送)
+        """
+        out = []
+        for sub in self.list():
+            due = run_start
+            if sub['delivery_time']:
+                hour, minute = map(int, sub['delivery_time'].split(':'))
+                due = run_start.replace(hour=hour, minute=minute, second=0, microsecond=0)
+                if due < run_start:
+                    due += timedelta(days=1)
+            out.append((due, sub))
+        return sorted(out, key=lambda x: x[0])
+
+    def mark_sent(self, chat_id, trade_date):
+        self.update(chat_id, last_sent=trade_date)
+
+
+def filter_results(results, sub, sectors=None):
+    """
+    把一次扫描的结果 {模型名: [入选股票]} 按订阅者偏好过滤 (纯内存，不碰数据库)
+    sectors: ts_code -> 行业名 的 dict，订阅者设置了行业过滤时用
+    """
+    wanted = set(split_list(sub['sectors']))
+    out = {}
+    for name in split_list(sub['screens']) or Config.DAILY_SCREENS:
+        picks = [p for p in results.get(name, []) if p['score'] >= sub['min_score']]
+        if wanted:
+            picks = [p for p in picks if (sectors or {}).get(p['ts_code']) in wanted]
+        out[name] = picks[:sub['max_names']] if sub['max_names'] else picks
+    return out
@@ -0,0 +1,181 @@
+import os
+import sys
+import time
+import itertools
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+from config import Config
+from screens import strategy_params
+from backtest import Backtester, evaluate, industry_mask, sector_mask_key
+
+# 子进程里挂载的共享行情 (initializer 填充)
+_SHARED = {}
+
+
+class SharedPanels:
+    """
+    把回测用的矩阵放进共享内存，子进程按名字挂载只读视图
+    全部 worker 共用一份数据，不会为每个任务 pickle 一份拷贝
+    masks: {sector_mask_key: 日期×股票 布尔矩阵}，规则3 掩码在父进程按不同的行业参数各算一次
+    """
+
+    def __init__(self, panels, benchmark, industries, masks=None):
+        self.blocks = []
+        self.meta = {
+            'dates': list(panels['close'].index),
+            'codes': list(panels['close'].columns),
+            'industries': None if industries is None else list(industries),
+            'arrays': {},
+            'masks': {},
+        }
+        for field, df in panels.items():
+            self._share(field, df.to_numpy(dtype='float64'))
+        self._share('__benchmark__', benchmark.to_numpy(dtype='float64'))
+        for i, (key, mask) in enumerate((masks or {}).items()):
+            name = f'__mask{i}__'
+            self._share(name, mask.to_numpy(dtype='bool'))
+            self.meta['masks'][name] = key
+
+    def _share(self, name, arr):
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+        self.blocks.append(shm)
+        self.meta['arrays'][name] = (shm.name, arr.shape, arr.dtype.str)
+
+    def close(self):
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+
+
+def _attach(meta):
+    """worker 初始化: 挂载共享内存并包装成 DataFrame (不拷贝)"""
+    dates = pd.Index(meta['dates'], name='trade_date')
+    codes = pd.Index(meta['codes'], name='ts_code')
+    panels, masks = {}, {}
+    for name, (shm_name, shape, dtype) in meta['arrays'].items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        arr.flags.writeable = False
+        _SHARED.setdefault('blocks', []).append(shm)
+        if name == '__benchmark__':
+            _SHARED['benchmark'] = pd.Series(arr, index=dates)
+        elif name in meta['masks']:
+            masks[meta['masks'][name]] = pd.DataFrame(arr, index=dates, columns=codes, copy=False)
+        else:
+            panels[name] = pd.DataFrame(arr, index=dates, columns=codes, copy=False)
+    _SHARED['panels'] = panels
+    _SHARED['masks'] = masks
+    _SHARED['industries'] = None if meta['industries'] is None else pd.Series(meta['industries'], index=codes)
+
+
+def _run_one(task):
+    params, start_date, end_date, hold_days, stop_loss, take_profit = task
+    report, _ = evaluate(_SHARED['panels'], _SHARED['benchmark'], _SHARED['industries'],
+                         start_date, end_date, params, hold_days, stop_loss, take_profit,
+                         sector_mask=_SHARED['masks'].get(sector_mask_key(params)))
+    return {**params, **report}
+
+
+def param_grid(grid):
+    """{参数: [取值...]} -> 每个组合一个完整的参数字典"""
+    keys = list(grid)
+    for values in itertools.product(*(grid[k] for k in keys)):
+        yield strategy_params(**dict(zip(keys, values)))
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            return int(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def available_memory():
+    """容器内还能用的内存 (字节): cgroup v2 / v1 限额减去已用，和 /proc/meminfo 的 MemAvailable 取小；都读不到返回 None"""
+    candidates = []
+    for limit_path, used_path in (('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+                                  ('/sys/fs/cgroup/memory/memory.limit_in_bytes',
+                                   '/sys/fs/cgroup/memory/memory.usage_in_bytes')):
+        limit, used = _read_int(limit_path), _read_int(used_path)
+        if limit is not None and used is not None:
+            candidates.append(limit - used)
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    candidates.append(int(line.split()[1]) * 1024)
+    except OSError:
+        pass
+    return min(candidates) if candidates else None
+
+
+def worker_count(shape, processes=None):
+    """进程数: processes / Config.SWEEP_PROCESSES，再按 可用内存 ÷ 每个 worker 的中间矩阵占用 封顶"""
+    n = processes or Config.SWEEP_PROCESSES
+    avail = available_memory()
+    if avail is not None:
+        per_worker = Config.SWEEP_WORKER_PANELS * shape[0] * shape[1] * 8
+        n = min(n, avail // max(per_worker, 1))
+    return max(1, int(n))
+
+
+def run_sweep(dm, start_date, end_date, grid=None, hold_days=5, stop_loss=None, take_profit=None,
+              processes=None, sort_by='total_return'):
+    """
+    在历史数据上评估参数网格，返回按 sort_by 降序排列的结果表
+    数据只读取一次并放入共享内存，进程池里每个任务只传参数字典
+    """
+    grid = grid or Config.SWEEP_GRID
+    combos = list(param_grid(grid))
+    # 预热期按网格里最长的窗口取，保证每组参数都有足够的历史
+    lookback = max(p['BOX_DAYS'] + p['VOL_MA_DAYS'] for p in combos)
+    panels, benchmark, industries = Backtester(dm).load(start_date, end_date, lookback=lookback)
+
+    print(f"🧪 参数扫描: {len(combos)} 组参数, {panels['close'].shape[0]} 天 × {panels['close'].shape[1]} 只")
+    # 规则3 掩码只随行业参数变化: 每种取值在父进程算一次，放进共享内存给全部组合复用
+    masks = {}
+    if industries is not None:
+        for p in combos:
+            key = sector_mask_key(p)
+            if key not in masks:
+                masks[key] = industry_mask(panels, industries, p)
+        print(f"🏷️ 行业掩码: {len(masks)} 种")
+    shared = SharedPanels(panels, benchmark, industries, masks)
+    shape = panels['close'].shape
+    del panels, masks
+    try:
+        # 共享内存已经分配，剩余可用内存才是留给各 worker 中间矩阵的
+        workers = worker_count(shape, processes)
+        print(f"⚙️ 并行进程: {workers}")
+        tasks = [(p, start_date, end_date, hold_days, stop_loss, take_profit) for p in combos]
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_attach, initargs=(shared.meta,)) as pool:
+            rows = list(pool.map(_run_one, tasks, chunksize=max(1, len(tasks) // 64)))
+    finally:
+        shared.close()
+
+    table = pd.DataFrame(rows)
+    if sort_by in table.columns:
+        table = table.sort_values(sort_by, ascending=False, na_position='last')
+    return table.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    # 用法: python sweep.py 20230101 20241231 [持有天数]
+    from data_manager import DataManager
+
+    start, end = sys.argv[1], sys.argv[2]
+    hold = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    t0 = time.time()
+    table = run_sweep(DataManager(), start, end, hold_days=hold)
+    out = os.path.join('/app/data', f'sweep_{start}_{end}_h{hold}.csv')
+    table.to_csv(out, index=False)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(table.head(20).to_string())
+    print(f"⏱️ 共 {len(table)} 组，耗时 {time.time() - t0:.1f}s，完整结果: {out}")
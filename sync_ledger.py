@@ -0,0 +1,115 @@
+import pandas as pd
+from datetime import datetime
+from sqlalchemy import text
+from config import Config
+
+# 台账覆盖的行情表
+TABLES = ('daily_price', 'money_flow')
+
+
+class SyncLedger:
+    """
+    逐日逐表的同步台账 (表 sync_ledger): 行数 / 状态 / 下载轮数
+    对照本地交易日历找出缺失、失败、行数偏少的交易日，sync_data 只补这些日期
+    (以前只看 MAX(trade_date)，中间某天失败后缺口会一直留着)
+    """
+
+    def __init__(self, db, calendar):
+        self.db = db
+        self.calendar = calendar
+
+    def seed(self):
+        """台账启用前已入库的数据: 按行情表现有行数补记一次"""
+        if self.db.get_meta('sync_ledger_seeded'):
+            return
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        frames = []
+        with self.db.engine.connect() as conn:
+            for table in TABLES:
+                df = pd.read_sql(text(f"SELECT trade_date, COUNT(*) AS row_count FROM {table} GROUP BY trade_date"), conn)
+                df['table_name'] = table
+                frames.append(df)
+        df = pd.concat(frames, ignore_index=True)
+        if not df.empty:
+            print(f"📒 初始化同步台账: {df['trade_date'].nunique()} 个交易日")
+            df = df.assign(status='ok', attempts=1, error=None, updated=now)
+            self.db.save_data(df, 'sync_ledger')
+        self.db.set_meta('sync_ledger_seeded', 1)
+
+    def record(self, trade_date, counts=None, error=None, cur=None):
+        """
+        记一次下载结果 (每记一次 attempts +1)
+        成功: counts={表名: 行数}；失败: error=原因 (保留上次成功时的行数)
+        cur: 传入 bulk_writer 的游标时与当天行情在同一事务里提交
+        """
+        if cur is None:
+            with self.db.bulk_writer(synchronous='NORMAL') as cur:
+                return self.record(trade_date, counts, error, cur)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        status = 'failed' if error is not None else 'ok'
+        error = None if error is None else str(error)[:200]
+        cur.executemany(
+            "INSERT INTO sync_ledger (trade_date, table_name, row_count, status, attempts, error, updated) "
+            "VALUES (?, ?, ?, ?, 1, ?, ?) "
+            "ON CONFLICT(trade_date, table_name) DO UPDATE SET "
+            "row_count = COALESCE(excluded.row_count, row_count), status = excluded.status, "
+            "attempts = attempts + 1, error = excluded.error, updated = excluded.updated",
+            [(trade_date, table, None if counts is None else int(counts.get(table, 0)), status, error, now)
+             for table in TABLES],
+        )
+
+    def check(self, end_date, start_date=None):
+        """
+        [start_date, end_date] 内每个交易日的完整性 (index=trade_date)
+        start_date 缺省为台账里最早的日期；某表行数低于前后 20 个交易日中位数的
+        SYNC_SHORT_RATIO 视为不完整 (short)
+        列: <表名> 行数, attempts, status (ok / missing / failed / short)
+        """
+        self.seed()
+        ledger = self.db.get_data('sync_ledger', end_date=end_date)
+        if start_date is None:
+            if ledger.empty:
+                return pd.DataFrame(columns=list(TABLES) + ['attempts', 'status'])
+            start_date = ledger['trade_date'].min()
+        ledger = ledger[ledger['trade_date'] >= start_date]
+        sessions = pd.Index(self.calendar.sessions_between(start_date, end_date), name='trade_date')
+
+        rows = ledger.pivot(index='trade_date', columns='table_name', values='row_count')
+        rows = rows.reindex(index=sessions, columns=list(TABLES))
+        failed = (ledger[ledger['status'] == 'failed'].groupby('trade_date').size() > 0).reindex(sessions, fill_value=False)
+        attempts = ledger.groupby('trade_date')['attempts'].max().reindex(sessions).fillna(0).astype(int)
+
+        short = pd.Series(False, index=sessions)
+        for table in TABLES:
+            ref = rows[table].rolling(41, center=True, min_periods=1).median()
+            short |= rows[table] < ref * Config.SYNC_SHORT_RATIO
+
+        status = pd.Series('ok', index=sessions)
+        status[short] = 'short'
+        status[rows.isna().any(axis=1)] = 'missing'
+        status[failed] = 'failed'
+        out = rows.copy()
+        out['attempts'] = attempts
+        out['status'] = status
+        return out
+
+    def gaps(self, end_date):
+        """需要补下载的交易日 (升序)；连续补了 SYNC_MAX_ATTEMPTS 轮还不完整的日期不再自动重试"""
+        self.seed()
+        if not end_date:
+            return []
+        df = self.check(end_date)
+        bad = df[(df['status'] != 'ok') & (df['attempts'] < Config.SYNC_MAX_ATTEMPTS)]
+        return bad.index.tolist()
+
+    def summary(self, end_date):
+        """给 /info 用的完整性概况"""
+        df = self.check(end_date)
+        bad = df[df['status'] != 'ok']
+        return {
+            'sessions': len(df),
+            'complete': int((df['status'] == 'ok').sum()),
+            'counts': bad['status'].value_counts().to_dict(),
+            'gave_up': bad.index[bad['attempts'] >= Config.SYNC_MAX_ATTEMPTS].tolist(),
+            'bad_dates': bad.index.tolist(),
+        }
@@ -0,0 +1,83 @@
+import bisect
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+
+class TradeCalendar:
+    """
+    本地交易日历 (表 trade_cal)
+    每个自然年只向 Tushare 请求一次 trade_cal，之后所有查询都在进程内完成，不再走网络
+    """
+
+    def __init__(self, db, pro, exchange='SSE', close_hour=16):
+        self.db = db
+        self.pro = pro
+        self.exchange = exchange
+        self.close_hour = close_hour  # 收盘后数据整理完成的时间
+        self.lock = threading.Lock()
+        self._years = set()
+        self._open_dates = []
+
+    # ============ 同步 ============
+
+    def ensure_year(self, year):
+        """保证某年的日历在本地 (缺失时下载一次整年)"""
+        if year in self._years:
+            return
+        with self.lock:
+            if year in self._years:
+                return
+            with self.db.engine.connect() as conn:
+                count = conn.execute(
+                    text("SELECT COUNT(*) FROM trade_cal WHERE cal_date BETWEEN :s AND :e"),
+                    {'s': f'{year}0101', 'e': f'{year}1231'},
+                ).scalar()
+            if count < 365:
+                print(f"📆 同步 {year} 年交易日历...")
+                df = self.pro.trade_cal(exchange=self.exchange, start_date=f'{year}0101', end_date=f'{year}1231')
+                self.db.save_data(df, 'trade_cal')
+            self._years.add(year)
+            self._reload()
+
+    def _reload(self):
+        with self.db.engine.connect() as conn:
+            rows = conn.execute(text("SELECT cal_date FROM trade_cal WHERE is_open = 1 ORDER BY cal_date")).fetchall()
+        self._open_dates = [r[0] for r in rows]
+
+    def _ensure_range(self, start_date, end_date):
+        for year in range(int(start_date[:4]), int(end_date[:4]) + 1):
+            self.ensure_year(year)
+
+    # ============ 查询 ============
+
+    def is_open(self, date):
+        self._ensure_range(date, date)
+        i = bisect.bisect_left(self._open_dates, date)
+        return i < len(self._open_dates) and self._open_dates[i] == date
+
+    def sessions_between(self, start_date, end_date):
+        """[start_date, end_date] 内的全部交易日 (升序)"""
+        self._ensure_range(start_date, end_date)
+        lo = bisect.bisect_left(self._open_dates, start_date)
+        hi = bisect.bisect_right(self._open_dates, end_date)
+        return self._open_dates[lo:hi]
+
+    def previous_sessions(self, date, n, include=True):
+        """截止 date 的最近 n 个交易日 (升序)；include=False 时不含 date 当天"""
+        start = (datetime.strptime(date, '%Y%m%d') - timedelta(days=n * 2 + 30)).strftime('%Y%m%d')
+        self._ensure_range(start, date)
+        hi = bisect.bisect_right(self._open_dates, date) if include else bisect.bisect_left(self._open_dates, date)
+        return self._open_dates[max(0, hi - n):hi]
+
+    def last_closed_session(self, now=None):
+        """
+        最近一个【已收盘】的交易日
+        如果今天是交易日但还没到 close_hour (收盘后数据整理时间)，视为未完结，回退一天
+        """
+        now = now or datetime.now()
+        today_str = now.strftime('%Y%m%d')
+        sessions = self.previous_sessions(today_str, 2)
+        if sessions[-1] == today_str and now.hour < self.close_hour:
+            return sessions[-2]
+        return sessions[-1]